@@ -0,0 +1,59 @@
+"""
+Compare design.CMST with design.CMSTVectorized on random clusters.
+
+    python benchmarks/benchmark_cmst.py 50 200 1000
+
+The reference CMST is skipped for clusters larger than --reference_limit.
+"""
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from design import CMST, CMSTVectorized, Node  # noqa: E402
+
+
+def make_cluster(household_count, seed=0, spread_in_meters=250):
+    r = random.Random(seed)
+    households = [Node(
+        index + 1,
+        500000 + r.gauss(0, spread_in_meters),
+        9800000 + r.gauss(0, spread_in_meters),
+        1) for index in range(household_count)]
+    x = sum(node.getX() for node in households) / household_count
+    y = sum(node.getY() for node in households) / household_count
+    return households, Node(1, x, y, household_count)
+
+
+def measure(f, households, root, capacity):
+    t = time.time()
+    _, totalLVCost = f(households, capacity, root)
+    return time.time() - t, totalLVCost
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'household_counts', metavar='COUNT', type=int, nargs='*',
+        default=[50, 200, 1000])
+    argument_parser.add_argument('--capacity', type=float, default=1000)
+    argument_parser.add_argument('--reference_limit', type=int, default=200)
+    args = argument_parser.parse_args()
+    print('%10s %14s %14s %14s' % (
+        'households', 'CMST', 'vectorized', 'totalLVCost'))
+    for household_count in args.household_counts:
+        households, root = make_cluster(household_count)
+        vectorized_time, totalLVCost = measure(
+            CMSTVectorized, households, root, args.capacity)
+        if household_count <= args.reference_limit:
+            reference_time, reference_cost = measure(
+                CMST, households, root, args.capacity)
+            assert abs(reference_cost - totalLVCost) < 1e-6
+            reference_text = '%.3fs' % reference_time
+        else:
+            reference_text = 'skipped'
+        print('%10s %14s %14s %14.2f' % (
+            household_count, reference_text, '%.3fs' % vectorized_time,
+            totalLVCost))
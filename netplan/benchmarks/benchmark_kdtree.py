@@ -0,0 +1,69 @@
+"""
+Time building networker.classes.kdtree.KDTree and querying it on random
+points, checking the answers against a brute force search.
+
+    python benchmarks/benchmark_kdtree.py 10000 100000 1000000
+
+query_subset draws a subset of --subset_fraction of the points per query.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+import numpy as np
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from networker.classes.kdtree import KDTree  # noqa: E402
+
+
+def measure(f, *args):
+    t = time.time()
+    result = f(*args)
+    return time.time() - t, result
+
+
+def query_all(kdtree, points):
+    return [kdtree.query(point)[0] for point in points]
+
+
+def query_subset_all(kdtree, points, subsets):
+    return [kdtree.query_subset(point, subset)[0] for point, subset in zip(
+        points, subsets)]
+
+
+def get_square_distances(data, point):
+    return ((data - point) ** 2).sum(axis=1)
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'point_counts', metavar='COUNT', type=int, nargs='*',
+        default=[10000, 100000, 1000000])
+    argument_parser.add_argument('--query_count', type=int, default=1000)
+    argument_parser.add_argument('--subset_fraction', type=float, default=0.1)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+    random_state = np.random.RandomState(args.seed)
+    print('%10s %12s %12s %14s' % (
+        'points', 'build', 'query', 'query_subset'))
+    for point_count in args.point_counts:
+        data = random_state.rand(point_count, 2)
+        points = random_state.rand(args.query_count, 2)
+        subsets = [np.flatnonzero(
+            random_state.rand(point_count) < args.subset_fraction,
+        ) for point in points[:10]] * (args.query_count // 10)
+        build_time, kdtree = measure(KDTree, data)
+        query_time, indices = measure(query_all, kdtree, points)
+        subset_time, subset_indices = measure(
+            query_subset_all, kdtree, points, subsets)
+        for point, index, subset, subset_index in list(zip(
+                points, indices, subsets, subset_indices))[:10]:
+            square_distances = get_square_distances(data, point)
+            assert square_distances[index] == square_distances.min()
+            assert square_distances[subset_index] == square_distances[
+                subset].min()
+        print('%10s %12s %12s %14s' % (
+            point_count, '%.3fs' % build_time, '%.3fs' % query_time,
+            '%.3fs' % subset_time))
@@ -0,0 +1,89 @@
+"""
+Time building a spatial index of random grid segments by inserting them
+into an rtree one at a time with pickled objects (as GeoGraph.get_rtree_index
+did) and by bulk loading networker.classes.segment_index.SegmentIndex, and
+time bounding box queries that look up the hit segments.
+
+    python benchmarks/benchmark_segment_index.py 10000 100000 300000
+
+The insert path is skipped above --insert_limit segments.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+import numpy as np
+from rtree import Rtree
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from networker.classes.segment_index import SegmentIndex  # noqa: E402
+
+
+def measure(f, *args):
+    t = time.time()
+    result = f(*args)
+    return time.time() - t, result
+
+
+def build_by_insert(edges, segments):
+    rtree = Rtree()
+    for edge, segment in zip(edges, segments):
+        box = tuple(segment.min(axis=0)) + tuple(segment.max(axis=0))
+        rtree.insert(hash(edge), box, obj=[edge, tuple(segment)])
+    return rtree
+
+
+def query_by_insert(rtree, boxes):
+    return [sorted(hit.object[0] for hit in rtree.intersection(
+        box, objects=True)) for box in boxes]
+
+
+def query_by_id(segment_index, boxes):
+    edges = segment_index.edges
+    return [sorted(edges[i] for i in segment_index.intersection(
+        box)) for box in boxes]
+
+
+def get_segments(random_state, segment_count):
+    # short segments scattered over a square, like a grid's lines
+    starts = random_state.rand(segment_count, 2) * np.sqrt(segment_count)
+    ends = starts + random_state.normal(scale=0.5, size=(segment_count, 2))
+    return np.stack([starts, ends], axis=1)
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'segment_counts', metavar='COUNT', type=int, nargs='*',
+        default=[10000, 100000, 300000])
+    argument_parser.add_argument('--query_count', type=int, default=1000)
+    argument_parser.add_argument('--insert_limit', type=int, default=300000)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+    random_state = np.random.RandomState(args.seed)
+    print('%10s %14s %14s %14s %14s' % (
+        'segments', 'insert build', 'bulk build', 'insert query',
+        'bulk query'))
+    for segment_count in args.segment_counts:
+        segments = get_segments(random_state, segment_count)
+        edges = [(i, i + segment_count) for i in range(segment_count)]
+        corners = random_state.rand(args.query_count, 2) * np.sqrt(
+            segment_count)
+        boxes = [tuple(corner) + tuple(corner + 2) for corner in corners]
+        bulk_time, segment_index = measure(SegmentIndex, edges, segments)
+        bulk_query_time, bulk_hits = measure(
+            query_by_id, segment_index, boxes)
+        insert_time = insert_query_time = None
+        if segment_count <= args.insert_limit:
+            insert_time, rtree = measure(build_by_insert, edges, segments)
+            insert_query_time, insert_hits = measure(
+                query_by_insert, rtree, boxes)
+            assert insert_hits == bulk_hits
+
+        def format_time(x):
+            return '-' if x is None else '%.3fs' % x
+
+        print('%10s %14s %14s %14s %14s' % (
+            segment_count, format_time(insert_time), format_time(bulk_time),
+            format_time(insert_query_time), format_time(bulk_query_time)))
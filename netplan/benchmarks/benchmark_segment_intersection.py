@@ -0,0 +1,100 @@
+"""
+Time finding the grid segments that candidate edges intersect (without
+sharing an endpoint), as line_subgraph_intersection does for each edge
+tested by mod_boruvka, by testing the segments of each bounding box hit one
+at a time with segments_intersect (as line_subgraph_intersection did), with
+the vectorized kernel per edge and with the kernel for all candidate edges
+of a round at once.
+
+    python benchmarks/benchmark_segment_intersection.py 1000 10000 100000
+
+The scalar path is skipped above --scalar_limit candidate edges.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+import numpy as np
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from networker.classes.segment_index import SegmentIndex  # noqa: E402
+from networker.geomath import make_bounding_box, \
+                              segments_intersect, \
+                              segments_share_endpoint, \
+                              line_segment_intersections, \
+                              line_segment_intersections_batch  # noqa: E402
+
+
+def measure(f, *args):
+    t = time.time()
+    result = f(*args)
+    return time.time() - t, result
+
+
+def intersect_by_scalar(segment_index, p1s, p2s):
+    hits = []
+    for p1, p2 in zip(p1s, p2s):
+        ids = []
+        for i in segment_index.intersection(make_bounding_box(p1, p2)):
+            p3, p4 = segment_index.segments[i]
+            if segments_intersect(p1, p2, p3, p4) and \
+               not segments_share_endpoint(p1, p2, p3, p4):
+                ids.append(i)
+        hits.append(sorted(ids))
+    return hits
+
+
+def intersect_by_edge(segment_index, p1s, p2s):
+    return [sorted(line_segment_intersections(segment_index, p1, p2).tolist())
+            for p1, p2 in zip(p1s, p2s)]
+
+
+def intersect_by_batch(segment_index, p1s, p2s):
+    return [sorted(ids.tolist()) for ids in
+            line_segment_intersections_batch(segment_index, p1s, p2s)]
+
+
+def get_segments(random_state, segment_count, size, scale):
+    # short segments scattered over a square, like a grid's lines
+    starts = random_state.rand(segment_count, 2) * size
+    ends = starts + random_state.normal(scale=scale, size=(segment_count, 2))
+    return np.stack([starts, ends], axis=1)
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'edge_counts', metavar='COUNT', type=int, nargs='*',
+        default=[1000, 10000, 100000])
+    argument_parser.add_argument('--segment_count', type=int, default=100000)
+    argument_parser.add_argument('--scalar_limit', type=int, default=10000)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+    np.seterr(divide='ignore', invalid='ignore')
+    random_state = np.random.RandomState(args.seed)
+    size = np.sqrt(args.segment_count)
+    segments = get_segments(random_state, args.segment_count, size, 0.5)
+    segment_index = SegmentIndex(range(args.segment_count), segments)
+    print('%10s %14s %14s %14s' % ('edges', 'scalar', 'per edge', 'batch'))
+    for edge_count in args.edge_counts:
+        # candidate edges are longer than the grid segments they cross
+        edges = get_segments(random_state, edge_count, size, 2)
+        p1s, p2s = edges[:, 0], edges[:, 1]
+        edge_time, edge_hits = measure(
+            intersect_by_edge, segment_index, p1s, p2s)
+        batch_time, batch_hits = measure(
+            intersect_by_batch, segment_index, p1s, p2s)
+        assert edge_hits == batch_hits
+        scalar_time = None
+        if edge_count <= args.scalar_limit:
+            scalar_time, scalar_hits = measure(
+                intersect_by_scalar, segment_index, p1s, p2s)
+            assert scalar_hits == batch_hits
+
+        def format_time(x):
+            return '-' if x is None else '%.3fs' % x
+
+        print('%10s %14s %14s %14s' % (
+            edge_count, format_time(scalar_time), format_time(edge_time),
+            format_time(batch_time)))
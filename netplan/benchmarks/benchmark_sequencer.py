@@ -0,0 +1,93 @@
+"""
+Time choosing the far-sighted sequence of synthetic trees by scanning the
+whole frontier for the max metric on every step (as Sequencer._sequence
+did) and with the heap frontier of far_sighted_order, checking that both
+give the same sequence.
+
+    python benchmarks/benchmark_sequencer.py 10000 100000 1000000
+
+Trees are mostly long radial feeders (each node hangs off the previous one
+with probability --feeder_fraction) with branches off random earlier
+nodes.  Metrics are drawn from a few values so that ties are common.  The
+scan is skipped above --scan_limit nodes.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+from os.path import abspath, dirname
+
+import numpy as np
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from sequencer.Sequencer import far_sighted_order  # noqa: E402
+
+
+def measure(f, *args):
+    t = time.time()
+    result = f(*args)
+    return time.time() - t, result
+
+
+def sequence_by_scan(roots, successors, metrics):
+    frontier = OrderedDict((root, None) for root in roots)
+    sequence = []
+    while frontier:
+        max_, choice = 0, None
+        for node in frontier:
+            if metrics[node] > max_:
+                max_, choice = metrics[node], node
+        del frontier[choice]
+        frontier.update((node, None) for node in successors[choice])
+        sequence.append(choice)
+    return sequence
+
+
+def sequence_by_heap(roots, successors, metrics):
+    return list(far_sighted_order(
+        roots, successors.__getitem__, metrics.__getitem__))
+
+
+def get_tree(random_state, node_count, root_count, feeder_fraction):
+    parents = np.arange(-1, node_count - 1)
+    branches = random_state.rand(node_count) >= feeder_fraction
+    parents[branches] = (random_state.rand(node_count) * np.arange(
+        node_count)).astype(int)[branches]
+    parents[:root_count] = -1
+    successors = [[] for node in range(node_count)]
+    for node, parent in enumerate(parents.tolist()):
+        if parent >= 0:
+            successors[parent].append(node)
+    return list(range(root_count)), successors
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'node_counts', metavar='COUNT', type=int, nargs='*',
+        default=[10000, 100000, 1000000])
+    argument_parser.add_argument('--root_count', type=int, default=10)
+    argument_parser.add_argument('--feeder_fraction', type=float, default=0.9)
+    argument_parser.add_argument('--scan_limit', type=int, default=100000)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+    random_state = np.random.RandomState(args.seed)
+    print('%10s %12s %12s' % ('nodes', 'scan', 'heap'))
+    for node_count in args.node_counts:
+        roots, successors = get_tree(
+            random_state, node_count, args.root_count, args.feeder_fraction)
+        metrics = (random_state.randint(1, 20, node_count) / 4.).tolist()
+        heap_time, heap_sequence = measure(
+            sequence_by_heap, roots, successors, metrics)
+        assert sorted(heap_sequence) == list(range(node_count))
+        scan_time = None
+        if node_count <= args.scan_limit:
+            scan_time, scan_sequence = measure(
+                sequence_by_scan, roots, successors, metrics)
+            assert scan_sequence == heap_sequence
+
+        def format_time(x):
+            return '-' if x is None else '%.3fs' % x
+
+        print('%10s %12s %12s' % (
+            node_count, format_time(scan_time), format_time(heap_time)))
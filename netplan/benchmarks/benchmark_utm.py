@@ -0,0 +1,75 @@
+"""
+Compare per-point design.to_latlon and design.from_latlon with the array
+variants on random points.
+
+    python benchmarks/benchmark_utm.py 1000 100000 1000000
+
+The per-point loop is skipped for more than --reference_limit points.
+"""
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+import numpy as np
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from design import (  # noqa: E402
+    from_latlon, from_latlon_array, to_latlon, to_latlon_array)
+
+
+def make_points(point_count, seed=0):
+    r = random.Random(seed)
+    latitudes = [r.uniform(0.5, 3.5) for index in range(point_count)]
+    longitudes = [r.uniform(30, 35) for index in range(point_count)]
+    return latitudes, longitudes
+
+
+def measure(f, *args):
+    t = time.time()
+    result = f(*args)
+    return time.time() - t, result
+
+
+def convert_by_point(latitudes, longitudes):
+    packs = [from_latlon(
+        latitude, longitude, 36, 'N',
+    ) for latitude, longitude in zip(latitudes, longitudes)]
+    return [to_latlon(easting, northing, 36, 'N', strict=False) for (
+        easting, northing, _, _) in packs]
+
+
+def convert_by_array(latitudes, longitudes, chunk_size):
+    eastings, northings, zone_number, zone_letter = from_latlon_array(
+        latitudes, longitudes, 36, 'N', chunk_size=chunk_size)
+    return to_latlon_array(
+        eastings, northings, zone_number, zone_letter, strict=False,
+        chunk_size=chunk_size)
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument(
+        'point_counts', metavar='COUNT', type=int, nargs='*',
+        default=[1000, 100000, 1000000])
+    argument_parser.add_argument('--chunk_size', type=int, default=100000)
+    argument_parser.add_argument('--reference_limit', type=int, default=100000)
+    args = argument_parser.parse_args()
+    print('%10s %14s %14s' % ('points', 'per point', 'array'))
+    for point_count in args.point_counts:
+        latitudes, longitudes = make_points(point_count)
+        array_time, (array_latitudes, array_longitudes) = measure(
+            convert_by_array, latitudes, longitudes, args.chunk_size)
+        if point_count <= args.reference_limit:
+            reference_time, reference_pairs = measure(
+                convert_by_point, latitudes, longitudes)
+            assert np.allclose(array_latitudes, [
+                pair[0] for pair in reference_pairs], rtol=0, atol=1e-9)
+            assert np.allclose(array_longitudes, [
+                pair[1] for pair in reference_pairs], rtol=0, atol=1e-9)
+            reference_text = '%.3fs' % reference_time
+        else:
+            reference_text = 'skipped'
+        print('%10s %14s %14s' % (
+            point_count, reference_text, '%.3fs' % array_time))
@@ -17,14 +17,16 @@ import collections
 import multiprocessing
 import pathlib
 import heapq
+import itertools
 import math
 import gzip
+import numpy as np
 use_numpy = False
 
 class OutOfRangeError(ValueError):
     pass
 
-__all__ = ['to_latlon', 'from_latlon']
+__all__ = ['to_latlon', 'from_latlon', 'to_latlon_array', 'from_latlon_array']
 
 K0 = 0.9996
 
@@ -146,32 +148,36 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, s
         zone_letter = zone_letter.upper()
         northern = (zone_letter >= 'N')
 
+    return _to_latlon(easting, northing, zone_number, northern, math)
+
+
+def _to_latlon(easting, northing, zone_number, northern, mathlib):
     x = easting - 500000
     y = northing
 
     if not northern:
-        y -= 10000000
+        y = y - 10000000
 
     m = y / K0
     mu = m / (R * M1)
 
     p_rad = (mu +
-             P2 * math.sin(2 * mu) +
-             P3 * math.sin(4 * mu) +
-             P4 * math.sin(6 * mu) +
-             P5 * math.sin(8 * mu))
+             P2 * mathlib.sin(2 * mu) +
+             P3 * mathlib.sin(4 * mu) +
+             P4 * mathlib.sin(6 * mu) +
+             P5 * mathlib.sin(8 * mu))
 
-    p_sin = math.sin(p_rad)
+    p_sin = mathlib.sin(p_rad)
     p_sin2 = p_sin * p_sin
 
-    p_cos = math.cos(p_rad)
+    p_cos = mathlib.cos(p_rad)
 
     p_tan = p_sin / p_cos
     p_tan2 = p_tan * p_tan
     p_tan4 = p_tan2 * p_tan2
 
     ep_sin = 1 - E * p_sin2
-    ep_sin_sqrt = math.sqrt(1 - E * p_sin2)
+    ep_sin_sqrt = mathlib.sqrt(1 - E * p_sin2)
 
     n = R / ep_sin_sqrt
     r = (1 - E) / ep_sin
@@ -197,8 +203,8 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, s
 
     longitude = mod_angle(longitude + math.radians(zone_number_to_central_longitude(zone_number)))
 
-    return (math.degrees(latitude),
-            math.degrees(longitude))
+    return (mathlib.degrees(latitude),
+            mathlib.degrees(longitude))
 
 
 def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=None):
@@ -247,14 +253,6 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     if force_zone_number is not None:
         check_valid_zone(force_zone_number, force_zone_letter)
 
-    lat_rad = math.radians(latitude)
-    lat_sin = math.sin(lat_rad)
-    lat_cos = math.cos(lat_rad)
-
-    lat_tan = lat_sin / lat_cos
-    lat_tan2 = lat_tan * lat_tan
-    lat_tan4 = lat_tan2 * lat_tan2
-
     if force_zone_number is None:
         zone_number = latlon_to_zone_number(latitude, longitude)
     else:
@@ -265,11 +263,30 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     else:
         zone_letter = force_zone_letter
 
-    lon_rad = math.radians(longitude)
+    easting, northing = _from_latlon(latitude, longitude, zone_number, math)
+
+    if mixed_signs(latitude):
+        raise ValueError("latitudes must all have the same sign")
+    elif negative(latitude):
+        northing += 10000000
+
+    return easting, northing, zone_number, zone_letter
+
+
+def _from_latlon(latitude, longitude, zone_number, mathlib):
+    lat_rad = mathlib.radians(latitude)
+    lat_sin = mathlib.sin(lat_rad)
+    lat_cos = mathlib.cos(lat_rad)
+
+    lat_tan = lat_sin / lat_cos
+    lat_tan2 = lat_tan * lat_tan
+    lat_tan4 = lat_tan2 * lat_tan2
+
+    lon_rad = mathlib.radians(longitude)
     central_lon = zone_number_to_central_longitude(zone_number)
     central_lon_rad = math.radians(central_lon)
 
-    n = R / math.sqrt(1 - E * lat_sin**2)
+    n = R / mathlib.sqrt(1 - E * lat_sin**2)
     c = E_P2 * lat_cos**2
 
     a = lat_cos * mod_angle(lon_rad - central_lon_rad)
@@ -280,9 +297,9 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     a6 = a5 * a
 
     m = R * (M1 * lat_rad -
-             M2 * math.sin(2 * lat_rad) +
-             M3 * math.sin(4 * lat_rad) -
-             M4 * math.sin(6 * lat_rad))
+             M2 * mathlib.sin(2 * lat_rad) +
+             M3 * mathlib.sin(4 * lat_rad) -
+             M4 * mathlib.sin(6 * lat_rad))
 
     easting = K0 * n * (a +
                         a3 / 6 * (1 - lat_tan2 + c) +
@@ -291,13 +308,84 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     northing = K0 * (m + n * lat_tan * (a2 / 2 +
                                         a4 / 24 * (5 - lat_tan2 + 9 * c + 4 * c**2) +
                                         a6 / 720 * (61 - 58 * lat_tan2 + lat_tan4 + 600 * c - 330 * E_P2)))
+    return easting, northing
 
-    if mixed_signs(latitude):
-        raise ValueError("latitudes must all have the same sign")
-    elif negative(latitude):
-        northing += 10000000
 
-    return easting, northing, zone_number, zone_letter
+def to_latlon_array(eastings, northings, zone_number, zone_letter=None, northern=None, strict=True,
+                    chunk_size=100000):
+    """Converts arrays of UTM coordinates in one zone to arrays of latitude
+    and longitude, chunk_size points at a time.  See to_latlon.
+    """
+    if not zone_letter and northern is None:
+        raise ValueError('either zone_letter or northern needs to be set')
+
+    elif zone_letter and northern is not None:
+        raise ValueError('set either zone_letter or northern, but not both')
+
+    eastings = np.asarray(eastings, dtype=np.float64)
+    northings = np.asarray(northings, dtype=np.float64)
+    if strict and len(eastings):
+        if eastings.min() < 100000 or eastings.max() >= 1000000:
+            raise OutOfRangeError('easting out of range (must be between 100,000 m and 999,999 m)')
+        if northings.min() < 0 or northings.max() > 10000000:
+            raise OutOfRangeError('northing out of range (must be between 0 m and 10,000,000 m)')
+
+    check_valid_zone(zone_number, zone_letter)
+
+    if zone_letter:
+        zone_letter = zone_letter.upper()
+        northern = (zone_letter >= 'N')
+
+    latitudes = np.empty(eastings.shape)
+    longitudes = np.empty(eastings.shape)
+    for start in range(0, len(eastings), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        latitudes[chunk], longitudes[chunk] = _to_latlon(
+            eastings[chunk], northings[chunk], zone_number, northern, np)
+    return latitudes, longitudes
+
+
+def from_latlon_array(latitudes, longitudes, force_zone_number=None, force_zone_letter=None,
+                      chunk_size=100000):
+    """Converts arrays of latitude and longitude to UTM coordinates in one
+    zone, chunk_size points at a time.  Unless forced, the zone is the zone
+    of the middle of the extent of the points and the hemisphere is that of
+    the middle latitude, so points across the equator stay continuous
+    (convert them back with to_latlon_array(..., strict=False)).  Returns eastings, northings, zone_number and zone_letter.  See
+    from_latlon.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if len(latitudes):
+        if latitudes.min() < -80 or latitudes.max() > 84:
+            raise OutOfRangeError('latitude out of range (must be between 80 deg S and 84 deg N)')
+        if longitudes.min() < -180 or longitudes.max() > 180:
+            raise OutOfRangeError('longitude out of range (must be between 180 deg W and 180 deg E)')
+    if force_zone_number is not None:
+        check_valid_zone(force_zone_number, force_zone_letter)
+
+    zone_number, zone_letter = choose_utm_zone(latitudes, longitudes)
+    if force_zone_number is not None:
+        zone_number = force_zone_number
+    if force_zone_letter is not None:
+        zone_letter = force_zone_letter
+
+    eastings = np.empty(latitudes.shape)
+    northings = np.empty(latitudes.shape)
+    for start in range(0, len(latitudes), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        eastings[chunk], northings[chunk] = _from_latlon(
+            latitudes[chunk], longitudes[chunk], zone_number, np)
+    if zone_letter < 'N':
+        northings += 10000000
+    return eastings, northings, zone_number, zone_letter
+
+
+def choose_utm_zone(latitudes, longitudes):
+    'Returns the UTM zone number and letter of the middle of the extent'
+    latitude = (np.min(latitudes) + np.max(latitudes)) / 2.
+    longitude = (np.min(longitudes) + np.max(longitudes)) / 2.
+    return latlon_to_zone_number(latitude, longitude), latitude_to_zone_letter(latitude)
 
 
 def latitude_to_zone_letter(latitude):
@@ -439,6 +527,8 @@ class Network():
 
 class Seg:
     'A class representing undirected segs.'
+    __slots__ = ('_ID', '_node1', '_node2', '_weight')
+
     def __init__(self, ID=None, node1=None, node2=None, weight=None):
         self._ID = ID
         self._node1 = node1
@@ -485,6 +575,8 @@ class Seg:
     
 class Node:
     'Defines a node class, with ID, x, y, weight and demand attributes'
+    __slots__ = ('_id', '_x', '_y', '_weight')
+
     def __init__(self, value1=None, value2=None, value3=None, value4=None):
         self._id = value1
         self._x = value2
@@ -536,6 +628,8 @@ class Node:
 
 
 class T:
+    __slots__ = ('_removedSegmentNode', '_addedSegmentNode1', '_addedSegmentNode2', '_value')
+
     def __init__(self,value1=None,value2=None,value3=None,value4=None):
         self._removedSegmentNode= value1
         self._addedSegmentNode1=value2
@@ -556,6 +650,91 @@ class T:
     def getValue(self):
         return self._value
 
+
+class NodeArrays:
+    """
+    Structure of arrays for many nodes: IDs, coordinates, weights and
+    cluster IDs each live in one NumPy array, so that the engine can measure
+    distances for whole clusters at once.  Node objects remain the views
+    that the rest of the module passes around.
+    """
+    __slots__ = ('ids', 'xs', 'ys', 'weights', 'clusterIDs')
+
+    def __init__(self, ids, xs, ys, weights, clusterIDs=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        if clusterIDs is None:
+            clusterIDs = self.ids
+        self.clusterIDs = np.array(clusterIDs, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def fromNodes(cls, nodes, clusterByNode=None):
+        nodes = list(nodes)
+        return cls(
+            [node.getID() for node in nodes],
+            [node.getX() for node in nodes],
+            [node.getY() for node in nodes],
+            [node.getWeight() for node in nodes],
+            [clusterByNode[node] for node in nodes] if clusterByNode else None)
+
+    def getNode(self, index):
+        return Node(int(self.ids[index]), float(self.xs[index]), float(self.ys[index]),
+                    self.weights[index].item())
+
+    def getDistances(self, x, y, indices=None):
+        'Returns distances from (x, y) to the nodes at indices'
+        if indices is None:
+            return np.hypot(self.xs - x, self.ys - y)
+        return np.hypot(self.xs[indices] - x, self.ys[indices] - y)
+
+
+class SegArrays:
+    'Segments as pairs of node indices into a NodeArrays with their weights'
+    __slots__ = ('indices1', 'indices2', 'weights')
+
+    def __init__(self, indices1, indices2, weights):
+        self.indices1 = np.asarray(indices1, dtype=np.int64)
+        self.indices2 = np.asarray(indices2, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=float)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def getSegs(self, nodes, firstSegID=0):
+        'Returns Seg views whose endpoints are taken from the list of nodes'
+        return [Seg(segID, nodes[index1], nodes[index2], weight) for segID, (
+            index1, index2, weight,
+        ) in enumerate(zip(
+            self.indices1.tolist(), self.indices2.tolist(), self.weights.tolist(),
+        ), firstSegID)]
+
+
+def generateSegmentArrays(nodeArrays, searchRadius, chunkSize=1000):
+    """
+    Returns the segments between every pair of nodes that are closer than
+    searchRadius in the order of generateSegments, whose weights can differ
+    from these in the last bit.  Pairs are measured a chunk of start nodes
+    at a time to bound memory.
+    """
+    count = len(nodeArrays)
+    xs, ys = nodeArrays.xs, nodeArrays.ys
+    packs = []
+    for start in range(0, count, chunkSize):
+        startIndices = np.arange(start, min(start + chunkSize, count))
+        distances = np.hypot(xs[startIndices, np.newaxis] - xs, ys[startIndices, np.newaxis] - ys)
+        isKept = (startIndices[:, np.newaxis] < np.arange(count)) & (distances < searchRadius)
+        indices1, indices2 = np.nonzero(isKept)
+        packs.append((startIndices[indices1], indices2, distances[indices1, indices2]))
+    if not packs:
+        return SegArrays([], [], [])
+    return SegArrays(*[np.concatenate(arrays) for arrays in zip(*packs)])
+
+
 def buildAssocDict(segments):
     'Builds dictionary with nodeID key where values are segs from/to that node'
     segList = {}
@@ -731,6 +910,148 @@ def CMST(households,capacity,root):
     return treeSegments, totalLVCost
 
 
+def CMSTVectorized(households, capacity, root):
+    """
+    Esau-Williams capacitated minimum spanning tree that returns the same
+    (treeSegments, totalLVCost) as CMST.
+
+    Node coordinates live in arrays and the distance matrix is computed once.
+    The tradeoff of connecting node i to node j instead of connecting the
+    branch of node i to the root is kept in a matrix, together with the tree
+    distance between nodes on the same branch.  After each exchange only the
+    rows of the two merged branches and the columns of the moved branch are
+    recomputed.  Memory grows with the square of the number of households.
+    """
+    count = len(households)
+    newRootID = root.getID() * (-1) - 100  #### not to be confused with the same nodeID
+    nodeArrays = NodeArrays.fromNodes(households)
+    xs, ys = nodeArrays.xs, nodeArrays.ys
+    distances = ((xs[:, np.newaxis] - xs) ** 2 + (ys[:, np.newaxis] - ys) ** 2) ** .5
+    rootLengths = ((xs - root.getX()) ** 2 + (ys - root.getY()) ** 2) ** .5
+    weights = rootLengths.copy()  # distance from root along the tree
+    treeDistances = np.zeros((count, count))  # valid within a branch
+    maxTreeDistances = np.zeros(count)  # furthest node on the same branch
+    branches = np.arange(count)  # index of the node that connects to the root
+    indicesByBranch = {index: [index] for index in range(count)}
+
+    # Connect households directly to the root first
+    SegID = 10000000
+    segPacks = {}
+    for index in range(count):
+        segPacks[(index, None)] = (SegID, rootLengths[index])
+        SegID += 1
+
+    def getTradeoffs(rowIndices, columnIndices):
+        rowBranches = branches[rowIndices][:, np.newaxis]
+        d = distances[np.ix_(rowIndices, columnIndices)]
+        isFeasible = (weights[columnIndices] + d) + maxTreeDistances[rowIndices][:, np.newaxis] <= capacity
+        isFeasible &= rowBranches != branches[columnIndices]
+        return np.where(isFeasible, rootLengths[rowBranches] - d, -np.inf)
+
+    def getLastMaxima(values):
+        # CMST keeps the last exchange among equal tradeoffs
+        lastColumns = values.shape[1] - 1 - np.argmax(values[:, ::-1], axis=1)
+        return values[np.arange(len(values)), lastColumns], lastColumns
+
+    allIndices = np.arange(count)
+    tradeoffs = getTradeoffs(allIndices, allIndices)
+    bestTradeoffs, bestColumns = getLastMaxima(tradeoffs) if count else ([], [])
+    while count:
+        index1 = int(count - 1 - np.argmax(bestTradeoffs[::-1]))
+        if not bestTradeoffs[index1] > 0:
+            break
+        index2 = int(bestColumns[index1])
+        SegID += 1
+        branch1, branch2 = branches[index1], branches[index2]
+        indices1, indices2 = indicesByBranch.pop(branch1), indicesByBranch[branch2]
+        distance = distances[index1, index2]
+        del segPacks[(branch1, None)]
+
+        # Update distances from the root for the moved branch
+        if index1 == branch1:
+            tempWeight = weights[index1]
+            weights[indices1] = weights[indices1] - tempWeight + weights[index2] + distance
+        else:
+            weights[indices1] = weights[index2] + distance + treeDistances[index1, indices1]
+        # Update distances between nodes on the merged branch
+        crossDistances = (treeDistances[indices1, index1][:, np.newaxis] + distance +
+                          treeDistances[index2, indices2])
+        treeDistances[np.ix_(indices1, indices2)] = crossDistances
+        treeDistances[np.ix_(indices2, indices1)] = crossDistances.T
+        maxTreeDistances[indices1] = np.maximum(maxTreeDistances[indices1], crossDistances.max(axis=1))
+        maxTreeDistances[indices2] = np.maximum(maxTreeDistances[indices2], crossDistances.max(axis=0))
+
+        segPacks[(index1, index2)] = (SegID, distance)
+        branches[indices1] = branch2
+        indices2.extend(indices1)
+
+        # Recompute the rows of the merged branch
+        rowIndices = np.array(indices2)
+        tradeoffs[rowIndices] = getTradeoffs(rowIndices, allIndices)
+        bestTradeoffs[rowIndices], bestColumns[rowIndices] = getLastMaxima(tradeoffs[rowIndices])
+        # Recompute the columns of the moved branch for the other rows
+        isOther = np.ones(count, dtype=bool)
+        isOther[rowIndices] = False
+        otherIndices = allIndices[isOther]
+        columnIndices = np.array(sorted(indices1))
+        if len(otherIndices):
+            tradeoffs[np.ix_(otherIndices, columnIndices)] = getTradeoffs(otherIndices, columnIndices)
+            isStale = np.isin(bestColumns[otherIndices], columnIndices)
+            staleIndices = otherIndices[isStale]
+            bestTradeoffs[staleIndices], bestColumns[staleIndices] = getLastMaxima(tradeoffs[staleIndices])
+            freshIndices = otherIndices[~isStale]
+            columnTradeoffs, columnPositions = getLastMaxima(tradeoffs[np.ix_(freshIndices, columnIndices)])
+            columns = columnIndices[columnPositions]
+            isBetter = (columnTradeoffs > bestTradeoffs[freshIndices]) | (
+                (columnTradeoffs == bestTradeoffs[freshIndices]) & (columns > bestColumns[freshIndices]))
+            bestTradeoffs[freshIndices[isBetter]] = columnTradeoffs[isBetter]
+            bestColumns[freshIndices[isBetter]] = columns[isBetter]
+
+    # Build segments that match those of CMST
+    households_Copy = [Node(node.getID(), node.getX(), node.getY(), weights[index])
+                       for index, node in enumerate(households)]
+    root_Copy = Node(newRootID, root.getX(), root.getY(), root.getWeight())
+    treeSegments = {}
+    totalLVCost = 0
+    for (index1, index2), (segID, length) in segPacks.items():
+        node1 = households_Copy[index1]
+        if index2 is None:
+            node2 = root_Copy
+        else:
+            node2 = households_Copy[index2]
+        treeSegments[(node1.getID(), node2.getID())] = Seg(segID, node1, node2, float(length))
+        totalLVCost = totalLVCost + float(length)
+    return treeSegments, totalLVCost
+
+
+class CMSTCache:
+    """
+    Keeps the CMST of recently solved clusters so that a cluster with the
+    same nodes, capacity and root is solved once per run.  The least
+    recently used result is dropped when there are more than maxSize.
+    """
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._resultByKey = collections.OrderedDict()
+
+    def solve(self, households, capacity, root):
+        key = (frozenset(node.getID() for node in households), capacity,
+               root.getID(), root.getX(), root.getY())
+        try:
+            result = self._resultByKey.pop(key)
+        except KeyError:
+            self.misses += 1
+            result = CMSTVectorized(households, capacity, root)
+        else:
+            self.hits += 1
+        self._resultByKey[key] = result
+        if len(self._resultByKey) > self.maxSize:
+            self._resultByKey.popitem(last=False)
+        return result
+
+
 def generateSegments(centers, searchRadius):
     segments = []
     nodeCopy = centers.copy()
@@ -747,6 +1068,285 @@ def generateSegments(centers, searchRadius):
     return segments
 
 
+class CenterGrid:
+    'Buckets cluster centers into square cells to find nearby centers quickly'
+    def __init__(self, cellSize):
+        self._cellSize = float(cellSize)
+        self._IDsByCell = collections.defaultdict(set)
+        self._cellByID = {}
+
+    def _getCell(self, x, y):
+        return (int(math.floor(x / self._cellSize)),
+                int(math.floor(y / self._cellSize)))
+
+    def addCenter(self, ID, x, y):
+        cell = self._getCell(x, y)
+        self._IDsByCell[cell].add(ID)
+        self._cellByID[ID] = cell
+
+    def removeCenter(self, ID):
+        cell = self._cellByID.pop(ID)
+        self._IDsByCell[cell].discard(ID)
+        if not self._IDsByCell[cell]:
+            del self._IDsByCell[cell]
+
+    def moveCenter(self, ID, x, y):
+        self.removeCenter(ID)
+        self.addCenter(ID, x, y)
+
+    def getNeighborIDs(self, ID, radius):
+        'Returns IDs of other centers in cells that are within radius'
+        cellX, cellY = self._cellByID[ID]
+        reach = int(math.ceil(radius / self._cellSize))
+        for i in range(cellX - reach, cellX + reach + 1):
+            for j in range(cellY - reach, cellY + reach + 1):
+                for otherID in self._IDsByCell.get((i, j), ()):
+                    if otherID != ID:
+                        yield otherID
+
+
+class MergeCandidates:
+    """
+    Keeps candidate merge segments between nearby cluster centers in a heap.
+
+    Segments pop in the same order as sorting generateSegments by weight.
+    Only segments touching a merged cluster are replaced after each merge;
+    stale segments are skipped when they reach the top of the heap.
+
+    No merge of two centers further apart than 2 * distFromT can keep every
+    node within distFromT of the new center, so maxLength is usually set to
+    2 * distFromT to keep the heap small.
+    """
+    def __init__(self, centers, searchRadius, maxLength):
+        self._centers = centers
+        self._searchRadius = searchRadius
+        self._maxLength = maxLength
+        self._grid = CenterGrid(min(searchRadius, maxLength) or 1)
+        self._versionByID = {}
+        self._heap = []
+        for ID, center in centers.items():
+            self._grid.addCenter(ID, center.getX(), center.getY())
+            self._versionByID[ID] = 0
+        for ID in centers:
+            self._addSegments(ID, onlyGreaterIDs=True)
+
+    def _addSegments(self, ID, onlyGreaterIDs=False):
+        center = self._centers[ID]
+        for otherID in self._grid.getNeighborIDs(
+                ID, min(self._searchRadius, self._maxLength)):
+            if onlyGreaterIDs and otherID < ID:
+                continue
+            # Measure from the smaller ID to match generateSegments
+            startNode, endNode = sorted([center, self._centers[otherID]],
+                                        key=lambda node: node.getID())
+            dist = ((startNode.getX() - endNode.getX()) ** 2 +
+                    (startNode.getY() - endNode.getY()) ** 2) ** (.5)
+            if dist < self._searchRadius and dist <= self._maxLength:
+                startID, endID = startNode.getID(), endNode.getID()
+                heapq.heappush(self._heap, (
+                    dist, startID, endID,
+                    self._versionByID[startID], self._versionByID[endID]))
+
+    def merge(self, baseClusterID, mergingClusterID):
+        'Updates segments after the merging cluster joins the base cluster'
+        self._grid.removeCenter(mergingClusterID)
+        del self._versionByID[mergingClusterID]
+        center = self._centers[baseClusterID]
+        self._grid.moveCenter(baseClusterID, center.getX(), center.getY())
+        self._versionByID[baseClusterID] += 1
+        self._addSegments(baseClusterID)
+
+    def popSegments(self):
+        'Pops valid segments from shortest to longest'
+        while self._heap:
+            dist, ID1, ID2, version1, version2 = heapq.heappop(self._heap)
+            if self._versionByID.get(ID1) != version1:
+                continue
+            if self._versionByID.get(ID2) != version2:
+                continue
+            yield Seg(None, self._centers[ID1], self._centers[ID2], dist)
+
+
+class MergeLog:
+    """
+    Append-only log of cluster merges that can be rolled back to an earlier
+    step and replayed again, so that the best clustering seen so far is kept
+    as a step number instead of a copy of every cluster.
+    """
+    def __init__(self, centers, nodesByClusterID, clusterByNode):
+        self._centers = centers
+        self._nodesByClusterID = nodesByClusterID
+        self._clusterByNode = clusterByNode
+        self._centerIDs = list(centers)
+        self._clusterIDs = list(nodesByClusterID)
+        self._steps = []
+        self.step = 0
+
+    def __len__(self):
+        return len(self._steps)
+
+    def append(self, baseClusterID, mergingClusterID, tempCenterX, tempCenterY, weight):
+        'Merges mergingClusterID into baseClusterID and records how to undo it'
+        del self._steps[self.step:]
+        baseCenter = self._centers[baseClusterID]
+        self._steps.append((
+            baseClusterID, mergingClusterID,
+            self._centers[mergingClusterID],
+            self._nodesByClusterID[mergingClusterID],
+            len(self._nodesByClusterID[baseClusterID]),
+            (baseCenter.getX(), baseCenter.getY(), baseCenter.getWeight()),
+            (tempCenterX, tempCenterY, weight)))
+        self.replay(len(self._steps))
+
+    def replay(self, step):
+        'Redoes the merges up to step'
+        for (baseClusterID, mergingClusterID, _, _, _, _,
+             (x, y, weight)) in self._steps[self.step:step]:
+            mergingNodes = self._nodesByClusterID.pop(mergingClusterID)
+            self._nodesByClusterID[baseClusterID].extend(mergingNodes)
+            for node in mergingNodes:
+                self._clusterByNode[node] = baseClusterID
+            self._centers[baseClusterID].setXY(x, y)
+            self._centers[baseClusterID].setWeight(weight)
+            del self._centers[mergingClusterID]
+        self.step = max(self.step, step)
+
+    def rollBack(self, step):
+        'Undoes the merges after step'
+        if step >= self.step:
+            return
+        for (baseClusterID, mergingClusterID, mergingCenter, mergingNodes,
+             baseNodeCount, (x, y, weight), _) in reversed(self._steps[step:self.step]):
+            del self._nodesByClusterID[baseClusterID][baseNodeCount:]
+            self._nodesByClusterID[mergingClusterID] = mergingNodes
+            for node in mergingNodes:
+                self._clusterByNode[node] = mergingClusterID
+            self._centers[baseClusterID].setXY(x, y)
+            self._centers[baseClusterID].setWeight(weight)
+            self._centers[mergingClusterID] = mergingCenter
+        self.step = step
+        # Restore the original key order so that the result matches a copy
+        _sortDict(self._centers, self._centerIDs)
+        _sortDict(self._nodesByClusterID, self._clusterIDs)
+
+
+def _sortDict(valueByKey, keys):
+    items = [(key, valueByKey[key]) for key in keys if key in valueByKey]
+    valueByKey.clear()
+    valueByKey.update(items)
+
+
+class ClusterMerger:
+    """
+    Merges clusters along the shortest segment between their centers as long
+    as every node stays within distFromT of the new center.
+
+    The radius of each cluster, the largest distance from its center to its
+    nodes, is cached.  Since each center is the mean of its nodes, the
+    largest distance from a new center to the nodes of a cluster lies between
+    the distance to the old center and that distance plus the old radius, so
+    most merges are accepted or rejected without visiting any node.
+
+    Node coordinates and cluster IDs are kept in a NodeArrays, so that the
+    exact radius is measured for a whole cluster at once.
+
+    Merges are recorded in mergeLog.  After rolling the log back, make a new
+    merger to continue merging from that step.
+    """
+    tolerance = 1e-6  # meters
+
+    def __init__(self, centers, nodesByClusterID, clusterByNode, searchRadius, distFromT):
+        self._centers = centers
+        self._nodesByClusterID = nodesByClusterID
+        self._clusterByNode = clusterByNode
+        self._distFromT = distFromT
+        self.mergeLog = MergeLog(centers, nodesByClusterID, clusterByNode)
+        self._candidates = MergeCandidates(centers, searchRadius, distFromT * 2)
+        self._nodeArrays = NodeArrays.fromNodes(itertools.chain.from_iterable(
+            nodesByClusterID[ID] for ID in centers), clusterByNode)
+        self._indicesByClusterID = {}
+        clusterIndices, centerXs, centerYs = [], [], []
+        for clusterIndex, (ID, center) in enumerate(centers.items()):
+            start = len(clusterIndices)
+            clusterIndices.extend([clusterIndex] * len(nodesByClusterID[ID]))
+            self._indicesByClusterID[ID] = np.arange(start, len(clusterIndices))
+            centerXs.append(center.getX())
+            centerYs.append(center.getY())
+        clusterIndices = np.array(clusterIndices, dtype=np.int64)
+        radii = np.zeros(len(centers))
+        np.maximum.at(radii, clusterIndices, np.hypot(
+            self._nodeArrays.xs - np.array(centerXs)[clusterIndices],
+            self._nodeArrays.ys - np.array(centerYs)[clusterIndices]))
+        self._radiusByClusterID = dict(zip(centers, radii.tolist()))
+
+    def _measureRadius(self, clusterIDs, x, y):
+        indices = np.concatenate([self._indicesByClusterID[ID] for ID in clusterIDs])
+        if not len(indices):
+            return 0
+        return self._nodeArrays.getDistances(x, y, indices).max().item()
+
+    def _getClusterIDs(self, seg):
+        return [self._clusterByNode[node] for node in seg.getNodes()]
+
+    def measureMerge(self, seg):
+        'Returns an upper bound on maxTempInClusterDist that is exact when near distFromT'
+        center1, center2 = seg.getNodes()
+        weight1, weight2 = center1.getWeight(), center2.getWeight()
+        tempCenterX = (weight1 * center1.getX() + weight2 * center2.getX()) / (weight2 + weight1)
+        tempCenterY = (weight1 * center1.getY() + weight2 * center2.getY()) / (weight2 + weight1)
+        clusterIDs = self._getClusterIDs(seg)
+        lowerDist, upperDist = 0, 0
+        for center, clusterID in zip([center1, center2], clusterIDs):
+            dist = ((tempCenterX - center.getX()) ** 2 + (tempCenterY - center.getY()) ** 2) ** (.5)
+            lowerDist = max(lowerDist, dist)
+            upperDist = max(upperDist, dist + self._radiusByClusterID[clusterID])
+        if lowerDist > self._distFromT + self.tolerance:
+            return lowerDist, tempCenterX, tempCenterY
+        if upperDist < self._distFromT - self.tolerance:
+            return upperDist, tempCenterX, tempCenterY
+        maxDist = self._measureRadius(clusterIDs, tempCenterX, tempCenterY)
+        return maxDist, tempCenterX, tempCenterY
+
+    def popShortest(self):
+        'Returns the shortest segment without checking the merged cluster'
+        return next(self._candidates.popSegments(), None)
+
+    def findMerge(self):
+        """
+        Returns the shortest segment whose merged cluster keeps every node
+        within distFromT of the new center, together with the first segment
+        popped.  Segments that fail the test are dropped because they can
+        only pass after one of their clusters changes, which adds a new one.
+        """
+        firstSeg = None
+        for seg in self._candidates.popSegments():
+            if firstSeg is None:
+                firstSeg = seg
+            maxDist, tempCenterX, tempCenterY = self.measureMerge(seg)
+            if maxDist <= self._distFromT:
+                return seg, firstSeg, maxDist, tempCenterX, tempCenterY
+        return None, firstSeg, None, None, None
+
+    def merge(self, seg, tempCenterX, tempCenterY, maxDist=None):
+        'Merges the clusters of the segment and returns their cluster IDs'
+        center1, center2 = seg.getNodes()
+        weight = center2.getWeight() + center1.getWeight()
+        clusterIDs = self._getClusterIDs(seg)
+        baseClusterID, mergingClusterID = min(clusterIDs), max(clusterIDs)
+        if maxDist is None:
+            maxDist = self._measureRadius(clusterIDs, tempCenterX, tempCenterY)
+
+        self.mergeLog.append(baseClusterID, mergingClusterID, tempCenterX, tempCenterY, weight)
+        mergingIndices = self._indicesByClusterID.pop(mergingClusterID)
+        self._indicesByClusterID[baseClusterID] = np.concatenate([
+            self._indicesByClusterID[baseClusterID], mergingIndices])
+        self._nodeArrays.clusterIDs[mergingIndices] = baseClusterID
+        self._candidates.merge(baseClusterID, mergingClusterID)
+        self._radiusByClusterID[baseClusterID] = maxDist
+        del self._radiusByClusterID[mergingClusterID]
+        return baseClusterID, mergingClusterID
+
+
 def maxTempInClusterDist(segment, ClusterByNode, nodesByClusterID):
     maxDist = 0
 
@@ -854,11 +1454,22 @@ def buildAssocDict(segments):
     return segList
 
 
+def buildMVTree(centers, searchRadius, firstNodeID):
+    """
+    Returns the tree of primsAlg over the segments between centers.  Seg
+    objects are only built when the tree can start from firstNodeID.
+    """
+    if firstNodeID not in centers:
+        return Network()  # primsAlg finds no segment from firstNodeID
+    nodes = list(centers.values())
+    segments = generateSegmentArrays(NodeArrays.fromNodes(nodes), searchRadius).getSegs(nodes)
+    return primsAlg(segments, len(nodes), firstNodeID, buildAssocDict(segments))
+
+
 def run(centers, nodesByClusterID, clusterByNode, LVCostDict, sr, MV, LV, TCost, distFromT, maxLVLenghtInCluster,
-        outputDir, logfilename):
+        outputDir, logfilename, cmstCache=None):
+    solveCMST = cmstCache.solve if cmstCache else CMSTVectorized
     sumLVCostAtEachStep = {}
-    minCenters = copy.deepcopy(centers)
-    segments = generateSegments(minCenters, sr)
 
     # To write total cost to a text file
     statFile = outputDir + os.sep + "TotalCost_FirstStage.txt"
@@ -866,178 +1477,110 @@ def run(centers, nodesByClusterID, clusterByNode, LVCostDict, sr, MV, LV, TCost,
 
     minTotalCost = len(centers) * TCost
     outFile.write("%(minTotalCost)f\n" % vars())
-    minLVCostDict = copy.deepcopy(LVCostDict)
+    minLVCostSum = sum(LVCostDict.values())
+    minCenterCount = len(centers)
 
-    minNodesByClusterID = copy.deepcopy(nodesByClusterID)
-    minClusterByNode = copy.deepcopy(clusterByNode)
-    minSeg = min(segments, key=lambda obj: obj.getWeight())
+    # Keep the best clustering as a step in the merge log instead of a copy
+    merger = ClusterMerger(centers, nodesByClusterID, clusterByNode, sr, distFromT)
+    minStep = 0
+    minSeg = merger.popShortest()
 
-    if minSeg.getWeight() <= distFromT * 2:
-        maxDist = 0
+    if minSeg is not None and minSeg.getWeight() <= distFromT * 2:
+        maxDist = None  # Merge the shortest segment without checking
+        _, tempCenterX, tempCenterY = maxTempInClusterDist(minSeg, clusterByNode, nodesByClusterID)
     else:
         maxDist = distFromT + 10
         #print("NO CLUSTER POSSIBLE")
 
-    tempCenter1, tempCenter2 = minSeg.getNodes()
-    tempCenterX = (tempCenter1.getWeight() * tempCenter1.getX()
-                   + tempCenter2.getWeight() * tempCenter2.getX()) / (tempCenter2.getWeight() + tempCenter1.getWeight())
-    tempCenterY = (tempCenter1.getWeight() * tempCenter1.getY()
-                   + tempCenter2.getWeight() * tempCenter2.getY()) / (tempCenter2.getWeight() + tempCenter1.getWeight())
     i = len(centers)
     initial = True
     loggers(logfilename, initial)
     initial = False
-    while (maxDist <= distFromT):
+    while maxDist is None or maxDist <= distFromT:
         i -= 1
         cur_token = 'stage1 ' + str(i)
         loggers(logfilename, initial, cur_token)
 
-        center1, center2 = minSeg.getNodes()
-        weight = center2.getWeight() + center1.getWeight()
-        baseClusterID = min(clusterByNode[center1], clusterByNode[center2])
-        mergingClusterID = max(clusterByNode[center1], clusterByNode[center2])
-        nodesByClusterID[baseClusterID].extend(nodesByClusterID.pop(mergingClusterID))
-
-        centers[baseClusterID].setXY(tempCenterX, tempCenterY)
-        centers[baseClusterID].setWeight(weight)
-
-        del centers[mergingClusterID]
-
-        for node in nodesByClusterID[baseClusterID]:
-            clusterByNode[node] = baseClusterID
-
-        segments = generateSegments(centers, sr)
+        baseClusterID, mergingClusterID = merger.merge(minSeg, tempCenterX, tempCenterY, maxDist)
         TotalTransformerCost = len(centers) * TCost
 
         del LVCostDict[mergingClusterID]
         gc.collect()
-        _, LVCostDict[baseClusterID] = CMST(nodesByClusterID[baseClusterID],
-                                                                    maxLVLenghtInCluster,
-                                                                    centers[baseClusterID])
+        _, LVCostDict[baseClusterID] = solveCMST(nodesByClusterID[baseClusterID],
+                                                 maxLVLenghtInCluster,
+                                                 centers[baseClusterID])
         # sums the cost
         sumLVCostAtEachStep[len(centers)] = sum(LVCostDict.values()) * LV
         newTotalCost = TotalTransformerCost + (sum(LVCostDict.values())) * LV
 
         outFile.write("%i %f\n" % (i, sumLVCostAtEachStep[len(centers)]))
         if (newTotalCost <= minTotalCost):
-            minNodesByClusterID = copy.deepcopy(nodesByClusterID)
-            # minTree=copy.deepcopy(newTree)
-            minCenters = copy.deepcopy(centers)
-            minLVCostDict = LVCostDict.copy()
+            minStep = len(merger.mergeLog)
+            minCenterCount = len(centers)
+            minLVCostSum = sum(LVCostDict.values())
             minTotalCost = newTotalCost
-            minClusterByNode = copy.deepcopy(clusterByNode)
-        # Calculate maxDist below for next graph and continue if it is less than 500
-
-        try:  # to check if there is a segment on the graph or there is only one cluster  # bir tane break eden varsa bile devamini check ediyor!!!!!
-            # seems this looks for the shortest segment with the lv less that distFromT
-            minSeg = min(segments) # finds closest 2 points
-            maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(minSeg, clusterByNode, nodesByClusterID) # find the largest distance to centroid of minSeg
-            if maxDist > distFromT: # if largest distance > 500 meters
-                segments.sort() # sort by smallest to largest distances
-
-                for seg in segments:
-                    if seg.getWeight() > distFromT * 2: # distance greater than 1000 skip
-                        break
-                    else: # if distance is okay check if there are 2 closer points
-                        maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(seg, clusterByNode, nodesByClusterID)
-                        if maxDist <= distFromT:
-                            minSeg = seg  ## identifies a new minSeg to go to if there is still room to add to the LV
-                            break # finds the next minimum segment to go to
-        except:
+        # Find the shortest segment whose merged cluster stays within distFromT
+        minSeg, _, maxDist, tempCenterX, tempCenterY = merger.findMerge()
+        if minSeg is None:
             break
 
     outFile.close()
 
-    if len(minCenters) == len(centers) or len(minCenters) == 1:
-        segments_ST = generateSegments(centers, sr)
-        nodeDict = buildAssocDict(segments_ST)
-        minTree = primsAlg(segments_ST, len(centers), 0, nodeDict)
+    if minCenterCount == len(centers) or minCenterCount == 1:
+        minTree = buildMVTree(centers, sr, 0)
         minTotalCost_ST = minTree.getTotalEdgeWeight() * MV + minTotalCost
         return minTotalCost_ST, minTree, centers, nodesByClusterID, sum(LVCostDict.values()) * LV
 
-    centers_ST = copy.deepcopy(minCenters)
     LVCostDict_ST = LVCostDict
+    LVCostSum_ST = sum(LVCostDict_ST.values())
+    merger.mergeLog.rollBack(minStep)
+    centers_ST = centers
+    nodesByClusterID_ST = nodesByClusterID
+    clusterByNode_ST = clusterByNode
 
 
-    segments_ST = generateSegments(centers_ST, sr)
+    segments_ST = generateSegmentArrays(NodeArrays.fromNodes(centers_ST.values()), sr)
 
     # To write total cost to a text file
     statFile = outputDir + os.sep + "TotalCost_SecondStage.txt"
     outFile = open(statFile, "w")
 
-    nodeDict = buildAssocDict(segments_ST)
-
-    minTree = primsAlg(segments_ST, len(centers_ST), 0, nodeDict)  # 0 is the starting node of Prims algorithm
+    minTree = buildMVTree(centers_ST, sr, 0)  # 0 is the starting node of Prims algorithm
     i = len(centers_ST)
-    minTotalCost_ST = minTree.getTotalEdgeWeight() * MV + len(centers_ST) * TCost + (sum(minLVCostDict.values())) * LV
+    minTotalCost_ST = minTree.getTotalEdgeWeight() * MV + len(centers_ST) * TCost + minLVCostSum * LV
     outFile.write(
-        "%i %f %f %f\n" % (i, (sum(minLVCostDict.values())) * LV, minTree.getTotalEdgeWeight() * MV, minTotalCost_ST))
+        "%i %f %f %f\n" % (i, minLVCostSum * LV, minTree.getTotalEdgeWeight() * MV, minTotalCost_ST))
 
     minLVCostSum_ST = 9999999999999999  # a big number
-    nodesByClusterID_ST = copy.deepcopy(minNodesByClusterID)
-    clusterByNode_ST = copy.deepcopy(minClusterByNode)
-    try:
-        # given the tx location
-        minSeg_ST = min(segments_ST, key=lambda obj: obj.getWeight()) #
-        maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(minSeg_ST, clusterByNode_ST, nodesByClusterID_ST)
-        if maxDist > distFromT:
-            segments_ST.sort(key=lambda obj: obj.getWeight())
-
-            for seg in segments_ST:
-                if seg.getWeight() > distFromT * 2:
-                    break  # break from for loop
-                else:
-                    maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(seg, clusterByNode_ST, nodesByClusterID_ST)
-                    if maxDist <= distFromT:
-                        minSeg_ST = seg
-                        break  # break from for loop
-    except:
-        return minTotalCost_ST, minTree, centers_ST, nodesByClusterID_ST, sum(LVCostDict_ST.values()) * LV
-
-    minNodesByClusterID_ST = copy.deepcopy(minNodesByClusterID)
-    minCenters_ST = copy.deepcopy(minCenters)
-
-    if minSeg_ST.getWeight() <= distFromT * 2:
-        maxDist = 0
+    if not segments_ST:
+        return minTotalCost_ST, minTree, centers_ST, nodesByClusterID_ST, LVCostSum_ST * LV
+
+    # given the tx location
+    merger_ST = ClusterMerger(centers_ST, nodesByClusterID_ST, clusterByNode_ST, sr, distFromT)
+    minSeg_ST, firstSeg_ST, maxDist, tempCenterX, tempCenterY = merger_ST.findMerge()
+    if minSeg_ST is None:
+        # Fall back to the shortest segment as before
+        minSeg_ST = firstSeg_ST
+    minStep_ST = 0
+
+    if minSeg_ST is not None and minSeg_ST.getWeight() <= distFromT * 2:
+        if maxDist is None:
+            maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(minSeg_ST, clusterByNode_ST, nodesByClusterID_ST)
+        mergeMaxDist, maxDist = maxDist, 0
     else:
         maxDist = distFromT + 10
         print("NO CLUSTER POSSIBLE")
 
-    tempCenter1, tempCenter2 = minSeg_ST.getNodes()
-
-    tempCenterX = (tempCenter1.getWeight() * tempCenter1.getX()
-                   + tempCenter2.getWeight() * tempCenter2.getX()) / (tempCenter2.getWeight() + tempCenter1.getWeight())
-    tempCenterY = (tempCenter1.getWeight() * tempCenter1.getY()
-                   + tempCenter2.getWeight() * tempCenter2.getY()) / (tempCenter2.getWeight() + tempCenter1.getWeight())
-
     initial = False
-    i = len(minCenters)
+    i = minCenterCount
     while (maxDist <= distFromT):
 
         i -= 1
         if i % 20 == 0:
             cur_token = 'stage2 ' + str(i)
             loggers(logfilename, initial, cur_token)
-        center1, center2 = minSeg_ST.getNodes()
-
-        weight = center2.getWeight() + center1.getWeight()
-        baseClusterID = min(clusterByNode_ST[center1], clusterByNode_ST[center2])
-
-        mergingClusterID = max(clusterByNode_ST[center1], clusterByNode_ST[center2])
-
-        nodesByClusterID_ST[baseClusterID].extend(nodesByClusterID_ST.pop(mergingClusterID))
-
-        centers_ST[baseClusterID].setXY(tempCenterX, tempCenterY)
-        centers_ST[baseClusterID].setWeight(weight)
-
-        del centers_ST[mergingClusterID]
-
-        for node in nodesByClusterID_ST[baseClusterID]:
-            clusterByNode_ST[node] = baseClusterID
-
-        segments_ST = generateSegments(centers_ST, sr)
-        nodeDict = buildAssocDict(segments_ST)
-        newTree = primsAlg(segments_ST, len(centers_ST), 0, nodeDict)
+        merger_ST.merge(minSeg_ST, tempCenterX, tempCenterY, mergeMaxDist)
+        newTree = buildMVTree(centers_ST, sr, 0)
         TotalMVCost_ST = newTree.getTotalEdgeWeight() * MV
         TotalTransformerCost_ST = len(centers_ST) * TCost
         gc.collect()
@@ -1045,34 +1588,20 @@ def run(centers, nodesByClusterID, clusterByNode, LVCostDict, sr, MV, LV, TCost,
         newTotalCost_ST = TotalMVCost_ST + TotalTransformerCost_ST + sumLVCostAtEachStep[len(centers_ST)]
 
         if (newTotalCost_ST <= minTotalCost_ST):
-            minNodesByClusterID_ST = copy.deepcopy(nodesByClusterID_ST)
-            minTree = copy.deepcopy(newTree)
-            minCenters_ST = copy.deepcopy(centers_ST)
+            minStep_ST = len(merger_ST.mergeLog)
+            minTree = newTree
             minLVCostSum_ST = sumLVCostAtEachStep[len(centers_ST)]
             minTotalCost_ST = newTotalCost_ST
 
         # Calculate maxDist below for next graph and continue if it is less than 500
 
-        try:  # to check if there is a segment on the graph or there is only one cluster
-            minSeg_ST = min(segments_ST, key=lambda obj: obj.getWeight())
-            maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(minSeg_ST, clusterByNode_ST, nodesByClusterID_ST)
-
-            if maxDist > distFromT:
-                segments_ST.sort(key=lambda obj: obj.getWeight())
-
-                for seg in segments_ST:
-                    if seg.getWeight() > distFromT * 2:
-                        break
-                    else:
-                        maxDist, tempCenterX, tempCenterY = maxTempInClusterDist(seg, clusterByNode_ST,
-                                                                                 nodesByClusterID_ST)
-                        if maxDist <= distFromT:
-                            minSeg_ST = seg
-                            break
-        except:
+        minSeg_ST, _, maxDist, tempCenterX, tempCenterY = merger_ST.findMerge()
+        if minSeg_ST is None:
             break
+        mergeMaxDist = maxDist
     outFile.close()
-    return minTotalCost_ST, minTree, minCenters_ST, minNodesByClusterID_ST, minLVCostSum_ST
+    merger_ST.mergeLog.rollBack(minStep_ST)
+    return minTotalCost_ST, minTree, centers_ST, nodesByClusterID_ST, minLVCostSum_ST
 
 
 def writeLVDictToText(statsFile, Dict):
@@ -1913,7 +2442,8 @@ def generateDictsFromShp(x, y):
 
 
 
-def tlnd(outputDir, x, y, pues_in_cell=0, structures_in_cell=0):
+def tlnd(outputDir, x, y, zone_number, zone_letter, pues_in_cell=0, structures_in_cell=0):
+    'Runs the model on structures at UTM coordinates x and y in zone_number and zone_letter'
     tf = os.path.join(outputDir, "transformers.csv")
     if os.path.exists(tf):
         with open(tf) as tf_file:
@@ -1942,11 +2472,13 @@ def tlnd(outputDir, x, y, pues_in_cell=0, structures_in_cell=0):
     logfilename = outputDir + '/' + 'modelStatus.txt'
     startTime = time.time()
     nodesByClusterID, clusterByNode, nodes, centers, LVCostDict , _ = generateDictsFromShp(x, y)
+    cmstCache = CMSTCache()
 
     _, tree, centers, nodesByClusterID, _ = run(centers, nodesByClusterID, clusterByNode,
                                                                     LVCostDict, searchRadius, MV, LV, TCost,
                                                                     distFromT,
-                                                                    maxLVLenghtInCluster, outputDir, logfilename)
+                                                                    maxLVLenghtInCluster, outputDir, logfilename,
+                                                                    cmstCache)
 
     statsFile1 = outputDir + os.sep + "LVCostDict.txt"
     statsFile2 = outputDir + os.sep + "CenterSize.txt"
@@ -1970,7 +2502,7 @@ def tlnd(outputDir, x, y, pues_in_cell=0, structures_in_cell=0):
         nodesByNodeID = {}
         # Start on -1 to not over count transformers
         customers = -1
-        segments, lvCost = CMST(nodesByClusterID[ID], maxLVLenghtInCluster, centers[ID])
+        segments, lvCost = cmstCache.solve(nodesByClusterID[ID], maxLVLenghtInCluster, centers[ID])
 
         my_lv += lvCost
         for segment in segments.values():
@@ -1990,11 +2522,12 @@ def tlnd(outputDir, x, y, pues_in_cell=0, structures_in_cell=0):
 
         transformers.append((centers[ID]._x, centers[ID]._y, lvCost/customers, customers))
     
-    lat, lon = to_latlon(centers[ID]._x, centers[ID]._y, 36, "S")
-
-    coords = [to_latlon(dd[0], dd[1], 36, "S") for dd in transformers]
-    latitudes = [cc[0] for cc in coords]
-    longitudes = [cc[1] for cc in coords]
+    # Structures across the equator (or zone edges) are outside the strict
+    # UTM range of their zone, as from_latlon_array keeps them continuous
+    latitudes, longitudes = to_latlon_array(
+        [dd[0] for dd in transformers], [dd[1] for dd in transformers], zone_number, zone_letter,
+        strict=False)
+    latitudes, longitudes = latitudes.tolist(), longitudes.tolist()
 
     lv_per_customer = [dd[2] for dd in transformers]
     customers = [dd[3] for dd in transformers]
@@ -2006,47 +2539,266 @@ def tlnd(outputDir, x, y, pues_in_cell=0, structures_in_cell=0):
     rows = list(zip(output["latitude"], output["longitude"], 
                 output["lv_meters_per_customer"], output["customers"]))
 
-    with open(os.path.join(outputDir, "transformers.csv"), "w", newline="") as f:
-        csvwriter = csv.writer(f)
-
-        # Write headers
-        csvwriter.writerow(output.keys())
-
-        # Write data
-        csvwriter.writerows(rows)
-
-    with open(outputDir + "/" + 'modelOutput.txt', 'w') as dst:
-        dst.write("NumStructures:" + str(len(nodes)) + "\n")
-        dst.write("LVLength:" + str(my_lv) + "\n")
-        dst.write("LVPerCustomer:" + str(float(my_lv) / len(nodes)) + "\n")
-        dst.write("MVLength:" + str(MVLength) + "\n")
-        dst.write("MVPerCustomer:" + str(MVLength / len(nodes)) + "\n")
-        dst.write("Num Transformers:" + str(numTransformer) + "\n")
-        dst.write("Customers Per Tx:" + str(len(nodes) / float(numTransformer)) + "\n")
-        dst.write("Total LV Cost:" + str(my_lv * float(LV)) + "\n")
-        dst.write("Total MV Cost:" + str(MVCost) + "\n")
-        dst.write("StructuresInCell:" + str(structures_in_cell) + "\n")
-        dst.write("PuesInCell:" + str(pues_in_cell) + "\n")
+    # transformers.csv marks a finished run (see above), so both files are
+    # written to temporary names and replaced, modelOutput.txt first
+    writeTransformers(tf + ".tmp", output.keys(), rows)
+
+    def generateModelOutput():
+        yield "NumStructures", len(nodes)
+        yield "LVLength", my_lv
+        yield "LVPerCustomer", float(my_lv) / len(nodes)
+        yield "MVLength", MVLength
+        yield "MVPerCustomer", MVLength / len(nodes)
+        yield "Num Transformers", numTransformer
+        yield "Customers Per Tx", len(nodes) / float(numTransformer)
+        yield "Total LV Cost", my_lv * float(LV)
+        yield "Total MV Cost", MVCost
+        yield "StructuresInCell", structures_in_cell
+        yield "PuesInCell", pues_in_cell
         transformerCost = numTransformer * TCost
-        dst.write("Transformer Cost:" + str(transformerCost) + "\n")
+        yield "Transformer Cost", transformerCost
         total_cost = MVCost + my_lv * float(LV) + transformerCost
-        dst.write("Total Cost:" + str(total_cost) + "\n")
-        runningT = time.time() - startTime
-        dst.write("Total Running Time:" + str(runningT) + "\n")
-        # with open(outputDir+'modelOutput.txt', 'a') as dst:
-        runningT1 = time.time() - startTime
-        dst.write("Final Running Time:" + str(runningT1))
-
-
+        yield "Total Cost", total_cost
+        yield "CMST Cache Hits", cmstCache.hits
+        yield "CMST Cache Misses", cmstCache.misses
+        yield "Total Running Time", time.time() - startTime
+        yield "Final Running Time", time.time() - startTime
+
+    modelOutputPath = os.path.join(outputDir, "modelOutput.txt")
+    writeModelOutput(modelOutputPath + ".tmp", generateModelOutput())
+    os.replace(modelOutputPath + ".tmp", modelOutputPath)
+    os.replace(tf + ".tmp", tf)
     return output
   
 
 
-def read_lan(path_to_gzipped_csv):
+def iterLanChunks(path_to_gzipped_csv, chunkSize=100000, bbox=None):
+    """
+    Yields float64 arrays of x and y for up to chunkSize structures at a
+    time.  Given bbox = (minX, minY, maxX, maxY), only structures inside
+    the box are kept.
+    """
     with gzip.open(path_to_gzipped_csv, 'rt') as f:
-        data = list(csv.DictReader(f))
-    
-    x = [float(dd["x"]) for dd in data]
-    y = [float(dd["y"]) for dd in data]
-    
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        xIndex, yIndex = header.index("x"), header.index("y")
+        rows = (row for row in reader if row)
+        while True:
+            chunk = list(itertools.islice(rows, chunkSize))
+            if not chunk:
+                break
+            xs = np.fromiter((float(row[xIndex]) for row in chunk), dtype=np.float64, count=len(chunk))
+            ys = np.fromiter((float(row[yIndex]) for row in chunk), dtype=np.float64, count=len(chunk))
+            if bbox is not None:
+                minX, minY, maxX, maxY = bbox
+                isInside = (xs >= minX) & (xs <= maxX) & (ys >= minY) & (ys <= maxY)
+                xs, ys = xs[isInside], ys[isInside]
+            if len(xs):
+                yield xs, ys
+
+
+def read_lan(path_to_gzipped_csv, bbox=None):
+    x, y = [], []
+    for xs, ys in iterLanChunks(path_to_gzipped_csv, bbox=bbox):
+        x.extend(xs.tolist())
+        y.extend(ys.tolist())
     return x, y
+
+
+def writeTransformers(path, header, rows):
+    'Writes transformers.csv one row at a time and returns the number of rows'
+    rowCount = 0
+    with open(path, "w", newline="") as f:
+        csvwriter = csv.writer(f)
+        csvwriter.writerow(header)
+        for row in rows:
+            csvwriter.writerow(row)
+            rowCount += 1
+    return rowCount
+
+
+def writeModelOutput(path, items):
+    'Writes a label:value line to modelOutput.txt for each item as it comes'
+    with open(path, 'w') as dst:
+        for index, (label, value) in enumerate(items):
+            dst.write(("\n" if index else "") + label + ":" + str(value))
+
+
+def readModelOutput(path):
+    'Returns the values of modelOutput.txt by label'
+    valueByLabel = collections.OrderedDict()
+    with open(path) as src:
+        for line in src:
+            label, _, value = line.rstrip("\n").rpartition(":")
+            valueByLabel[label] = float(value)
+    return valueByLabel
+
+
+def getTileKeys(x, y, tileSize=10000, h3Resolution=None, zoneNumber=None, zoneLetter=None):
+    """
+    Returns the tile of each structure.  Tiles are squares of tileSize
+    meters in UTM coordinates or, given h3Resolution, the H3 cells that
+    google_to_parquet.py partitions buildings by, which need the UTM
+    zoneNumber and zoneLetter of x and y.
+    """
+    if h3Resolution is None:
+        columns = np.floor(np.asarray(x, dtype=float) / tileSize).astype(np.int64)
+        rows = np.floor(np.asarray(y, dtype=float) / tileSize).astype(np.int64)
+        return ["%i_%i" % (column, row) for column, row in zip(columns.tolist(), rows.tolist())]
+    if zoneNumber is None or not zoneLetter:
+        raise ValueError("tiling by H3 cells needs the UTM zone of the structures")
+    try:
+        import h3
+    except ImportError:
+        raise ImportError("tiling by H3 cells requires h3: https://h3geo.org/")
+    latlngToCell = getattr(h3, 'latlng_to_cell', None) or h3.geo_to_h3
+    latitudes, longitudes = to_latlon_array(x, y, zoneNumber, zoneLetter, strict=False)
+    return [latlngToCell(lat, lon, h3Resolution) for lat, lon in zip(latitudes.tolist(), longitudes.tolist())]
+
+
+def spillTiles(tilesDir, chunks, zoneNumber, zoneLetter, tileSize=10000, h3Resolution=None,
+               finishedTileKeys=()):
+    """
+    Appends the structures of each chunk of (x, y) to the
+    structures.csv.gz of their tile and returns the tile keys in order, so
+    that only one chunk is held in memory.  The structures of
+    finishedTileKeys are not written again.
+    """
+    tileKeys = set()
+    for xs, ys in chunks:
+        xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        chunkTileKeys, tileIndices = np.unique(
+            getTileKeys(xs, ys, tileSize, h3Resolution, zoneNumber, zoneLetter), return_inverse=True)
+        order = np.argsort(tileIndices, kind='stable')
+        splits = np.cumsum(np.bincount(tileIndices))[:-1]
+        for tileKey, indices in zip(chunkTileKeys.tolist(), np.split(order, splits)):
+            if tileKey in finishedTileKeys:
+                tileKeys.add(tileKey)
+                continue
+            tileDir = os.path.join(tilesDir, tileKey)
+            os.makedirs(tileDir, exist_ok=True)
+            isNew = tileKey not in tileKeys
+            with gzip.open(os.path.join(tileDir, "structures.csv.gz"), "wt" if isNew else "at", newline="") as f:
+                csvwriter = csv.writer(f)
+                if isNew:
+                    csvwriter.writerow(["x", "y"])
+                csvwriter.writerows(zip(xs[indices].tolist(), ys[indices].tolist()))
+            tileKeys.add(tileKey)
+    return sorted(tileKeys)
+
+
+def readManifest(manifestPath):
+    'Returns the keys of the tiles that finished in an earlier run'
+    if not os.path.exists(manifestPath):
+        return set()
+    with open(manifestPath) as manifestFile:
+        return set(line.strip() for line in manifestFile if line.strip())
+
+
+def runTile(tileDir, zoneNumber, zoneLetter):
+    'Runs tlnd on the structures of one tile in a worker process'
+    # Remove the outputs of an earlier run that did not finish the tile
+    for name in ["transformers.csv", "modelOutput.txt"]:
+        for path in [os.path.join(tileDir, name), os.path.join(tileDir, name + ".tmp")]:
+            if os.path.exists(path):
+                os.remove(path)
+    x, y = read_lan(os.path.join(tileDir, "structures.csv.gz"))
+    tlnd(tileDir, x, y, zoneNumber, zoneLetter, structures_in_cell=len(x))
+    return tileDir
+
+
+def runTiles(outputDir, chunks, zoneNumber, zoneLetter, tileSize=10000, h3Resolution=None,
+             workerCount=None):
+    """
+    Runs tlnd on each spatial tile of the chunks of (x, y) in a process pool
+    and merges the tiles into outputDir/transformers.csv and
+    outputDir/modelOutput.txt, whose values it returns.  x and y are UTM
+    coordinates in zoneNumber and zoneLetter.
+
+    Finished tiles are appended to outputDir/manifest.txt, so that an
+    interrupted run resumes with the remaining tiles (from the same
+    structures).  Clusters do not cross tile edges, so tiles should be
+    much wider than distFromT.
+    """
+    startTime = time.time()
+    tilesDir = os.path.join(outputDir, "tiles")
+    manifestPath = os.path.join(outputDir, "manifest.txt")
+    os.makedirs(tilesDir, exist_ok=True)
+    finishedTileKeys = readManifest(manifestPath)
+    tileKeys = spillTiles(
+        tilesDir, chunks, zoneNumber, zoneLetter, tileSize, h3Resolution, finishedTileKeys)
+    pendingTileKeys = [tileKey for tileKey in tileKeys if tileKey not in finishedTileKeys]
+
+    with open(manifestPath, "a") as manifestFile:
+        def finishTile(tileKey):
+            manifestFile.write(tileKey + "\n")
+            manifestFile.flush()
+
+        if workerCount == 1:
+            for tileKey in pendingTileKeys:
+                runTile(os.path.join(tilesDir, tileKey), zoneNumber, zoneLetter)
+                finishTile(tileKey)
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=workerCount) as executor:
+                tileKeyByFuture = {executor.submit(
+                    runTile, os.path.join(tilesDir, tileKey), zoneNumber, zoneLetter,
+                ): tileKey for tileKey in pendingTileKeys}
+                for future in as_completed(tileKeyByFuture):
+                    future.result()
+                    finishTile(tileKeyByFuture[future])
+
+    def generateRows():
+        for tileKey in tileKeys:
+            with open(os.path.join(tilesDir, tileKey, "transformers.csv")) as tileFile:
+                reader = csv.reader(tileFile)
+                next(reader)
+                for row in reader:
+                    yield row + [tileKey]
+
+    writeTransformers(os.path.join(outputDir, "transformers.csv"), [
+        "latitude", "longitude", "lv_meters_per_customer", "customers", "tile",
+    ], generateRows())
+
+    totalByLabel = collections.Counter()
+    for tileKey in tileKeys:
+        valueByLabel = readModelOutput(os.path.join(tilesDir, tileKey, "modelOutput.txt"))
+        for label in [
+                "NumStructures", "LVLength", "MVLength", "Num Transformers", "Total LV Cost",
+                "Total MV Cost", "Transformer Cost", "Total Cost"]:
+            totalByLabel[label] += valueByLabel[label]
+
+    def generateModelOutput():
+        structureCount = int(totalByLabel["NumStructures"])
+        transformerCount = int(totalByLabel["Num Transformers"])
+        yield "Tiles", len(tileKeys)
+        yield "NumStructures", structureCount
+        yield "LVLength", totalByLabel["LVLength"]
+        yield "LVPerCustomer", totalByLabel["LVLength"] / structureCount if structureCount else 0
+        yield "MVLength", totalByLabel["MVLength"]
+        yield "MVPerCustomer", totalByLabel["MVLength"] / structureCount if structureCount else 0
+        yield "Num Transformers", transformerCount
+        yield "Customers Per Tx", structureCount / float(transformerCount) if transformerCount else 0
+        for label in ["Total LV Cost", "Total MV Cost", "Transformer Cost", "Total Cost"]:
+            yield label, totalByLabel[label]
+        yield "Total Running Time", time.time() - startTime
+
+    modelOutputPath = os.path.join(outputDir, "modelOutput.txt")
+    writeModelOutput(modelOutputPath, generateModelOutput())
+    return readModelOutput(modelOutputPath)
+
+
+def tlndTiled(outputDir, x, y, zoneNumber, zoneLetter, tileSize=10000, h3Resolution=None,
+              workerCount=None):
+    'Runs tlnd on spatial tiles of the structures at x and y; see runTiles'
+    return runTiles(outputDir, [(x, y)], zoneNumber, zoneLetter, tileSize, h3Resolution, workerCount)
+
+
+def tlndTiledFromLan(outputDir, path_to_gzipped_csv, zoneNumber, zoneLetter, bbox=None,
+                     chunkSize=100000, tileSize=10000, h3Resolution=None, workerCount=None):
+    'Streams the structures of a gzipped CSV into tiles and runs tlnd on them; see runTiles'
+    chunks = iterLanChunks(path_to_gzipped_csv, chunkSize, bbox)
+    return runTiles(
+        outputDir, chunks, zoneNumber, zoneLetter, tileSize, h3Resolution, workerCount)
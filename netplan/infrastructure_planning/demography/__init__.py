@@ -1,6 +1,8 @@
 from pandas import Series
 
-from ..macros import get_final_value, make_zero_by_year
+from ..macros import (
+    define_columnar, get_final_column, get_final_value, make_zero_by_year,
+    make_zero_by_year_by_node)
 
 
 def estimate_population_profile(population_by_year):
@@ -8,3 +10,11 @@ def estimate_population_profile(population_by_year):
         'final_population': get_final_value(population_by_year),
         'zero_by_year': make_zero_by_year(population_by_year),
     }
+
+
+@define_columnar(estimate_population_profile)
+def estimate_population_profile_by_node(population_by_year):
+    return {
+        'final_population': get_final_column(population_by_year),
+        'zero_by_year': make_zero_by_year_by_node(population_by_year),
+    }
@@ -1,6 +1,8 @@
-from pandas import Series
+import numpy as np
+from pandas import DataFrame, Series
 
 from ..exceptions import ValidationError
+from ..macros import define_columnar
 
 
 def estimate_population(
@@ -28,5 +30,41 @@ def estimate_population(
     }
 
 
+@define_columnar(estimate_population)
+def estimate_population_by_node(
+        population,
+        population_year,
+        population_growth_as_percent_of_population_per_year,
+        financing_year,
+        time_horizon_in_years):
+    if hasattr(financing_year, 'index') or hasattr(
+            time_horizon_in_years, 'index'):
+        return  # Years differ by node
+    if np.any(financing_year < population_year):
+        raise ValidationError(
+            'financing_year', 'cannot be less than population_year')
+    node_index = population.index
+    growth_as_percent = _get_values(
+        population_growth_as_percent_of_population_per_year, node_index)
+    # Compute the population at financing_year
+    base_population = _grow_exponentially(
+        _get_values(population, node_index), growth_as_percent,
+        financing_year - _get_values(population_year, node_index))
+    # Compute the population over time_horizon_in_years
+    year_increments = np.arange(time_horizon_in_years + 1)
+    populations = _grow_exponentially(
+        base_population[:, np.newaxis], growth_as_percent[:, np.newaxis],
+        year_increments)
+    return {
+        'population_by_year': DataFrame(
+            populations, index=node_index,
+            columns=financing_year + year_increments),
+    }
+
+
 def _grow_exponentially(value, growth_as_percent, growth_count):
     return value * (1 + growth_as_percent / 100.) ** growth_count
+
+
+def _get_values(x, index):
+    return np.broadcast_to(np.asarray(x, dtype=float), (len(index),))
@@ -1,5 +1,6 @@
-from ...finance.valuation import compute_discounted_cash_flow
-from ...macros import get_final_value
+from ...finance.valuation import (
+    compute_discounted_cash_flow, compute_discounted_cash_flow_by_node)
+from ...macros import define_columnar, get_final_column, get_final_value
 
 
 def estimate_consumption_profile(
@@ -14,3 +15,18 @@ def estimate_consumption_profile(
             consumption_in_kwh_by_year),
         'discounted_consumption_in_kwh': discounted_consumption_in_kwh,
     }
+
+
+@define_columnar(estimate_consumption_profile)
+def estimate_consumption_profile_by_node(
+        connection_count_by_year, consumption_in_kwh_by_year, financing_year,
+        discount_rate_as_percent_of_cash_flow_per_year):
+    discounted_consumption_in_kwh = compute_discounted_cash_flow_by_node(
+        consumption_in_kwh_by_year, financing_year,
+        discount_rate_as_percent_of_cash_flow_per_year)
+    return {
+        'final_connection_count': get_final_column(connection_count_by_year),
+        'final_consumption_in_kwh_per_year': get_final_column(
+            consumption_in_kwh_by_year),
+        'discounted_consumption_in_kwh': discounted_consumption_in_kwh,
+    }
@@ -1,3 +1,4 @@
+import numpy as np
 from invisibleroads_macros.calculator import divide_safely
 from pandas import DataFrame, Series, concat, isnull, merge
 
@@ -5,7 +6,9 @@ from ...growth import get_default_slope, get_future_years
 from ...growth.interpolated import (
     get_interpolated_spline_extrapolated_linear_function as
     get_estimate_electricity_consumption)
-from ...macros import get_final_value, make_zero_by_year
+from ...macros import (
+    define_columnar, get_final_column, get_final_value, make_zero_by_year,
+    make_zero_by_year_by_node)
 
 
 def estimate_consumption_from_connection_type(
@@ -42,6 +45,40 @@ def estimate_consumption_from_connection_type(
         'consumption_in_kwh_by_year': consumption_by_year})
 
 
+@define_columnar(estimate_consumption_from_connection_type)
+def estimate_consumption_from_connection_type_by_node(
+        population_by_year, number_of_people_per_household,
+        connection_type_table, **keywords):
+    if hasattr(number_of_people_per_household, 'index'):
+        return  # Household size differs by node
+    d = {}
+    connection_count_by_year = make_zero_by_year_by_node(population_by_year)
+    consumption_by_year = make_zero_by_year_by_node(population_by_year)
+    estimated_household_connection_count_by_year = divide_safely(
+        population_by_year, number_of_people_per_household,
+        make_zero_by_year_by_node(population_by_year))
+    for row_index, row in connection_type_table.iterrows():
+        connection_type = row['connection_type']
+        count_by_year = _get_connection_count_by_year_by_node(
+            keywords, connection_type,
+            estimated_household_connection_count_by_year)
+        consumption_per_connection = _get_consumption_per_connection_by_node(
+            keywords, connection_type, row['consumption_in_kwh_per_year'])
+        connection_count_by_year += count_by_year
+        consumption_by_year += count_by_year.mul(
+            consumption_per_connection, axis=0)
+        # Record
+        connection_count_name = _name_connection_count(connection_type)
+        consumption_per_connection_name = _name_consumption_per_connection(
+            connection_type)
+        d[connection_count_name + '_by_year'] = count_by_year
+        d[connection_count_name] = get_final_column(count_by_year)
+        d[consumption_per_connection_name] = consumption_per_connection
+    return dict(d, **{
+        'connection_count_by_year': connection_count_by_year,
+        'consumption_in_kwh_by_year': consumption_by_year})
+
+
 def estimate_consumption_from_connection_count(
         population_by_year,
         number_of_people_per_connection,
@@ -161,6 +198,37 @@ def _get_consumption_per_connection(
     return consumption_per_connection
 
 
+def _get_connection_count_by_year_by_node(
+        keywords, connection_type,
+        estimated_household_connection_count_by_year):
+    t = estimated_household_connection_count_by_year
+    column_name = _name_connection_count(connection_type)
+    connection_count = Series(
+        keywords.get(column_name), index=t.index, dtype=float)
+    if connection_type == 'household':
+        default_count_by_year = t
+    else:
+        default_count_by_year = make_zero_by_year_by_node(t)
+    count_by_year = DataFrame(
+        np.repeat(connection_count.values[:, np.newaxis], len(t.columns), 1),
+        index=t.index, columns=t.columns)
+    return count_by_year.where(
+        connection_count.notnull(), default_count_by_year, axis=0)
+
+
+def _get_consumption_per_connection_by_node(
+        keywords, connection_type, estimated_consumption_per_connection):
+    column_name = _name_consumption_per_connection(connection_type)
+    consumption_per_connection = keywords.get(column_name)
+    if hasattr(consumption_per_connection, 'index'):
+        # Enable local override
+        return consumption_per_connection.fillna(
+            estimated_consumption_per_connection)
+    if isnull(consumption_per_connection):
+        return estimated_consumption_per_connection
+    return consumption_per_connection
+
+
 def _name_connection_count(connection_type):
     return 'X_connection_count'.replace('X', connection_type)
 
@@ -1,6 +1,8 @@
+import numpy as np
 from invisibleroads_macros.calculator import divide_safely
 
 from ..exceptions import ExpectedPositive
+from ..macros import define_columnar
 
 
 def estimate_peak_demand(
@@ -18,3 +20,20 @@ def estimate_peak_demand(
     return {
         'peak_demand_in_kw': peak_demand_in_kw,
     }
+
+
+@define_columnar(estimate_peak_demand)
+def estimate_peak_demand_by_node(
+        final_consumption_in_kwh_per_year,
+        consumption_during_peak_hours_as_percent_of_total_consumption,
+        peak_hours_of_consumption_per_year):
+    final_consumption_during_peak_hours_in_kwh_per_year = \
+        final_consumption_in_kwh_per_year * \
+        consumption_during_peak_hours_as_percent_of_total_consumption / 100.  # noqa
+    if not np.all(peak_hours_of_consumption_per_year):
+        raise ExpectedPositive('peak_hours_of_consumption_per_year')
+    return {
+        'peak_demand_in_kw': (
+            final_consumption_during_peak_hours_in_kwh_per_year /
+            peak_hours_of_consumption_per_year),
+    }
@@ -12,6 +12,19 @@ def compute_discounted_cash_flow(
     return sum(cash_flow_by_year / discount_rate_as_factor ** year_increments)
 
 
+def compute_discounted_cash_flow_by_node(
+        cash_flow_by_year_by_node, financing_year, discount_rate_as_percent):
+    'Discount the cash flow of each node starting from the year of financing'
+    t = cash_flow_by_year_by_node
+    year_increments = np.array(t.columns - financing_year)
+    year_increments[year_increments < 0] = 0  # Do not discount prior years
+    discount_rate_as_factor = 1 + discount_rate_as_percent / 100.
+    # Add years in order to match compute_discounted_cash_flow exactly
+    return sum(
+        t[year] / discount_rate_as_factor ** year_increment
+        for year, year_increment in zip(t.columns, year_increments))
+
+
 def compute_discounted_cash_flow_xxx(time_value_packs, discount_rate_percent):
     time_value_packs = sort_time_packs(time_value_packs)
     discount_rate_factor = 1 + discount_rate_percent / 100.
@@ -32,6 +32,7 @@ class BasicArgumentParser(TerseArgumentParser):
             'configuration_path', metavar='CONFIGURATION_PATH', nargs='?')
         self.add_argument('-w', '--source_folder', metavar='FOLDER')
         self.add_argument('-o', '--target_folder', metavar='FOLDER')
+        self.add_argument('--columnar', action='store_true')
 
 
 class InfrastructureGraph(Graph):
@@ -50,11 +51,12 @@ class InfrastructureGraph(Graph):
 def load_and_run(
         normalization_functions, main_functions, arguments, keys):
     g = load_arguments(arguments)
+    run_main_functions = run_columnar if g.pop('columnar', False) else run
     save_arguments(g, __file__, keys)
     try:
         g = load_files(g)
         g = normalize_arguments(normalization_functions, g)
-        run(main_functions, g)
+        run_main_functions(main_functions, g)
     except InfrastructurePlanningError as e:
         exit(e)
 
@@ -129,14 +131,62 @@ def run(main_functions, g):
         if '_total_' in f.__name__:
             g.update(compute(f, g))
             continue
-        for node_id, node_d in g['infrastructure_graph'].cycle_nodes():
-            v = merge_dictionaries(node_d, {
-                'node_id': node_id,
-                'local_overrides': dict(g['demand_point_table'].loc[node_id])})
-            node_d.update(compute(f, v, g))
+        run_by_node(f, g)
     return g
 
 
+def run_columnar(main_functions, g):
+    """
+    Run main functions on whole columns of the demand point table.
+
+    Functions that have a columnar version (see define_columnar) receive
+    a Series indexed by node_id for each per-node value and a DataFrame
+    indexed by node_id with one column per year for each per-node value
+    by year. Functions without a columnar version run node by node as in
+    run, which remains the reference path.
+    """
+    table = g['demand_point_table']
+    graph = g['infrastructure_graph'] = get_graph_from_table(table)
+    column_by_key = OrderedDict((k, table[k]) for k in table.columns)
+    for f in main_functions:
+        if '_total_' in f.__name__:
+            g.update(compute(f, g))
+            continue
+        columnar_f = getattr(f, 'columnar', None)
+        value_by_key = compute_columnar(
+            columnar_f, column_by_key, g, table) if columnar_f else None
+        if value_by_key is None:
+            keys = run_by_node(f, g)
+            value_by_key = get_columns_from_graph(graph, keys)
+        else:
+            update_graph_from_columns(graph, value_by_key)
+        column_by_key.update(value_by_key)
+    return g
+
+
+def run_by_node(f, g):
+    'Compute the function for each node and return the keys that changed'
+    keys = set()
+    for node_id, node_d in g['infrastructure_graph'].cycle_nodes():
+        v = merge_dictionaries(node_d, {
+            'node_id': node_id,
+            'local_overrides': dict(g['demand_point_table'].loc[node_id])})
+        value_by_key = compute(f, v, g)
+        node_d.update(value_by_key)
+        keys.update(value_by_key)
+    return keys
+
+
+def define_columnar(f):
+    'Register the decorated function as the columnar version of f'
+
+    def register(columnar_f):
+        f.columnar = columnar_f
+        return columnar_f
+
+    return register
+
+
 def save_shapefile(target_path, geotable):
     if 'wkt' in geotable:
         # Shapefiles expect (x, y) or (longitude, latitude) coordinate order
@@ -210,6 +260,61 @@ def compute_raw(f, l, g=None):
     return f(**keywords)
 
 
+def compute_columnar(f, column_by_key, g, table):
+    """
+    Compute the columnar function using column arguments if possible.
+    Return None if the function cannot handle these arguments, in which
+    case the caller should fall back to computing node by node.
+    """
+    value_by_key = compute_raw(f, column_by_key, g)
+    if value_by_key is None:
+        return
+    index = table.index
+    d = {}
+    for key, value in value_by_key.items():
+        if not hasattr(value, 'index'):
+            value = Series([value] * len(index), index=index)
+        if key in table.columns:
+            local_values = table[key]
+            if hasattr(value, 'columns'):
+                if local_values.notnull().any():
+                    return  # Override yearly values node by node
+            else:
+                value = value.where(local_values.isnull(), local_values)
+        d[key] = value
+    return d
+
+
+def get_columns_from_graph(graph, keys):
+    'Collect per-node values into a Series or DataFrame indexed by node_id'
+    node_ids, node_ds = zip(*graph.cycle_nodes())
+    d = {}
+    for key in keys:
+        values = [node_d.get(key) for node_d in node_ds]
+        if all(isinstance(x, Series) and x.index.equals(
+                values[0].index) for x in values):
+            d[key] = DataFrame(
+                [x.values for x in values], index=node_ids,
+                columns=values[0].index)
+        else:
+            d[key] = Series(values, index=node_ids)
+    return d
+
+
+def update_graph_from_columns(graph, value_by_key):
+    'Distribute whole-table values to each node in the graph'
+    for key, value in value_by_key.items():
+        if hasattr(value, 'columns'):
+            columns = value.columns
+            node_value_by_id = {
+                node_id: Series(values, index=columns)
+                for node_id, values in zip(value.index, value.values)}
+        else:
+            node_value_by_id = value.to_dict()
+        for node_id, node_d in graph.cycle_nodes():
+            node_d[key] = node_value_by_id[node_id]
+
+
 def sum_by_suffix(value_by_key, suffix):
     x = 0
     for k, v in value_by_key.items():
@@ -232,10 +337,19 @@ def get_final_value(value_by_year):
     return value_by_year.loc[sorted(value_by_year.index)[-1]]
 
 
+def get_final_column(value_by_year_by_node):
+    return value_by_year_by_node[sorted(value_by_year_by_node.columns)[-1]]
+
+
 def make_zero_by_year(value_by_year):
     return Series(0, index=value_by_year.index)
 
 
+def make_zero_by_year_by_node(value_by_year_by_node):
+    t = value_by_year_by_node
+    return DataFrame(0, index=t.index, columns=t.columns)
+
+
 def get_graph_from_table(table):
     graph = InfrastructureGraph()
     for index, row in table.iterrows():
@@ -1,2 +1,3 @@
 from networker.algorithms.mod_boruvka import mod_boruvka
 from networker.algorithms.mod_kruskal import mod_kruskal
+from networker.algorithms.mod_delaunay import mod_delaunay
@@ -1,22 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import logging
+
 import numpy as np
 import networkx as nx
 
-from copy import deepcopy
-from rtree import Rtree
 
 from networker.classes.kdtree import KDTree
+from networker.classes.segment_index import SegmentIndex
 from networker.classes.unionfind import UnionFind, PriorityQueue
 from networker.classes.geograph import GeoGraph
 
 from networker.geomath import ang_to_vec_coords, \
                                   spherical_distance, \
                                   euclidean_distance, \
-                                  make_bounding_box, \
                                   line_subgraph_intersection, \
+                                  line_segment_intersections_batch, \
                                   square_distance
 
+log = logging.getLogger('networker')
+
 
 def mod_boruvka(G, subgraphs=None, rtree=None):
 
@@ -36,7 +39,7 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
             connected components AND the 'fake' nodes projected onto it.  This
             is the basis for the agglomerative nearest neighbor approach in
             this algorithm.
-        rtree:  RTree based index of existing network
+        rtree:  SegmentIndex of existing network edges
 
     Returns:
         GeoGraph: representing minimum spanning forest of G subject to the
@@ -48,60 +51,76 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
 
     V = set(G.nodes())
 
-    # GeoGraph coords may be ndarray or dict
-    if isinstance(G.coords, np.ndarray):
-        coords = G.coords
-    else:
-        coords = np.row_stack(G.coords.values())
+    # coords indexed by node (the coords of merged graphs are not
+    # necessarily in node order)
+    coords = G.coords.take(range(len(V)))
 
     projcoords = ang_to_vec_coords(coords) if G.is_geographic() else coords
     kdtree = KDTree(projcoords)
 
-    # Handle "dead" components
-    D = set()
-
     if subgraphs is None:
         if rtree is not None:
             raise ValueError('RTree passed without UnionFind')
 
-        rtree = Rtree()
+        rtree = SegmentIndex()
         # modified to handle queues, children, mv
         subgraphs = UnionFind()
 
+    # Component label and "dead" flag of each node, indexed by node
+    # Dead nodes stay inactive in the kdtree, so that a single query
+    # with the component's own nodes deactivated finds its nearest
+    # foreign neighbor
+    labels = np.zeros(len(projcoords), dtype=int)
+    dead = np.zeros(len(projcoords), dtype=bool)
+    label_by_root = {}
+
+    def get_label(root):
+        return label_by_root.setdefault(root, len(label_by_root))
+
     # <helper_functions>
-    def candidate_components(C):
+    def component_nodes(C):
         """
-        return the set of candidate nearest components for the connected
-        component containing C.  Do not consider those in C's connected
-        component or those that are 'dead'.
+        return the nodes of G in the connected component containing C
         """
-        component_set = subgraphs.component_set(C)
-        return list((V - set(component_set)) - D)
+        return [c for c in subgraphs.component_set(C) if c in V]
 
-    def update_nn_component(C, candidates):
+    def update_nn_component(C, nodes):
         """
         find the nearest neighbor pair for the connected component
-        represented by c.  candidates represents the list of
-        components from which to select.
+        represented by C among the nodes of other components that are
+        not dead.  nodes are the nodes of G in C.
         """
 
+        label = labels[nodes[0]]
         (v, vm) = subgraphs.queues[C].top()
 
         # vm ∈ C {not a foreign nearest neighbor}
         # go through the queue until an edge is found between this node
         # and the set of candidates, updating the neighbors in the connected
         # components queue in the process.
-        while vm not in candidates:
+        excluded = None
+        while labels[vm] == label or dead[vm]:
+            if excluded is None:
+                excluded = [c for c in nodes if not dead[c]]
+                kdtree.set_active(excluded, False)
             subgraphs.queues[C].pop()
-            um, _ = kdtree.query_subset(projcoords[v], candidates)
+            um, _ = kdtree.query_active(projcoords[v])
             dm = square_distance(projcoords[v], projcoords[um])
             subgraphs.push(subgraphs.queues[C], (v, um), dm)
             # Note:  v will always be a vertex in this connected component
             #        vm *may* be external
             (v, vm) = subgraphs.queues[C].top()
 
+        if excluded is not None:
+            kdtree.set_active(excluded, True)
         return (v, vm)
 
+    def has_candidates(nodes):
+        """
+        whether any node outside the component of nodes is not dead
+        """
+        return kdtree.count_active() > sum(1 for c in nodes if not dead[c])
+
     def is_fake(node):
         """
         Tests whether the node is a projection on the existing grid
@@ -113,6 +132,13 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
     def is_dead(c, nn_dist):
         return not is_fake(c) and subgraphs.budget[c] < nn_dist
 
+    def kill(c):
+        """
+        add node c of G to the dead set
+        """
+        dead[c] = True
+        kdtree.set_active(c, False)
+
     # "true" distance between components
     def component_dist(c1, c2):
         dist = 0
@@ -126,8 +152,11 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
 
     # Initialize the connected components holding a single node
     # and push the nearest neighbor into its queue
+    dead_nodes = []
     for v in V:
-        vm, _ = kdtree.query_subset(projcoords[v], list(V - {v}))
+        kdtree.set_active(v, False)
+        vm, _ = kdtree.query_active(projcoords[v])
+        kdtree.set_active(v, True)
         dm = square_distance(projcoords[v], projcoords[vm])
         subgraphs.add_component(v, budget=G._node[v]['budget'])
         subgraphs.push(subgraphs.queues[v], (v, vm), dm)
@@ -138,27 +167,33 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
         if is_dead(v, nn_dist):
             # here components are single nodes
             # so no need to worry about adding children to dead set
-            if v not in D:
-                D.add(v)
+            dead_nodes.append(v)
+
+    for v in V:
+        labels[v] = get_label(subgraphs[v])
+    for v in dead_nodes:
+        kill(v)
 
     Et = []  # Initialize MST edges to empty list
-    last_state = None
+    last_edge_count = None
+    round_index = 0
 
     # MST is complete when no progress was made in the prior iteration
-    while Et != last_state:
+    while len(Et) != last_edge_count:
 
         # This is a candidate list of edges that might be added to the MST
         Ep = PriorityQueue()
 
         # ∀ C of G; where c <- connected component
-        for C in subgraphs.connected_components(component_subset=V):
+        components = set(subgraphs[v] for v in V)
+        for C in components:
 
-            candidates = candidate_components(C)
+            nodes = component_nodes(C)
             # Skip if no valid candidates
-            if not candidates:
+            if not has_candidates(nodes):
                 continue
 
-            (v, vm) = update_nn_component(C, candidates)
+            (v, vm) = update_nn_component(C, nodes)
 
             # Add to dead set if warranted
             nn_dist = component_dist(v, vm)
@@ -166,9 +201,9 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
             if is_dead(C, nn_dist):
                 # add all dead components to the dead set D
                 # (note that fake nodes can never be dead)
-                for c in subgraphs.component_set(C):
-                    if c not in D and not is_fake(c):
-                        D.add(c)
+                for c in nodes:
+                    if not dead[c] and not is_fake(c):
+                        kill(c)
 
         # One more round to root out connections to dead components
         # found in above iteration.
@@ -176,15 +211,15 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
         # Otherwise we might be testing only 'dead' candidates
         # and therefore mistakenly think we were done (since
         # no new edges would have been added)
-        for C in subgraphs.connected_components(component_subset=V):
+        for C in components:
 
-            candidates = candidate_components(C)
+            nodes = component_nodes(C)
 
             # Skip if no valid candidates
-            if not candidates:
+            if not has_candidates(nodes):
                 continue
 
-            (v, vm) = update_nn_component(C, candidates)
+            (v, vm) = update_nn_component(C, nodes)
 
             # Calculate nn_dist for comparison to mv later
             nn_dist = component_dist(v, vm)
@@ -193,7 +228,8 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
             # edge set
             Ep.push((v, vm, nn_dist), nn_dist)
 
-        last_state = deepcopy(Et)
+        last_edge_count = len(Et)
+        candidate_count = len(Ep._queue)
 
         # Candidate Test
         # At this point we have all of our nearest neighbor component edge
@@ -201,8 +237,20 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
         #
         # Now test all candidate edges in Ep for cycles and satisfaction of
         # custom criteria
+        #
+        # The segments of the existing subgraphs that each candidate edge
+        # intersects are found in one pass (those of edges added in this
+        # round are tested edge by edge)
+        candidates = []
         while Ep._queue:
-            (um, vm, dm) = Ep.pop()
+            candidates.append(Ep.pop())
+        segment_count = len(rtree)
+        candidate_segment_ids = line_segment_intersections_batch(
+            rtree, coords[[um for um, _, _ in candidates]],
+            coords[[vm for _, vm, _ in candidates]])
+
+        for (um, vm, dm), segment_ids in zip(candidates,
+                                             candidate_segment_ids):
             # if doesn't create cycle
             # and subgraphs have enough MV
             # and we're not connecting 2 fake nodes
@@ -215,15 +263,23 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
                 # doesn't create cycles from line segment intersection
                 invalid_edge, intersections = \
                     line_subgraph_intersection(subgraphs, rtree,
-                                               coords[um], coords[vm])
+                                               coords[um], coords[vm],
+                                               segment_ids, segment_count)
 
                 print(um, vm, dm, invalid_edge)
                 if not invalid_edge:
                     # edges should not intersect a subgraph more than once
                     assert all(n <= 1 for n in intersections.values())
 
-                    # merge the subgraphs
+                    # merge the subgraphs, relabeling the nodes of the
+                    # component that is absorbed (its children)
+                    roots = (subgraphs[um], subgraphs[vm])
                     subgraphs.union(um, vm, dm)
+                    root = subgraphs[um]
+                    for other_root in roots:
+                        if other_root != root:
+                            labels[[c for c in subgraphs.children[other_root]
+                                    if c in V]] = get_label(root)
 
                     # For all intersected subgraphs update the mv to that
                     # created by the edge intersecting them,
@@ -234,13 +290,15 @@ def mod_boruvka(G, subgraphs=None, rtree=None):
                         intersections.items()))
 
                     # index the newly added edge
-                    box = make_bounding_box(coords[um], coords[vm])
-
-                    # Object is (u.label, v.label), (u.coord, v.coord)
-                    rtree.insert(hash((um, vm)), box,
-                                 obj=((um, vm), (coords[um], coords[vm])))
+                    rtree.insert((um, vm), (coords[um], coords[vm]))
                     Et += [(um, vm, {'weight': dm})]
 
+        round_index += 1
+        log.info("mod_boruvka round {}: {} components, {} candidate edges, "
+                 "{} edges added, {} dead nodes".format(
+                     round_index, len(components), candidate_count,
+                     len(Et) - last_edge_count, int(dead.sum())))
+
     print("G.coords ", len(G.coords))
     print("len(Et) ", len(Et))
     # create new GeoGraph with results
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+import numpy as np
+
+from collections import defaultdict
+from scipy.spatial import cKDTree, Delaunay, QhullError
+
+from networker.classes.segment_index import SegmentIndex
+from networker.classes.unionfind import UnionFind
+
+from networker.geomath import ang_to_vec_coords, \
+                                  spherical_distance_haversine, \
+                                  line_subgraph_intersection
+
+
+def get_candidate_edges(coords, is_geographic=False, neighbor_count=8):
+    """
+    candidate edges for the minimum spanning forest of coords
+
+    The euclidean minimum spanning tree is a subgraph of the Delaunay
+    triangulation, so for planar coords its edges are the candidates.
+    Geographic coords are converted to 3-space where the chord distance
+    orders pairs like the spherical distance, and each node is paired with
+    its neighbor_count nearest neighbors.  The nearest neighbor graph is
+    also used when the planar points are degenerate (e.g. collinear).
+
+    Args:
+        coords:  nx2 array of coordinates indexed by node
+        is_geographic:  whether coords are lon, lat in degrees
+        neighbor_count:  number of nearest neighbors per node for the
+            nearest neighbor graph
+
+    Returns:
+        edges:  mx2 array of unique node pairs (u < v)
+    """
+
+    coords = np.asarray(coords, dtype=float)
+    node_count = len(coords)
+    if node_count < 2:
+        return np.zeros((0, 2), dtype=int)
+
+    edges = None
+    if not is_geographic:
+        try:
+            triangulation = Delaunay(coords)
+        except QhullError:
+            pass
+        else:
+            simplices = triangulation.simplices
+            edges = np.concatenate([simplices[:, [0, 1]],
+                                    simplices[:, [1, 2]],
+                                    simplices[:, [2, 0]]])
+            # coincident points are left out of the triangulation
+            # so pair them with the vertex they coincide with
+            coplanar = triangulation.coplanar
+            edges = np.concatenate([edges, coplanar[:, [0, 2]]])
+
+    if edges is None:
+        points = ang_to_vec_coords(coords) if is_geographic else coords
+        k = min(neighbor_count, node_count - 1) + 1
+        _, neighbors = cKDTree(points).query(points, k=k)
+        edges = np.column_stack([
+            np.repeat(np.arange(node_count), k - 1),
+            neighbors[:, 1:].ravel()])
+
+    edges = np.sort(edges, axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return np.unique(edges, axis=0)
+
+
+def get_edge_weights(coords, edges, is_geographic=False):
+    """
+    distances between the coords of each pair of nodes in edges
+    (computed as by mod_kruskal via the connected weighted graph)
+    """
+
+    coords = np.asarray(coords, dtype=float)
+    if is_geographic:
+        return spherical_distance_haversine(coords[edges])
+    return np.sqrt(np.sum((coords[edges[:, 0]] - coords[edges[:, 1]])**2,
+                          axis=1))
+
+
+def mod_delaunay(G, subgraphs=None, rtree=None, neighbor_count=8):
+
+    """
+    algorithm to compute the euclidean minimum spanning forest of nodes in
+    GeoGraph G with 'budget' based restrictions on edges
+
+    Uses the rules of mod_kruskal, but only tests the edges of the Delaunay
+    triangulation (or the nearest neighbor graph for geographic coords)
+    rather than those of the fully connected graph, so that it runs in
+    O(n log n)
+
+    NOTE:  subgraphs is modified as a side-effect...may remove in future
+        (useful for testing right now)
+
+    Args:
+        G:  GeoGraph of nodes to be connected if appropriate
+            Nodes should have 'budget' attribute
+
+        subgraphs:  UnionFind data structure representing existing network's
+            connected components AND the 'fake' nodes projected onto it.
+
+            NOTE:  ONLY the existing networks components are represented in
+            the subgraphs argument.  The nodes in G will be added within
+            this function
+
+        rtree:  SegmentIndex of existing network edges
+
+        neighbor_count:  number of nearest neighbors tested per node
+            for geographic coords
+
+    Returns:
+        GeoGraph: representing minimum spanning forest of G subject to the
+            budget based restrictions
+    """
+
+    # special case (already MST)
+    if G.number_of_nodes() < 2:
+        return G
+
+    def is_fake(node):
+        """
+        Tests whether the node is a projection on the existing grid,
+        using its MV
+        """
+        return subgraphs.budget[node] == np.inf
+
+    # handy to have coords array (indexed like nodes)
+    nodes = list(G.nodes())
+    coords = G.coords.take(nodes)
+
+    if subgraphs is None:
+        if rtree is not None:
+            raise ValueError('RTree passed without UnionFind')
+
+        rtree = SegmentIndex()
+
+        # modified to handle queues, children, mv
+        subgraphs = UnionFind()
+
+    # add nodes and budgets from G to subgraphs as components
+    for node in G.nodes():
+        subgraphs.add_component(node, budget=G._node[node]['budget'])
+
+    is_geographic = G.is_geographic()
+
+    # Candidate edges (pairs of node indices) are pushed into a heap as
+    # they are found, and neighbors holds the candidate edges of each node
+    heap = []
+    pushed = set()
+    neighbors = defaultdict(set)
+
+    def push_edges(edges, min_weight=0):
+        """
+        push the edges (node pairs) not yet tested with weight at least
+        min_weight
+        """
+        weights = get_edge_weights(coords, edges, is_geographic)
+        for (i, j), w in zip(edges.tolist(), weights.tolist()):
+            if w >= min_weight and (i, j) not in pushed:
+                pushed.add((i, j))
+                neighbors[i].add(j)
+                neighbors[j].add(i)
+                heapq.heappush(heap, (w, i, j))
+
+    # Dead components (without fake nodes) can never connect again, as
+    # their budget is less than the weight of all remaining edges
+    index_by_node = {node: i for i, node in enumerate(nodes)}
+    live = np.ones(len(nodes), dtype=bool)
+    fake_by_root = {}
+
+    def has_fake(C):
+        root = subgraphs[C]
+        if root not in fake_by_root:
+            fake_by_root[root] = any(
+                is_fake(c) for c in subgraphs.component_set(root))
+        return fake_by_root[root]
+
+    def kill(C, w):
+        """
+        remove the nodes of the component containing C from the candidates
+        and push the edges between the nodes around the hole they leave
+        (the Delaunay edges of the remaining nodes that are new)
+        """
+        dead = [index_by_node[c] for c in subgraphs.component_set(C)
+                if c in index_by_node]
+        dead = [i for i in dead if live[i]]
+        live[dead] = False
+        hole = sorted(set(j for i in dead for j in neighbors[i] if live[j]))
+        if len(hole) > 1:
+            hole = np.array(hole)
+            edges = get_candidate_edges(coords[hole], is_geographic,
+                                        neighbor_count)
+            push_edges(hole[edges], w)
+
+    push_edges(get_candidate_edges(coords, is_geographic, neighbor_count))
+
+    # edges in MSF
+    Et = []
+    # connect the shortest safe edge until all edges have been tested
+    # at which point, we have made all possible connections
+    while heap:
+        w, i, j = heapq.heappop(heap)
+        u, v = nodes[i], nodes[j]
+        if not (live[i] and live[j]) or subgraphs[u] == subgraphs[v]:
+            continue
+
+        # if subgraphs have enough MV
+        # and we're not connecting 2 fake nodes
+        # then allow the connection
+        if not ((subgraphs.budget[subgraphs[u]] >= w or is_fake(u)) and
+                (subgraphs.budget[subgraphs[v]] >= w or is_fake(v)) and
+                not (is_fake(u) and is_fake(v))):
+
+            for c in (u, v):
+                if not is_fake(c) and live[index_by_node[c]] and \
+                   subgraphs.budget[subgraphs[c]] < w and not has_fake(c):
+                    kill(c, w)
+            continue
+
+        # doesn't create cycles from line segment intersection
+        invalid_edge, intersections = \
+            line_subgraph_intersection(subgraphs, rtree,
+                                       coords[i], coords[j])
+
+        if not invalid_edge:
+            # edges should not intersect a subgraph more than once
+            assert all(n <= 1 for n in intersections.values())
+
+            # merge the subgraphs
+            subgraphs.union(u, v, w)
+
+            # For all intersected subgraphs update the mv to that
+            # created by the edge intersecting them
+            for node, count in intersections.items():
+                if count == 1 and subgraphs[node] != subgraphs[u]:
+                    subgraphs.union(u, node, 0)
+            fake_by_root.pop(subgraphs[u], None)
+
+            # index the newly added edge
+            rtree.insert((u, v), (coords[i], coords[j]))
+            Et += [(u, v, {'weight': w})]
+
+    # create new GeoGraph with results
+    result = G.copy()
+    result.coords = G.coords
+    result.remove_edges_from(result.edges())
+    result.add_edges_from(Et)
+    return result
@@ -4,15 +4,14 @@ import numpy as np
 import networkx as nx
 
 from copy import deepcopy
-from rtree import Rtree
 
+from networker.classes.segment_index import SegmentIndex
 from networker.classes.unionfind import UnionFind, PriorityQueue
 from networker.classes.geograph import GeoGraph
 
 from networker.geomath import ang_to_vec_coords, \
                                   spherical_distance, \
                                   euclidean_distance, \
-                                  make_bounding_box, \
                                   line_subgraph_intersection, \
                                   square_distance
 
@@ -41,7 +40,7 @@ def mod_kruskal(G, subgraphs=None, rtree=None):
             the subgraphs argument.  The nodes in G will be added within
             this function
 
-        rtree:  RTree based index of existing network
+        rtree:  SegmentIndex of existing network edges
 
     Returns:
         GeoGraph: representing minimum spanning forest of G subject to the
@@ -59,21 +58,21 @@ def mod_kruskal(G, subgraphs=None, rtree=None):
         """
         return subgraphs.budget[node] == np.inf
 
-    # handy to have coords array
-    coords = np.row_stack(G.coords.values())
+    # coords by node
+    coords = G.coords
 
     if subgraphs is None:
-        assert rtree is not None, \
+        assert rtree is None, \
             "subgraphs (disjoint set) required when rtree is passed"
 
-        rtree = Rtree()
+        rtree = SegmentIndex()
 
         # modified to handle queues, children, mv
         subgraphs = UnionFind()
 
     # add nodes and budgets from G to subgraphs as components
     for node in G.nodes():
-        subgraphs.add_component(node, budget=G.node[node]['budget'])
+        subgraphs.add_component(node, budget=G._node[node]['budget'])
 
     # get fully connected graph
     g = G.get_connected_weighted_graph()
@@ -100,25 +99,19 @@ def mod_kruskal(G, subgraphs=None, rtree=None):
 
             if not invalid_edge:
                 # edges should not intersect a subgraph more than once
-                assert(filter(lambda n: n > 1,
-                       intersections.values()) == [])
+                assert all(n <= 1 for n in intersections.values())
 
                 # merge the subgraphs
                 subgraphs.union(u, v, w)
 
                 # For all intersected subgraphs update the mv to that
                 # created by the edge intersecting them
-                map(lambda x: subgraphs.union(u, x[0], 0),
-                    filter(lambda x: x[1] == 1 and
-                    subgraphs[x[0]] != subgraphs[u],
-                    intersections.iteritems()))
+                for node, count in intersections.items():
+                    if count == 1 and subgraphs[node] != subgraphs[u]:
+                        subgraphs.union(u, node, 0)
 
                 # index the newly added edge
-                box = make_bounding_box(coords[u], coords[v])
-
-                # Object is (u.label, v.label), (u.coord, v.coord)
-                rtree.insert(hash((u, v)), box,
-                             obj=((u, v), (coords[u], coords[v])))
+                rtree.insert((u, v), (coords[u], coords[v]))
                 Et += [(u, v, {'weight': w})]
 
     # create new GeoGraph with results
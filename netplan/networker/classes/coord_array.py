@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from collections.abc import Mapping, MutableMapping
+
+
+class CoordArray(MutableMapping):
+
+    def __init__(self, coords=None):
+        """
+        Coordinates of nodes stored as the rows of a contiguous float64
+        array with an index of node id to row.  Reads like a dict of node
+        id to coords (a copy of the row, so that writing to it never
+        changes the store), so that it can stand in for the coords dict of
+        a GeoGraph, while algorithms take the coords of many nodes at once
+        via array or take.
+
+        Copies, subsets and relabeled versions share the array (it is made
+        read-only) until either of them is modified, at which point the
+        modified one gets its own array (copy on write).
+
+        Args:
+            coords:  dict (or CoordArray) of node id to coords or n x k
+                array of the coords of nodes 0..n-1
+        """
+        self._array = np.zeros((0, 0))
+        self._row_by_node = {}
+        # rows of _array in use and whether they are those of the nodes
+        # in order (so that array can be a view)
+        self._size = 0
+        self._ordered = True
+
+        if coords is None:
+            return
+
+        if isinstance(coords, CoordArray):
+            coords._share(self, dict(coords._row_by_node))
+            self._ordered = coords._ordered
+            return
+
+        if isinstance(coords, Mapping):
+            nodes = list(coords.keys())
+            array = np.array([coords[node] for node in nodes], dtype=float)
+        else:
+            array = np.array(coords, dtype=float)
+            nodes = range(len(array))
+
+        self._array = array.reshape(len(array), -1) if len(array) \
+            else np.zeros((0, 0))
+        self._row_by_node = {node: row for row, node in enumerate(nodes)}
+        self._size = len(self._array)
+
+    @property
+    def array(self):
+        """
+        n x k array of the coords in node order (a view of the shared
+        array when possible, so don't modify it)
+        """
+        if self._ordered:
+            return self._array[:self._size]
+        return self.take(self._row_by_node)
+
+    def take(self, nodes):
+        """array of the coords of nodes"""
+        row_by_node = self._row_by_node
+        return self._array[[row_by_node[node] for node in nodes]]
+
+    def extend(self, nodes, coords):
+        """
+        set the coords of nodes from the rows of the array coords
+        (copying them in at once when the nodes are new)
+        """
+        nodes = list(nodes)
+        if not nodes:
+            return
+        coords = np.asarray(coords, dtype=float).reshape(len(nodes), -1)
+        if len(set(nodes)) < len(nodes) or \
+           any(node in self._row_by_node for node in nodes):
+            for node, coord in zip(nodes, coords):
+                self[node] = coord
+            return
+
+        self._own()
+        start, end = self._size, self._size + len(nodes)
+        if self._array.shape[1] != coords.shape[1] and not start:
+            self._array = np.zeros((0, coords.shape[1]))
+        if end > len(self._array):
+            # grow geometrically to keep inserts amortized O(1)
+            self._array = np.concatenate([self._array, np.zeros((
+                max(end - len(self._array), len(self._array), 16),
+                coords.shape[1]))])
+        self._array[start:end] = coords
+        self._row_by_node.update(zip(nodes, range(start, end)))
+        self._size = end
+
+    def subset(self, nodes):
+        """CoordArray of the coords of nodes sharing this array"""
+        row_by_node = self._row_by_node
+        subset = CoordArray()
+        self._share(subset, {node: row_by_node[node] for node in nodes})
+        return subset
+
+    def relabel(self, mapping):
+        """
+        CoordArray sharing this array with the nodes relabeled by mapping
+        (a dict or function as in networkx relabel_nodes)
+        """
+        if not callable(mapping):
+            mapping = (lambda node, mapping=mapping:
+                       mapping.get(node, node))
+        relabeled = CoordArray()
+        self._share(relabeled, {mapping(node): row for node, row in
+                                self._row_by_node.items()})
+        relabeled._ordered = self._ordered and \
+            len(relabeled._row_by_node) == self._size
+        return relabeled
+
+    def copy(self):
+        return CoordArray(self)
+
+    def __deepcopy__(self, memo):
+        # copies are independent as they are copied on write
+        return self.copy()
+
+    def _share(self, other, row_by_node):
+        """give other the row_by_node index into this array"""
+        self._array.flags.writeable = False
+        other._array = self._array
+        other._row_by_node = row_by_node
+        other._size = self._size
+        other._ordered = False
+
+    def _own(self):
+        """copy the coords in use to an array of this CoordArray only"""
+        if self._array.flags.writeable:
+            return
+        self._array = self.take(self._row_by_node)
+        self._row_by_node = {node: row for row, node in
+                             enumerate(self._row_by_node)}
+        self._size = len(self._array)
+        self._ordered = True
+
+    def __getitem__(self, node):
+        return self._array[self._row_by_node[node]].copy()
+
+    def __setitem__(self, node, coord):
+        coord = np.ravel(np.asarray(coord, dtype=float))
+        self._own()
+        row = self._row_by_node.get(node)
+        if row is None:
+            row = self._size
+            if row == len(self._array) or \
+               self._array.shape[1] != len(coord):
+                # grow geometrically to keep inserts amortized O(1)
+                if not row:
+                    self._array = np.zeros((0, len(coord)))
+                self._array = np.concatenate([
+                    self._array,
+                    np.zeros((max(row, 16), len(coord)))])
+            self._row_by_node[node] = row
+            self._size += 1
+        self._array[row] = coord
+
+    def __delitem__(self, node):
+        # the row is left unused
+        del self._row_by_node[node]
+        self._ordered = False
+
+    def __contains__(self, node):
+        return node in self._row_by_node
+
+    def __iter__(self):
+        return iter(self._row_by_node)
+
+    def __len__(self):
+        return len(self._row_by_node)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return self.keys() == other.keys() and all(
+            np.array_equal(self[node], other[node]) for node in self)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, {
+            node: self[node].tolist() for node in self})
@@ -5,10 +5,12 @@ import networkx as nx
 import copy
 import pyproj as prj
 import numpy as np
-from rtree import Rtree
 from itertools import chain
 from collections import deque
+from collections.abc import Mapping
+from networker.classes.coord_array import CoordArray
 from networker.classes.kdtree import KDTree
+from networker.classes.segment_index import SegmentIndex
 import networker.geomath as gm
 import networker.utils as utils
 
@@ -72,7 +74,7 @@ class GeoObject(object):
         if isinstance(self.coords, np.ndarray):
             return range(len(self.coords))
         else:
-            assert(isinstance(self.coords, dict))
+            assert(isinstance(self.coords, Mapping))
             return self.coords.keys()
 
     def lon_lat_to_cartesian_coords(self):
@@ -118,7 +120,8 @@ class GeoGraph(GeoObject, nx.Graph):
 
     Attributes:
         inherited from GeoObject and nx.Graph
-        coords:  coords collection associated with node ids by ix
+        coords:  CoordArray of coords associated with node ids
+            (dicts and arrays assigned to coords are converted)
 
     See Also
     --------
@@ -133,19 +136,35 @@ class GeoGraph(GeoObject, nx.Graph):
         Initialize via both parent classes 
         """
 
-        GeoObject.__init__(self, srs, coords)
+        # CoordArray copies are copied on write (no need to deep copy)
+        GeoObject.__init__(self, srs, None)
+        self.coords = CoordArray(coords)
         nx.Graph.__init__(self, data, **attr)
 
         # handle case where coords have keys not referenced by edges
-        if self.coords is None:
-            self.coords = dict()
+        new_nodes = set(self.coords.keys()) - set(self._node.keys())
+        self.add_nodes_from(new_nodes)
 
-        coord_keys = range(len(self.coords))
-        if isinstance(self.coords, dict):
-            coord_keys = self.coords.keys()
+    @property
+    def coords(self):
+        return self._coords
 
-        new_nodes = set(coord_keys) - set(self._node.keys())
-        self.add_nodes_from(new_nodes)
+    @coords.setter
+    def coords(self, coords):
+        if not isinstance(coords, CoordArray):
+            coords = CoordArray(coords)
+        self._coords = coords
+
+    def subgraph(self, nodes):
+        """
+        networkx subgraph view of nodes with the srs and the coords of its
+        nodes (sharing the coordinate array of this GeoGraph)
+        """
+        subgraph = nx.Graph.subgraph(self, nodes)
+        subgraph.srs = self.srs
+        subgraph.coords = self.coords.subset(
+            node for node in subgraph if node in self.coords)
+        return subgraph
 
     def is_aligned(self):
         """
@@ -154,11 +173,7 @@ class GeoGraph(GeoObject, nx.Graph):
         Useful in case you have a GeoGraph that has its coords/nodes modified
         """
 
-        coord_keys = range(len(self.coords))
-        if isinstance(self.coords, dict):
-            coord_keys = self.coords.keys()
-
-        assert sorted(self.nodes()) == sorted(coord_keys), \
+        assert sorted(self.nodes()) == sorted(self.coords.keys()), \
             "GeoGraph nodes and coords not aligned"
 
         return True
@@ -183,8 +198,8 @@ class GeoGraph(GeoObject, nx.Graph):
         right_geo = right
 
         def coord_iter(geo_coords):
-            if isinstance(geo_coords, dict):
-                return geo_coords.iteritems()
+            if isinstance(geo_coords, Mapping):
+                return geo_coords.items()
             else:
                 return enumerate(geo_coords)
 
@@ -193,7 +208,7 @@ class GeoGraph(GeoObject, nx.Graph):
             nodes = iter(new_nodes)
             d = dict()
             for k, coord in coord_iter(old_coords):
-                d[nodes.next()] = copy.copy(coord)
+                d[next(nodes)] = copy.copy(coord)
             return d
 
         if force_disjoint:
@@ -220,7 +235,7 @@ class GeoGraph(GeoObject, nx.Graph):
 
         Args:
             other:  GeoGraph with nodes to be projected onto this GeoGraph
-            rtree_index:  rtree of edges within self to be used for speeding
+            rtree_index:  SegmentIndex of edges within self to be used for speeding
                 up matching of self edges to other nodes
             spherical_accuracy:  if True, will try to use spherical
                 calculations for more accurate results (only if 
@@ -237,12 +252,11 @@ class GeoGraph(GeoObject, nx.Graph):
         assert self.is_same_srs(other), \
             "Spatial Reference Systems need to match in order to project onto"
 
-        projections = {}
-        for node in other.nodes():
-            edge, coords = self.find_nearest_edge(other.coords[node],
-                                rtree_index=rtree_index, 
-                                spherical_accuracy=spherical_accuracy)
-            projections[node] = (edge, coords)
+        nodes = list(other.nodes())
+        edges, coords = self.find_nearest_edges(
+            other.coords.take(nodes), rtree_index=rtree_index,
+            spherical_accuracy=spherical_accuracy)
+        projections = dict(zip(nodes, zip(edges, coords)))
 
         # create new GeoGraph with others coords
         geo = GeoGraph(other.srs, other.coords)
@@ -272,9 +286,9 @@ class GeoGraph(GeoObject, nx.Graph):
                               spatial_index=None):
 
         if spatial_index is None:
-            spatial_index = KDTree(np.array(self.coords.values()))
+            spatial_index = KDTree(self.coords.array)
    
-        keys = self.coords.keys()
+        keys = list(self.coords.keys())
 
         for i in range(len(keys)):
             # Note:  i is the index of the node in the spatial_index
@@ -349,8 +363,8 @@ class GeoGraph(GeoObject, nx.Graph):
 
         """
 
-        spatial_index = KDTree(np.array(self.coords.values()))
-        node_ids = self.coords.keys()
+        spatial_index = KDTree(self.coords.array)
+        node_ids = list(self.coords.keys())
 
         visited = set()
         for node in self.nodes():
@@ -409,7 +423,7 @@ class GeoGraph(GeoObject, nx.Graph):
 
         Args:
             coord:  coordinate to lookup nearest edge to
-            rtree_index:  rtree of edges within self
+            rtree_index:  SegmentIndex of edges within self
             spherical_accuracy:  if True, will try to use spherical
                 calculations for more accurate projections (only if 
                 is_geographic() is True.  Falls back to euclidean)
@@ -425,10 +439,9 @@ class GeoGraph(GeoObject, nx.Graph):
                                if spherical_accuracy and self.is_geographic()
                                else self._project_onto_edge)
               
-        if rtree_index:
-            nearest_segment = next(rtree_index.nearest(np.ravel((coord, coord)),
-                                                  objects=True))
-            near_edge, coords = nearest_segment.object
+        if rtree_index is not None:
+            nearest_id = rtree_index.nearest(np.ravel((coord, coord)))[0]
+            near_edge = rtree_index.edges[nearest_id]
 
             near_coords = project_on_edge_fun(near_edge, coord)
             
@@ -477,9 +490,8 @@ class GeoGraph(GeoObject, nx.Graph):
             # iterate over candidates intersecting bbox finding nearest
             # to coord as actual nearest must be within bbox of current
             # nearest
-            candidates = rtree_index.intersection(new_bbox, objects=True)
-            for candidate in candidates:
-                c_edge, c_coords = candidate.object
+            for candidate_id in rtree_index.intersection(new_bbox):
+                c_edge = rtree_index.edges[candidate_id]
                 p_coords = project_on_edge_fun(c_edge, coord)
 
                 candidate_dist = gm.euclidean_distance((coord, p_coords))
@@ -506,6 +518,89 @@ class GeoGraph(GeoObject, nx.Graph):
 
             return near_edge, near_coords
 
+    def find_nearest_edges(self, coords, rtree_index=None,
+                           spherical_accuracy=False, chunk_size=10000):
+        """
+        Find the nearest edge to each coordinate in space (batch version of
+        find_nearest_edge)
+
+        The candidate segments of each chunk of coordinates are queried at
+        once and projected onto with array operations, keeping the nearest
+        in the same order as find_nearest_edge does.
+
+        Args:
+            coords:  nx2 array of coordinates to lookup nearest edges to
+            rtree_index:  SegmentIndex of edges within self (built if None)
+            spherical_accuracy:  if True, will try to use spherical
+                calculations for more accurate projections (only if
+                is_geographic() is True.  Falls back to euclidean)
+            chunk_size:  number of coordinates to project at once
+
+        Returns:
+            edges:  list of the nearest edge (tuple of nodes) to each coord
+            projections:  nx2 array of the nearest point on each edge
+
+        """
+        assert len(self.edges()) > 0, "GeoGraph must have edges"
+
+        if rtree_index is None:
+            rtree_index = self.get_rtree_index()
+
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if spherical_accuracy and self.is_geographic():
+            nearest = [self.find_nearest_edge(
+                coord, rtree_index=rtree_index, spherical_accuracy=True)
+                for coord in coords]
+            return [edge for edge, _ in nearest], \
+                np.array([projection for _, projection in nearest])
+
+        segment_ids = np.zeros(len(coords), dtype=int)
+        projections = np.zeros((len(coords), 2))
+        for start in range(0, len(coords), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            segment_ids[chunk], projections[chunk] = \
+                self._find_nearest_segments(coords[chunk], rtree_index)
+        return [rtree_index.edges[i] for i in segment_ids], projections
+
+    def _find_nearest_segments(self, coords, rtree_index):
+        """
+        helper for find_nearest_edges returning the ids of the nearest
+        segments in rtree_index and the projections of coords onto them
+        """
+
+        def project(point_indices, segment_ids):
+            segments = rtree_index.segments[segment_ids]
+            projections = gm.project_points_on_segments(
+                coords[point_indices], segments[:, 0], segments[:, 1])
+            distances = np.sqrt(np.sum(
+                (coords[point_indices] - projections)**2, axis=1))
+            return projections, distances
+
+        # bounding box based nearest segments bound the search for the
+        # actual nearest segments (see find_nearest_edge)
+        point_count = len(coords)
+        near_ids = rtree_index.nearest_v(coords)
+        near_projections, near_distances = project(
+            np.arange(point_count), near_ids)
+
+        candidate_ids, counts = rtree_index.intersection_v(
+            coords - near_distances[:, np.newaxis],
+            coords + near_distances[:, np.newaxis])
+        point_indices = np.repeat(np.arange(point_count), counts)
+        projections, distances = project(point_indices, candidate_ids)
+
+        # keep the first candidate at the minimum distance of each point
+        # if it is nearer than the bounding box based nearest segment
+        order = np.lexsort((np.arange(len(candidate_ids)), distances,
+                            point_indices))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = point_indices[order][1:] != point_indices[order][:-1]
+        best = order[is_first]
+        best = best[distances[best] < near_distances[point_indices[best]]]
+        near_ids[point_indices[best]] = candidate_ids[best]
+        near_projections[point_indices[best]] = projections[best]
+        return near_ids, near_projections
+
     def get_coord_edge_set(self):
         """
         get edges as a set of frozensets of coordinate pairs
@@ -585,33 +680,16 @@ class GeoGraph(GeoObject, nx.Graph):
 
     def get_rtree_index(self):
         """
-        Get an rtree index of the edges within this GeoGraph
+        Get a spatial index of the edges within this GeoGraph
 
         Returns:
-            rtree:  rtree of edges indexed by bounding_box (4 coordinates)
-                allowing lookup of the edge (node1, node2) and it's segment
-        """
-        def edge_generator():
-            edges_bounds = map(lambda tup: (tup, gm.make_bounding_box(
-                    *map(lambda n: self.coords[n], tup))), self.edges())
-
-            for edge, box in edges_bounds:
-                # Object is in form of (u.label, v.label), (u.coord, v.coord)
-                yield (hash(edge), box, (edge,
-                                         map(lambda ep:
-                                             np.array(self.coords[ep]), edge)))
-
-        # something's not working right with latest version of rtree/spatialib
-        # index where we need to insert the objects in a loop rather than
-        # via a generator to their constructor
-        # Init rtree and store grid edges
-        rtree = Rtree()
-        for e in edge_generator():
-            # takes id, bbox, and segment/edge
-            obj = [(x, y) for (x, y) in e[2]]
-            rtree.insert(e[0], e[1], obj=obj)
-
-        return rtree
+            SegmentIndex:  bulk loaded index of edges by bounding box
+                (4 coordinates) allowing lookup of the edge (node1, node2)
+                and its segment by id
+        """
+        edges = list(self.edges())
+        segments = self.coords.take(node for edge in edges for node in edge)
+        return SegmentIndex(edges, segments)
 
     def find_zero_len_edges(self):
         """
@@ -622,5 +700,5 @@ class GeoGraph(GeoObject, nx.Graph):
         """
 
         for edge in self.edges():
-            if self.coords[edge[0]] == self.coords[edge[1]]:
+            if np.array_equal(self.coords[edge[0]], self.coords[edge[1]]):
                 yield edge
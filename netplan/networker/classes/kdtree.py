@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import numpy as np
-# from numba import jit
-from collections import deque
 
-# @jit
+from bisect import bisect_left
+
+
 def distance(u, v):
     return np.sum((u - v)**2)
 
@@ -12,10 +12,16 @@ class KDTree(object):
 
     def __init__(self, data, index=None, depth=0):
         """
-        Creates a recursive space partitioning DataStructure where each node
-        splits the dimension at the median of that axis. Similar to a BST,
+        Creates a space partitioning DataStructure where each node splits
+        the dimension at the median of that axis. Similar to a BST,
         provides O(n log n) creation and O(log n) queries.
 
+        The tree is stored flat:  points are permuted so that every subtree
+        covers a contiguous range of positions with its node at the middle
+        of the range.  Counting the active points of a subtree is then a
+        difference of two prefix sums, so that constrained queries skip
+        subtrees without active points.
+
         Args:
             data  (np.array): dataset with shape n, k (n obs, k dim).
 
@@ -34,181 +40,209 @@ class KDTree(object):
         if isinstance(index, type(None)):
             index = np.arange(data.shape[0])
 
-        self.n = None
-        self.k = None
-        self.idx = None
-        self.node = None
-        self.axis = None
-        self.left = None
-        self.right = None
-        self.children = None
-
-        self._build(data, index, depth)
+        self.data = data
+        self.n, self.k = data.shape[0], data.shape[1]
+        self._build(data, np.asarray(index, dtype=int), depth)
+        self.reset_active()
 
     def _build(self, data, index, depth):
-        """Recursively builds the child nodes of the KDTree"""
-        # If there is data to partition create nodes
-        if data[index].size:
-
-            # Store the dimensions of the data and the axis to partition on
-            self.n, self.k = data[index].shape
-            self.axis = (self.k + depth) % self.k
-
-            # list of nodes beneath this node
-            self.children = index
-
-            # Find the index of the data sorted on the current axis
-            # and the midpoint in which to partition
-            idx_data = np.column_stack((data[index], index))
-            sort_ax = idx_data[np.argsort(idx_data[:, self.axis]), -1].\
-                astype(int)
-            partition = int(sort_ax.size / 2)
-
-            # Node index and data
-            self.idx = sort_ax[partition]
-            self.node = data[self.idx]
-
-            # Build the branches, partitioning on the next axis
-            self.left = KDTree(data, sort_ax[:partition], depth+1)
-            self.right = KDTree(data, sort_ax[partition+1:], depth+1)
-
-    def near_branch(self, point):
-        """Returns the branch nearest the input point"""
-        if point[self.axis] < self.node[self.axis]:
-            return self.left
-        return self.right
-
-    def far_branch(self, point):
-        """Returns the branch furthest the input point"""
-        if self.near_branch(point) == self.left:
-            return self.right
-        return self.left
-
-    def orthogonal_dist(self, point):
-        """computes the distance from a point to the partition"""
-        orth_point = np.copy(point)
-        alt_axes = np.arange(self.k) != self.axis
-        orth_point[alt_axes] = self.node[alt_axes]
-        return distance(orth_point, self.node)
-
-    def breadth_first_trees(self):
-        """ generate all sub-trees in bf order from self """
-        if self.node is None:
-            return
-
-        queue = deque()
-        queue.append(self)
-        while len(queue) > 0:
-            kdt = queue.popleft()
-            yield kdt
-            if kdt.left.node is not None:
-                queue.append(kdt.left)
-            if kdt.right.node is not None:
-                queue.append(kdt.right)
-
-        
-    def query(self, point, best=None):
+        """Partitions the points level by level to lay out the flat tree"""
+        m = index.size
+        coords = data[index]
+        # Sort once per axis and then only regroup by range at each level
+        orders_by_axis = [np.argsort(coords[:, axis], kind='stable')
+                          for axis in range(self.k)]
+        order = np.arange(m)
+        label_by_point = np.zeros(m, dtype=int)
+        axes = np.zeros(m, dtype=int)
+        lows = np.zeros(m, dtype=int)
+        highs = np.zeros(m, dtype=int)
+        lefts = np.full(m, -1, dtype=int)
+        rights = np.full(m, -1, dtype=int)
+        parents = np.full(m, -1, dtype=int)
+        # Positions that start a range of the current partition
+        is_start = np.zeros(m, dtype=bool)
+        is_start[:1] = True
+
+        range_lows = np.zeros(min(m, 1), dtype=int)
+        range_highs = np.full(min(m, 1), m, dtype=int)
+        range_parents = np.full(min(m, 1), -1, dtype=int)
+        while range_lows.size:
+            axis = (self.k + depth) % self.k
+            # Sort each range on the current axis without moving the others
+            label_by_point[order] = np.cumsum(is_start)
+            axis_order = orders_by_axis[axis]
+            order = axis_order[np.argsort(
+                label_by_point[axis_order], kind='stable')]
+
+            mids = range_lows + (range_highs - range_lows) // 2
+            axes[mids] = axis
+            lows[mids] = range_lows
+            highs[mids] = range_highs
+            parents[mids] = range_parents
+            has_parent = range_parents >= 0
+            parent_mids = range_parents[has_parent]
+            is_left = mids[has_parent] < parent_mids
+            lefts[parent_mids[is_left]] = mids[has_parent][is_left]
+            rights[parent_mids[~is_left]] = mids[has_parent][~is_left]
+
+            is_start[mids] = True
+            is_start[mids[mids + 1 < m] + 1] = True
+
+            has_left = mids > range_lows
+            has_right = mids + 1 < range_highs
+            range_lows, range_highs, range_parents = [np.concatenate(
+                pair) for pair in [
+                (range_lows[has_left], mids[has_right] + 1),
+                (mids[has_left], range_highs[has_right]),
+                (mids[has_left], mids[has_right])]]
+            depth += 1
+
+        order = index[order]
+        self.idx_by_position = order
+        self.position_by_idx = np.full(order.max() + 1 if m else 0, -1)
+        self.position_by_idx[order] = np.arange(m)
+        self.root = m // 2 if m else -1
+        self._points = data[order].tolist()
+        self._axes = axes.tolist()
+        self._lows = lows.tolist()
+        self._highs = highs.tolist()
+        self._lefts = lefts.tolist()
+        self._rights = rights.tolist()
+        self._parents = parents.tolist()
+        self._indices = order.tolist()
+
+    def reset_active(self, subset=None):
+        """
+        Marks the points of subset (all points by default) as the only
+        active ones for query_active
+        """
+        m = len(self._indices)
+        is_active = np.zeros(m, dtype=bool)
+        if subset is None:
+            is_active[:] = True
+        else:
+            is_active[self._get_positions(subset)] = True
+        self._is_active = is_active.tolist()
+        # Active points below each node, including the node
+        cumulative = np.concatenate([[0], np.cumsum(is_active)])
+        self._active_counts = (
+            cumulative[self._highs] - cumulative[self._lows]).tolist()
+
+    def set_active(self, indices, active=True):
+        """
+        Activates or deactivates points, updating the active count of every
+        subtree above them in O(log n) per point
+        """
+        for position in self._get_positions(indices).tolist():
+            if self._is_active[position] == active:
+                continue
+            self._is_active[position] = active
+            change = 1 if active else -1
+            while position >= 0:
+                self._active_counts[position] += change
+                position = self._parents[position]
+
+    def count_active(self):
+        """Returns the number of active points"""
+        return self._active_counts[self.root] if self.root >= 0 else 0
+
+    def _get_positions(self, indices):
+        return self.position_by_idx[np.atleast_1d(np.asarray(indices,
+                                                             dtype=int))]
+
+    def query(self, point):
         """Find the nearest neighbor of point in KDTree"""
+        return self._query(point, None)
+
+    def query_active(self, point):
+        """Find the nearest neighbor of point among the active points"""
+        active_counts = self._active_counts
+        is_active = self._is_active
+        return self._query(
+            point, lambda position: active_counts[position],
+            lambda position: is_active[position])
 
-        # Dead end backtrack up the tree
-        if self.node is None:
-            return best
+    def query_subset(self, point, subset):
+        """
+        Find the nearest neighbor of point in subset, counting the points of
+        subset below each visited node by bisecting their sorted positions
+        """
+        positions = np.sort(self._get_positions(subset)).tolist()
+        lows, highs = self._lows, self._highs
 
-        # Initialize best
-        if best is None:
-            best = (self.idx, self.node)
+        def count_active(position):
+            return bisect_left(positions, highs[position]) - \
+                bisect_left(positions, lows[position])
 
-        # check if current node is closer than best
-        if distance(self.node, point) < distance(best[1], point):
-            best = (self.idx, self.node)
+        def is_active(position):
+            i = bisect_left(positions, position)
+            return i < len(positions) and positions[i] == position
 
-        # continue traversing the tree
-        best = self.near_branch(point).query(point, best)
+        return self._query(point, count_active, is_active)
 
-        # traverse the away branch if the orthogonal distance is less than best
-        if self.orthogonal_dist(point) < distance(best[1], point):
-            best = self.far_branch(point).query(point, best)
-        return best
+    def _query(self, point, count_active=None, is_active=None):
+        """
+        Searches the near branch of every node before the far one and skips
+        subtrees that are too far away or have no active points
+        """
+        if self.root < 0:
+            return None
+        point = [float(value) for value in point]
+        points, axes = self._points, self._axes
+        lefts, rights = self._lefts, self._rights
+        best_position, best_distance = -1, np.inf
+        stack = [(self.root, 0.)]
+        while stack:
+            position, bound = stack.pop()
+            if bound >= best_distance:
+                continue
+            if count_active is not None and not count_active(position):
+                continue
+            node = points[position]
+            if is_active is None or is_active(position):
+                d = sum((a - b) ** 2 for a, b in zip(node, point))
+                if d < best_distance:
+                    best_position, best_distance = position, d
+            axis = axes[position]
+            offset = point[axis] - node[axis]
+            if offset < 0:
+                near, far = lefts[position], rights[position]
+            else:
+                near, far = rights[position], lefts[position]
+            if far >= 0:
+                stack.append((far, offset * offset))
+            if near >= 0:
+                stack.append((near, 0.))
+        if best_position < 0:
+            return None
+        idx = self._indices[best_position]
+        return idx, self.data[idx]
 
     def query_radius(self, point, radius):
         """Find the nodes within radius of point"""
-
-        if self.node is None:
+        if self.root < 0:
             return
-
-        # check if current node is within radius
-        # Note:  distance is square distance
-        if distance(self.node, point) <= radius**2:
-            yield (self.idx, self.node)
-
-        # continue traversing the tree
-        # TODO:  upgrade to python3 so we can use the cleaner 'yield from'
-        for kdt in self.near_branch(point).query_radius(point, radius):
-            yield kdt
-            
-        # traverse the away branch if the orthogonal distance <= radius
-        if self.orthogonal_dist(point) <= radius:
-            for kdt in self.far_branch(point).query_radius(point, radius):
-                yield kdt
-
-
-    def query_subset(self, point, subset):
-        """Find the nearest neighbor of point in subset"""
-        subset_vec = np.zeros(self.n)
-        subset_vec[subset] = 1
-
-        return self._query_subset(point, subset_vec, None)
-
-    def _query_subset(self, point, subset, best=None):
-        """Recursively implements constrained nearest neighbor search"""
-
-        # Dead end backtrack up the tree
-        if self.node is None:
-            return best
-
-        # Initialize node vectors
-        idx_vec = np.empty_like(subset)
-        child_vec = np.empty_like(subset)
-        idx_vec[:] = child_vec[:] = 0
-        idx_vec[self.idx] = child_vec[self.children] = 1
-
-        # if point in subset, try to update best
-        if np.dot(idx_vec, subset) != 0:
-            # if closer than current best, or best is none update
-            # is_closer is a thunk to prevent '__getitem__' error
-            is_closer = lambda: distance(self.node, point) < \
-                                distance(best[1], point)
-            if best is None or is_closer():
-                best = (self.idx, self.node)
-
-        near = self.near_branch(point)
-        far = self.far_branch(point)
-
-        # check the near branch, if its nodes intersect with the queried subset
-        # otherwise move to the away branch
-
-        # Below logic doesn't make sense.  Why traverse the "far"
-        # branch if we know the "best" cannot be in any of the children
-        # if np.dot(child_vec, subset) > 0:
-        #    best = near._query_subset(point, subset, best)
-        # else:
-        #    best = far._query_subset(point, subset, best)
-
-        # This logic makes more sense
-        children_in_subset = (np.dot(child_vec, subset) > 0)
-        if children_in_subset:
-            best = near._query_subset(point, subset, best)
-        else:
-            # otherwise, the best is not anywhwere below this
-            # so the current best is best
-            return best
-
-        # validate best, by ensuring closer point doesn't exist just beyond
-        # partition if best still has yet to be found also look
-        # into this further branch
-        if (best is not None and
-            self.orthogonal_dist(point) < distance(best[1], point)) or \
-           best is None:
-            best = far._query_subset(point, subset, best)
-
-        return best
+        point = [float(value) for value in point]
+        square_radius = radius ** 2
+        points, axes = self._points, self._axes
+        lefts, rights = self._lefts, self._rights
+        stack = [self.root]
+        while stack:
+            position = stack.pop()
+            node = points[position]
+            # Note:  distance is square distance
+            if sum((a - b) ** 2 for a, b in zip(node, point)) <= \
+                    square_radius:
+                idx = self._indices[position]
+                yield (idx, self.data[idx])
+            axis = axes[position]
+            offset = point[axis] - node[axis]
+            if offset < 0:
+                near, far = lefts[position], rights[position]
+            else:
+                near, far = rights[position], lefts[position]
+            if far >= 0 and offset * offset <= square_radius:
+                stack.append(far)
+            if near >= 0:
+                stack.append(near)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from rtree import Rtree
+
+
+class SegmentIndex(object):
+
+    def __init__(self, edges=(), segments=None):
+        """
+        Spatial index of the bounding boxes of segments (edges).  When built
+        from existing edges, the rtree is bulk loaded (STR packed) from
+        arrays rather than by inserting the edges one at a time.
+
+        Each segment is referenced by an integer id, its position in edges
+        and the row of its endpoint coords in segments, so that index hits
+        are looked up in arrays instead of unpickling stored objects.
+
+        Args:
+            edges:  sequence of (node1, node2) tuples
+            segments:  array of shape (len(edges), 2, 2) with the endpoint
+                coords of each edge
+        """
+        self.edges = list(edges)
+        count = len(self.edges)
+        self._segments = np.zeros((count, 2, 2))
+        if segments is not None:
+            self._segments[:] = np.reshape(segments, (count, 2, 2))
+
+        if count:
+            self.rtree = Rtree((
+                np.arange(count, dtype=np.int64),
+                self._segments.min(axis=1),
+                self._segments.max(axis=1)))
+        else:
+            self.rtree = Rtree()
+
+    def __len__(self):
+        return len(self.edges)
+
+    @property
+    def segments(self):
+        """Endpoint coords of the segments by id"""
+        return self._segments[:len(self.edges)]
+
+    def insert(self, edge, segment):
+        """Adds edge with endpoint coords segment, returning its id"""
+        segment_id = len(self.edges)
+        if segment_id == len(self._segments):
+            # grow geometrically to keep inserts amortized O(1)
+            self._segments = np.concatenate([
+                self._segments, np.zeros((max(segment_id, 16), 2, 2))])
+        self._segments[segment_id] = segment
+        self.edges.append(edge)
+        box = np.concatenate([self._segments[segment_id].min(axis=0),
+                              self._segments[segment_id].max(axis=0)])
+        self.rtree.insert(segment_id, box.tolist())
+        return segment_id
+
+    def intersection(self, box):
+        """
+        ids of the segments whose bounding box intersects box
+        (min_x, min_y, max_x, max_y)
+        """
+        return np.fromiter(self.rtree.intersection(box), dtype=int)
+
+    def nearest(self, box, count=1):
+        """
+        ids of the count segments whose bounding box is nearest box
+        (more on ties)
+        """
+        return np.fromiter(self.rtree.nearest(box, count), dtype=int)
+
+    def intersection_v(self, mins, maxs):
+        """
+        ids of the segments whose bounding box intersects each of the boxes
+        with (n x 2) corners mins and maxs, concatenated, with the count
+        of ids for each box
+        """
+        ids, counts = self.rtree.intersection_v(
+            np.asarray(mins, dtype=float), np.asarray(maxs, dtype=float))
+        return ids.astype(int), counts.astype(int)
+
+    def nearest_v(self, points):
+        """
+        id of the segment whose bounding box is nearest each of the (n x 2)
+        points (the first one on ties)
+        """
+        points = np.asarray(points, dtype=float)
+        ids, counts = self.rtree.nearest_v(points, points)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+        return ids[starts].astype(int)
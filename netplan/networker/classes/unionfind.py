@@ -4,16 +4,13 @@
 UnionFind class definition (from networkx lib) with modifications to
 support custom boruvka-based Min Spanning Forest algorithm.
 
-Supplemental PriorityQueue class is also defined in here
+Supplemental PriorityQueue and PairingHeap classes are also defined in here
 """
 
 import heapq
 import numpy as np
 
-
-class Dict(dict):
-    """dictionary allowing weakref"""
-    pass
+from collections.abc import MutableMapping
 
 
 class UnionFind:
@@ -37,6 +34,16 @@ class UnionFind:
             modified Boruvkas algorithm. The original citations are listed
             below.
 
+            Objects are indexed in the order they are added and the parent,
+            weight and budget of each are kept in arrays.  The members of
+            each set are linked in a list through the next array, so that
+            union appends one list to the other in O(1), and the queue of
+            each set is a PairingHeap, so that union melds them in O(1).
+            The set of roots is updated by union rather than recomputed.
+
+            parents, weights, budget, children and queues are dict-like
+            views by object.
+
         NetworkX Citations
         ==================
         Union-find data structure. Based on Josiah Carlson's code,
@@ -45,34 +52,79 @@ class UnionFind:
         http://www.ics.uci.edu/~eppstein/PADS/UnionFind.py
 
         """
-        self.weights = {}
-        self.budget = {}
-        self.parents = {}
-        # This was previously used such that modifying it changed all refs
-        # pointing here
-        self.children = Dict()
-        self.queues = {}
+        self._objects = []
+        self._index_by_object = {}
+        self._parents = np.zeros(0, dtype=int)
+        self._weights = np.zeros(0)
+        self._budgets = np.zeros(0)
+        # next member in the list of the set (-1 at its end) and the last
+        # member of the list of each set (as of when it was a root)
+        self._next = np.zeros(0, dtype=int)
+        self._tails = np.zeros(0, dtype=int)
+        self._queues = []
+        self._roots = set()
+
+        self.parents = _ObjectView(
+            self, get=lambda i: self._objects[self._parents[i]])
+        self.weights = _ObjectView(self, array_name='_weights')
+        self.budget = _ObjectView(self, array_name='_budgets')
+        self.children = _ObjectView(self, get=self._children)
+        self.queues = _ObjectView(
+            self, get=lambda i: self._queues[self._find(i)])
 
     def __getitem__(self, object):
         """Find and return the name of the set containing the object."""
         # check for previously unknown object
-        if object not in self.parents:
+        i = self._index_by_object.get(object)
+        if i is None:
             self.add_component(object)
             return object
 
-        # find path of objects leading to the root
-        path = [object]
-        root = self.parents[object]
-        while root != path[-1]:
-            path.append(root)
-            root = self.parents[root]
+        return self._objects[self._find(i)]
+
+    def _find(self, i):
+        """index of the root of the set of index i (compressing its path)"""
+        parents = self._parents
+        root = i
+        while parents[root] != root:
+            root = parents[root]
 
         # compress the path and return
-        for ancestor in path:
-            self.parents[ancestor] = root
+        while parents[i] != root:
+            parents[i], i = root, parents[i]
 
         return root
 
+    def __contains__(self, object):
+        return object in self._index_by_object
+
+    def __len__(self):
+        return len(self._objects)
+
+    def _extend(self, objects):
+        """index objects (not yet added) as singleton sets"""
+        start = len(self._objects)
+        end = start + len(objects)
+        if end > len(self._parents):
+            # grow geometrically to keep additions amortized O(1)
+            capacity = max(end, 2 * len(self._parents), 16)
+            for name in ('_parents', '_weights', '_budgets', '_next',
+                         '_tails'):
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:start] = array[:start]
+                setattr(self, name, grown)
+
+        indices = np.arange(start, end)
+        self._parents[start:end] = indices
+        self._next[start:end] = -1
+        self._tails[start:end] = indices
+        self._objects.extend(objects)
+        self._index_by_object.update(zip(objects, range(start, end)))
+        self._queues.extend(PairingHeap() for _ in objects)
+        self._roots.update(range(start, end))
+        return start, end
+
     def add_component(self, object, budget=0, weight=1):
         """
         Add standalone component to the UnionFind structure by
@@ -86,18 +138,108 @@ class UnionFind:
             weight:  The weight associated with this node for agglomeration
         """
         # only add if not already here
-        if object not in self.parents:
-            self.parents[object] = object
-            self.weights[object] = weight
-            self.budget[object] = budget
-            self.children[object] = [object]
-            self.queues[object] = PriorityQueue()
+        if object not in self._index_by_object:
+            i, _ = self._extend([object])
+            self._weights[i] = weight
+            self._budgets[i] = budget
+
+    def add_components(self, objects, budgets, labels=None):
+        """
+        Bulk version of adding objects as components and unioning each of
+        them with the first object of the same label at distance 0, so that
+        the first object of each label is the root of its set
+
+        The budget of the root is the sum of the budgets of the set and
+        each object is left with the running sum, as with union.
+
+        Args:
+            objects:  identifiers for the components (not yet added)
+            budgets:  The budget allocated to each object
+            labels:  The set label of each object (all in one set if None)
+        """
+        objects = list(objects)
+        budgets = np.asarray(budgets, dtype=float).reshape(len(objects))
+        if labels is None:
+            labels = np.zeros(len(objects), dtype=int)
+
+        assert not any(o in self._index_by_object for o in objects), \
+            "objects must not be added already"
+
+        # number the labels in order of first appearance
+        _, first, inverse = np.unique(
+            labels, return_index=True, return_inverse=True)
+        group_by_label = np.argsort(np.argsort(first, kind='stable'))
+        groups = group_by_label[np.ravel(inverse)]
+
+        if np.isinf(budgets).any():
+            # union treats infinite budgets ('fake' nodes) differently
+            for o, budget in zip(objects, budgets):
+                self.add_component(o, budget=budget)
+            roots = {}
+            for o, group in zip(objects, groups.tolist()):
+                if group in roots:
+                    self.union(roots[group], o, 0)
+                else:
+                    roots[group] = o
+            return
+
+        start, end = self._extend(objects)
+        # stable sort keeps the order of the objects within each set
+        order = np.argsort(groups, kind='stable')
+        members = start + order
+        sizes = np.bincount(groups)
+        ends = np.cumsum(sizes)
+        starts = ends - sizes
+        roots = members[starts]
+
+        # running sums of the budgets within each set, as left by union
+        running = np.zeros(len(objects))
+        for group_start, group_end in zip(starts.tolist(), ends.tolist()):
+            running[group_start:group_end] = np.cumsum(
+                budgets[order[group_start:group_end]])
+
+        self._roots.difference_update(range(start, end))
+        self._roots.update(roots.tolist())
+        self._parents[members] = np.repeat(roots, sizes)
+        self._weights[start:end] = 1
+        self._weights[roots] = sizes
+        self._budgets[members] = running
+        self._budgets[roots] = running[ends - 1]
+        self._next[members[:-1]] = members[1:]
+        self._next[members[ends - 1]] = -1
+        self._tails[roots] = members[ends - 1]
+
+    def add_fake_components(self, objects, members):
+        """
+        Bulk version of adding objects as components with infinite budget
+        ('fake' nodes) and unioning each of them with the set of its member
+        at distance 0, which leaves the budgets of the sets as they are
+
+        Args:
+            objects:  identifiers for the fake components (not yet added)
+            members:  member of the set each object is unioned with
+        """
+        objects = list(objects)
+        member_indices = [self._index_by_object[m] for m in members]
+        if np.isinf(self._budgets[member_indices]).any():
+            raise Exception('Path between fakes nodes')
+
+        start, end = self._extend(objects)
+        self._roots.difference_update(range(start, end))
+        self._budgets[start:end] = np.inf
+        self._weights[start:end] = 1
+        for i, member in zip(range(start, end), member_indices):
+            root = self._find(member)
+            self._parents[i] = root
+            self._weights[root] += 1
+            self._next[self._tails[root]] = i
+            self._tails[root] = i
 
     def __iter__(self):
         """
         Iterate through all items ever found or unioned by this structure
         """
-        return iter(self.parents)
+        return iter(self._objects)
 
     def push(self, queue, item, priority):
         """Pushes an item into component queue"""
@@ -115,44 +257,48 @@ class UnionFind:
             g2 (obj): Key of a member in the disjoint sets
              d (Num): distance between g1 and g2
         """
-        graphs = [g1, g2]
-        point_budget = np.array([self.budget[g1], self.budget[g2]])
-
-        fake = point_budget == np.inf
+        i1, i2 = self._index_by_object[g1], self._index_by_object[g2]
+        fake1 = self._budgets[i1] == np.inf
+        fake2 = self._budgets[i2] == np.inf
 
-        if all(fake):
+        if fake1 and fake2:
             raise Exception('Path between fakes nodes')
 
-        if any(fake):
-            real = graphs[np.array([0, 1])[~fake][0]]
-            grid = graphs[np.array([0, 1])[fake][0]]
-
-            heaviest = self[real]
-            smallest = self[grid]
+        if fake1 or fake2:
+            real, grid = (i2, i1) if fake1 else (i1, i2)
+            heaviest = self._find(real)
+            smallest = self._find(grid)
         else:
-            max_w = np.argmax([self.weights[x] for x in graphs])
-            heaviest = self[graphs[max_w]]
-            smallest = self[graphs[~max_w]]
+            # the set of the (first) heaviest object is heaviest
+            if self._weights[i2] > self._weights[i1]:
+                i1, i2 = i2, i1
+            heaviest = self._find(i1)
+            smallest = self._find(i2)
+
+        if heaviest == smallest:
+            return
 
-        self.weights[heaviest] += self.weights[smallest]
-        self.parents[smallest] = heaviest
+        self._weights[heaviest] += self._weights[smallest]
+        self._parents[smallest] = heaviest
+        self._roots.discard(smallest)
 
-        self.children[heaviest] += self.children[smallest]
-        self.children[smallest] = self.children[heaviest]
+        # append the list of members of smallest (the tail of smallest is
+        # kept to tell its members as of now)
+        self._next[self._tails[heaviest]] = smallest
+        self._tails[heaviest] = self._tails[smallest]
 
-        self.queues[heaviest].merge(self.queues[smallest])
-        self.queues[smallest] = self.queues[heaviest]
+        self._queues[heaviest].merge(self._queues[smallest])
 
-        if any(fake):
+        if fake1 or fake2:
             # if the fake node is also a parent component
             if grid == smallest:
                 # only set the parent budget, leave fake node budget alone so
                 # that it continues to have 'infinite' budget
-                self.budget[heaviest] -= d
+                self._budgets[heaviest] -= d
                 return
 
-        self.budget[heaviest] += self.budget[smallest] - d
-        self.budget[smallest] = self.budget[heaviest]
+        self._budgets[heaviest] += self._budgets[smallest] - d
+        self._budgets[smallest] = self._budgets[heaviest]
 
     def connected_components(self, component_subset=None):
         """Return the roots for all disjoint sets
@@ -165,11 +311,10 @@ class UnionFind:
             connected_components
         """
         if component_subset:
-            return set([self[r] for r in self if
-                       any(c in component_subset
-                           for c in self.children[self[r]])])
+            return set([self[c] for c in component_subset
+                        if c in self._index_by_object])
         else:
-            return set([self[r] for r in self])
+            return set([self._objects[r] for r in self._roots])
 
     def component_set(self, component):
         """Return the component set of the objects
@@ -181,7 +326,54 @@ class UnionFind:
             List of nodes in the same set as n
         """
 
-        return [c for c in self.children[self[component]]]
+        self[component]
+        return self._children(self._find(self._index_by_object[component]))
+
+    def _children(self, i):
+        """
+        objects in the list of members from index i to the tail of i
+        (all members of the set for a root, and the members of a former
+        root as of when it was unioned into another set)
+        """
+        objects, next_, tail = self._objects, self._next, self._tails[i]
+        children = [objects[i]]
+        while i != tail:
+            i = next_[i]
+            children.append(objects[i])
+        return children
+
+
+class _ObjectView(MutableMapping):
+
+    def __init__(self, union_find, array_name=None, get=None):
+        """
+        dict-like view by object of the array named array_name of
+        union_find (indexed like its objects) or of get(index) (read-only)
+        """
+        self._union_find = union_find
+        self._array_name = array_name
+        self._get = get
+
+    def __getitem__(self, object):
+        i = self._union_find._index_by_object[object]
+        if self._get is not None:
+            return self._get(i)
+        return getattr(self._union_find, self._array_name)[i]
+
+    def __setitem__(self, object, value):
+        if self._get is not None:
+            raise TypeError('view is read-only')
+        i = self._union_find._index_by_object[object]
+        getattr(self._union_find, self._array_name)[i] = value
+
+    def __delitem__(self, object):
+        raise TypeError('objects cannot be removed')
+
+    def __iter__(self):
+        return iter(self._union_find._objects)
+
+    def __len__(self):
+        return len(self._union_find._objects)
 
 
 class PriorityQueue(object):
@@ -241,3 +433,140 @@ class PriorityQueue(object):
             return self._queue[0][-1]
         except:
             return None
+
+
+class PairingHeap(object):
+
+    def __init__(self):
+        """
+        Mergeable version of PriorityQueue:  merge melds the other heap in
+        O(1) instead of pushing its items one at a time, and pop takes
+        amortized O(log n).
+
+        Items are popped in the same order as from a PriorityQueue that
+        had the same pushes and merges, i.e. by priority and then by the
+        order they were pushed in, where merged items come after the items
+        in the heap and before the items pushed after the merge.  To keep
+        that order without renumbering merged items, each item is numbered
+        within its group, and a merged heap's group gets the next number of
+        the heap it is merged into.
+
+        Each node of the heap is a list of
+        [priority, group, index, item, child nodes]
+        """
+        self._root = None
+        self._size = 0
+        self._group = _Group()
+        self._index = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, item, priority):
+        """
+        Push an item into the queue.
+
+        Args:
+            item     (obj): Item to be stored in the queue
+            priority (Num): Priority in which item will be retrieved from the
+                queue
+        """
+        node = [priority, self._group, self._index, item, []]
+        self._index += 1
+        self._size += 1
+        self._root = node if self._root is None else \
+            self._meld(self._root, node)
+
+    def pop(self):
+        """
+        Removes the highest priority item from the queue
+
+        Returns:
+            obj: item with highest priority
+        """
+        root = self._root
+        if root is None:
+            raise IndexError('pop from empty heap')
+
+        # meld the children in pairs left to right and then the pairs
+        # right to left
+        children = root[4]
+        pairs = [self._meld(children[i], children[i + 1])
+                 if i + 1 < len(children) else children[i]
+                 for i in range(0, len(children), 2)]
+        new_root = None
+        for node in reversed(pairs):
+            new_root = node if new_root is None else \
+                self._meld(node, new_root)
+
+        self._root = new_root
+        self._size -= 1
+        return root[3]
+
+    def merge(self, other):
+        """
+        Given another queue, consumes each item in it
+        by melding it into its own queue
+
+        Args:
+            other (PairingHeap): Queue to be merged
+        """
+        if other._root is None:
+            return
+
+        other._group.parent = self._group
+        other._group.index = self._index
+        self._index += 1
+        self._root = other._root if self._root is None else \
+            self._meld(self._root, other._root)
+        self._size += other._size
+
+        other._root = None
+        other._size = 0
+        other._group = _Group()
+        other._index = 0
+
+    def top(self):
+        """
+        Allows peek at top item in the queue without removing it
+
+        Returns:
+            obj: if the queue is not empty otherwise None
+        """
+        return None if self._root is None else self._root[3]
+
+    @staticmethod
+    def _meld(a, b):
+        """make the root of lower priority the child of the other"""
+        if PairingHeap._is_before(b, a):
+            a, b = b, a
+        a[4].append(b)
+        return a
+
+    @staticmethod
+    def _is_before(a, b):
+        if a[0] != b[0]:
+            return a[0] < b[0]
+        return _Group.get_order(a[1], a[2]) < _Group.get_order(b[1], b[2])
+
+
+class _Group(object):
+
+    __slots__ = ('parent', 'index')
+
+    def __init__(self):
+        """group of the items of a PairingHeap (until it is merged)"""
+        self.parent = None
+        self.index = 0
+
+    @staticmethod
+    def get_order(group, index):
+        """
+        numbers of the groups of an item from the outermost in, followed by
+        its number in its group
+        """
+        order = [index]
+        while group.parent is not None:
+            order.append(group.index)
+            group = group.parent
+        return order[::-1]
@@ -565,8 +565,123 @@ def segments_intersect(p1, p2, p3, p4):
     return intersecting
 
 
+def _cross_v(a, b):
+    """z component of the cross products of 2D vectors (last axis)"""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _on_segment_collinear_v(p, p1, p2):
+    """vectorized version of on_segment_collinear (broadcasts)"""
+    p_x_in_s = (p[..., 0]-p1[..., 0])*(p[..., 0]-p2[..., 0])
+    p_y_in_s = (p[..., 1]-p1[..., 1])*(p[..., 1]-p2[..., 1])
+    return (p_x_in_s <= 0) & (p_y_in_s <= 0)
+
+
+def _points_match_v(a, b):
+    """vectorized np.allclose of points with POINT_MATCH_TOLERANCE"""
+    return np.all(np.abs(a - b) <= POINT_MATCH_TOLERANCE, axis=-1)
+
+
+def segments_intersect_masks(p1, p2, p3s, p4s):
+    """
+    Which segments (p3s, p4s) intersect segment (p1, p2) and which of them
+    share an endpoint with it, in one pass
+    (vectorized versions of segments_intersect and segments_share_endpoint)
+
+    p1, p2 may also be nx2 arrays of segments to test pairwise against the
+    n segments (p3s, p4s)
+
+    Args:
+        p1, p2:  points comprising segment 1
+        p3s, p4s:  nx2 arrays of points comprising n segments
+
+    Returns:
+        intersect_mask:  n array, True where the segments intersect
+        share_mask:  n array, True where the segments share an endpoint
+    """
+
+    p1, p2, p3s, p4s = [np.asarray(a, dtype=float) for a in
+                        (p1, p2, p3s, p4s)]
+
+    # make vectors from segments
+    v1 = p2 - p1
+    v2 = p4s - p3s
+    numerator = _cross_v(p3s - p1, v1)
+    denominator = _cross_v(v1, v2)
+
+    # collinear lines intersect if overlapping
+    # (at least one of the points must be on the other segment)
+    collinear = (numerator == 0) & (denominator == 0)
+    overlapping = (_on_segment_collinear_v(p3s, p1, p2) |
+                   _on_segment_collinear_v(p4s, p1, p2) |
+                   _on_segment_collinear_v(p1, p3s, p4s) |
+                   _on_segment_collinear_v(p2, p3s, p4s))
+
+    # parallel lines (denominator == 0) never intersect
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = numerator / denominator
+        t = _cross_v(p3s - p1, v2) / denominator
+    crossing = (denominator != 0) & (0 <= t) & (t <= 1) & (0 <= u) & (u <= 1)
+    intersect_mask = np.where(collinear, overlapping, crossing)
+
+    share_mask = (_points_match_v(p1, p3s) | _points_match_v(p1, p4s) |
+                  _points_match_v(p2, p3s) | _points_match_v(p2, p4s))
+    return intersect_mask, share_mask
+
+
+def line_segment_intersections(rtree, p1, p2, min_id=0):
+    """
+    ids of the segments in rtree that intersect segment (p1, p2) without
+    sharing an endpoint with it
+
+    Args:
+        rtree:  SegmentIndex of segments
+        p1, p2:  points representing segment to test
+        min_id:  only test the segments with id >= min_id
+
+    Returns:
+        ids:  array of segment ids
+    """
+
+    ids = rtree.intersection(make_bounding_box(p1, p2))
+    ids = ids[ids >= min_id]
+    segments = rtree.segments[ids]
+    intersect_mask, share_mask = segments_intersect_masks(
+        p1, p2, segments[:, 0], segments[:, 1])
+    return ids[intersect_mask & ~share_mask]
+
+
+def line_segment_intersections_batch(rtree, p1s, p2s):
+    """
+    batch version of line_segment_intersections, testing the candidate
+    segments of all segments (p1s, p2s) in one pass
+
+    Args:
+        rtree:  SegmentIndex of segments
+        p1s, p2s:  nx2 arrays of points representing segments to test
+
+    Returns:
+        ids:  list of n arrays of segment ids
+    """
+
+    p1s, p2s = np.asarray(p1s, dtype=float), np.asarray(p2s, dtype=float)
+    if not len(p1s):
+        return []
+
+    ids, counts = rtree.intersection_v(np.minimum(p1s, p2s),
+                                       np.maximum(p1s, p2s))
+    edge_indices = np.repeat(np.arange(len(p1s)), counts)
+    segments = rtree.segments[ids]
+    intersect_mask, share_mask = segments_intersect_masks(
+        p1s[edge_indices], p2s[edge_indices], segments[:, 0], segments[:, 1])
+    is_hit = intersect_mask & ~share_mask
+    return np.split(ids[is_hit], np.cumsum(
+        np.bincount(edge_indices[is_hit], minlength=len(p1s)))[:-1])
+
+
 # @jit
-def line_subgraph_intersection(subgraphs, rtree, p1, p2):
+def line_subgraph_intersection(subgraphs, rtree, p1, p2, segment_ids=None,
+                               min_id=0):
     """
     test for line segment intersection
     http://stackoverflow.com/questions/563198/how-do-you-detect-where-two-line-segments-intersect
@@ -576,10 +691,13 @@ def line_subgraph_intersection(subgraphs, rtree, p1, p2):
 
     Args:
         subgraphs:  UnionFind structure representing subgraphs of a forest
-        rtree:  libspatialindex rtree structure containing segments
-            of subgraphs
+        rtree:  SegmentIndex containing segments of subgraphs
         p1, p2:  points representing segment to test for intersection with
             subgraphs
+        segment_ids:  ids of the segments with id < min_id that intersect
+            (p1, p2), e.g. from line_segment_intersections_batch, so that
+            only the segments inserted since are tested
+        min_id:  number of segments in rtree when segment_ids were found
 
     Returns:
         invalid_edge:  whether the edge is invalid due to > 1 intersection
@@ -588,34 +706,29 @@ def line_subgraph_intersection(subgraphs, rtree, p1, p2):
 
     """
 
-    box = make_bounding_box(p1, p2)
-
-    # query for overlapping rectangles
-    intersecting_bounds = rtree.intersection(box, objects=True)
+    intersecting_ids = line_segment_intersections(rtree, p1, p2, min_id)
+    if segment_ids is not None:
+        intersecting_ids = np.concatenate([segment_ids, intersecting_ids])
     intersecting_subnets = defaultdict(int)
 
-    # go through the possible intersections to validate
-    for possible in intersecting_bounds:
+    # go through the intersections
+    for segment_id in intersecting_ids:
 
-        # Query object is in form of (u.label, v.label), (u.coord, v.coord)
-        (up, vp), (p3, p4) = possible.object
+        # edge labels are referenced by the segment id
+        up, vp = rtree.edges[segment_id]
 
-        if segments_intersect(p1, p2, p3, p4):
-            if segments_share_endpoint(p1, p2, p3, p4):
-                continue
-            else:
-                # Make sure something didn't go awry such that this edge
-                # doesn't represent a single subnet
-                assert(subgraphs[up] == subgraphs[vp])
+        # Make sure something didn't go awry such that this edge
+        # doesn't represent a single subnet
+        assert(subgraphs[up] == subgraphs[vp])
 
-                # Get the subgraph the segment intersects
-                subgraph_parent = subgraphs[up]
-                intersecting_subnets[subgraph_parent] += 1
+        # Get the subgraph the segment intersects
+        subgraph_parent = subgraphs[up]
+        intersecting_subnets[subgraph_parent] += 1
 
-                # If the subgraph is intersected in more than a single location
-                # this results in a 'cycle' and the segment is rejected
-                if intersecting_subnets[subgraph_parent] > 1:
-                    return True, intersecting_subnets
+        # If the subgraph is intersected in more than a single location
+        # this results in a 'cycle' and the segment is rejected
+        if intersecting_subnets[subgraph_parent] > 1:
+            return True, intersecting_subnets
 
     # TODO: If this edge is valid, we need to update
     # the mv for all intersecting subnets
@@ -676,6 +789,40 @@ def project_point_on_segment(p, v1, v2):
     return point_on_u + v1
 
 
+def project_points_on_segments(points, v1s, v2s):
+    """
+    Find points on segments (v1s, v2s) nearest to points
+    (vectorized version of project_point_on_segment)
+
+    Args:
+        points:  nx2 array of points to project
+        v1s, v2s:  nx2 arrays of points representing n segments
+
+    Returns:
+        projs:  nx2 array of projected points
+    """
+
+    points, v1s, v2s = [np.asarray(a, dtype=float) for a in
+                        (points, v1s, v2s)]
+
+    # make 2 vectors with origin at point v1 for each segment
+    u = v2s - v1s
+    v = points - v1s
+
+    # Dot product and magnitude^2
+    # (matmul of the stacked vectors rounds like np.dot)
+    dp = np.matmul(u[:, np.newaxis, :], v[:, :, np.newaxis])[:, 0, 0]
+    u_mag_2 = np.sum(u ** 2, axis=1)
+
+    # project onto u and convert back to original reference system
+    # (zero length segments have u_mag_2 == 0 and take v1 below)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        projs = (dp / u_mag_2)[:, np.newaxis] * u + v1s
+    projs[dp <= 0] = v1s[dp <= 0]
+    projs[dp > u_mag_2] = v2s[dp > u_mag_2]
+    return projs
+
+
 def arc_intersection(a1, a2, radius=MEAN_EARTH_RADIUS_M, on_arc_test=True):
     """
     EXPERIMENTAL (needs more testing)
@@ -8,6 +8,9 @@ import jsonschema
 import networkx as nx
 import numpy as np
 
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
 from networker.classes.unionfind import UnionFind
 from networker.classes.geograph import GeoGraph
 from networker.exception import SpatialReferenceMismatchException
@@ -31,7 +34,8 @@ class NetworkerRunner(object):
     """
 
     ALGOS = {'mod_boruvka': algo.mod_boruvka,
-             'mod_kruskal': algo.mod_kruskal}
+             'mod_kruskal': algo.mod_kruskal,
+             'mod_delaunay': algo.mod_delaunay}
 
     SCHEMA_FILE = "networker_config_schema.json"
 
@@ -166,8 +170,8 @@ def build_network(demand_nodes,
 
     msf = GeoGraph(result_geo_graph.srs)
     if filtered_graph:
-        coords = {id_label(i): result_geo_graph.coords[i]
-                  for i in filtered_graph}
+        coords = result_geo_graph.coords.subset(filtered_graph).relabel(
+            id_label)
         relabeled = nx.relabel_nodes(filtered_graph, {i: id_label(i)
                                                       for i in filtered_graph},
                                      copy=True)
@@ -193,6 +197,42 @@ def has_grid_conn(g):
     return False
 
 
+def get_subnetwork_mask(g, min_node_count):
+    """
+    whether each node of the networkplan GeoGraph is in a grid connected
+    component or in a component with at least min_node_count nodes
+
+    Components are labeled in a single pass over the edges (instead of
+    copying each component), from which their sizes and whether they have
+    a grid connection (see has_grid_conn) are counted
+
+    Args:
+        g (GeoGraph):  networkplan as GeoGraph
+        min_node_count:  min number of nodes in non-grid connected component
+
+    Returns:
+        mask:  boolean array indexed like g.nodes()
+    """
+    nodes = list(g.nodes())
+    index_by_node = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index_by_node[u], index_by_node[v])
+                      for u, v in g.edges()], dtype=int).reshape(-1, 2)
+
+    node_count = len(nodes)
+    adjacency = coo_matrix(
+        (np.ones(len(edges)), (edges[:, 0], edges[:, 1])),
+        shape=(node_count, node_count))
+    _, labels = connected_components(adjacency, directed=False)
+
+    sizes = np.bincount(labels, minlength=1)
+    is_fake = np.array([g._node[node]['budget'] == np.inf
+                        for node in nodes], dtype=bool)
+    grid_connected = np.zeros(len(sizes), dtype=bool)
+    grid_connected[labels[is_fake]] = True
+
+    return grid_connected[labels] | (sizes[labels] >= min_node_count)
+
+
 def filter_min_node_subnetworks(g, min_node_count):
     """
     remove "non-grid connected" connected components from the networkplan
@@ -203,34 +243,15 @@ def filter_min_node_subnetworks(g, min_node_count):
         min_node_count:  min number of nodes in non-grid connected component
 
     Returns:
-        networkx graph with appropriate subnetworks removed
+        networkx graph view of g with appropriate subnetworks removed
 
     Note:  If you need a GeoGraph from result, you'll need to convert it
     """
-    components = list(nx.connected_components(g))
-    subgraphs = [g.subgraph(component).copy() for component in components]
-    
-    grid_connected = filter(lambda sub: has_grid_conn(sub),
-                            subgraphs)
-    non_grid_connected = filter(lambda sub: not has_grid_conn(sub),
-                                subgraphs)
-
-    def union_all_wrap(graph_list):
-        """ handle empty list so that union_all returns empty graph """
-        if len(graph_list) == 0:
-            return nx.Graph()
-        else:
-            return nx.union_all(graph_list)
-
-    # now filter out non-grid subnetworks via minimum node count
-    filtered_non_grid = union_all_wrap(list(filter(
-        lambda sub: len(sub._node) >= min_node_count, non_grid_connected)))
-
-    grid = union_all_wrap(list(grid_connected))
+    mask = get_subnetwork_mask(g, min_node_count)
+    kept = set(node for node, keep in zip(g.nodes(), mask) if keep)
 
-    # finally, merge back grid_connected
-    filtered_graph = nx.union(grid, filtered_non_grid)
-    return filtered_graph
+    # filter by function so that the view keeps the node order of g
+    return nx.subgraph_view(g, filter_node=kept.__contains__)
 
 
 def merge_network_and_nodes(network, demand_nodes,
@@ -283,51 +304,35 @@ def merge_network_and_nodes(network, demand_nodes,
         "network must have more than 1 node"
 
     if single_network:
-        # just union all nodes to a single parent
-        nodes = network.nodes()
-        # add parent
-
-        keys_list = list(network.coords.keys())
-        parent = keys_list[0]
-        subgraphs.add_component(parent, budget=network._node[parent]['budget'])
-        for node in keys_list[1:]:
-            subgraphs.add_component(node, budget=network._node[node]['budget'])
-            # The existing grid nodes are on the grid (so distance is 0)
-            subgraphs.union(parent, node, 0)
+        # just union all nodes to a single parent (the first)
+        nodes = list(network.coords.keys())
+        labels = None
     else:
         # Build the subnet components
         # Get the network components to init budget centers
-        subnets = nx.connected_components(network)
-
-        for sub in subnets:
-            # union all nodes to parent of subnet
-            sub_list = list(sub)
-            parent = sub_list[0]
-            subgraphs.add_component(parent,
-                                    budget=network.node[parent]['budget'])
-            # Merge remaining nodes with component
-            for node in sub_list[1:]:
-                subgraphs.add_component(node,
-                                        budget=network.node[node]['budget'])
-                # The existing grid nodes are on the grid (so distance is 0)
-                subgraphs.union(parent, node, 0)
-
-    # setup merged graph to be populated with fake nodes
+        # (the first node of each is the parent of the subnet)
+        subnets = [list(sub) for sub in nx.connected_components(network)]
+        nodes = [node for sub in subnets for node in sub]
+        labels = np.repeat(np.arange(len(subnets)),
+                           [len(sub) for sub in subnets])
+
+    # The existing grid nodes are on the grid (so distance is 0)
+    subgraphs.add_components(
+        nodes, [network._node[node]['budget'] for node in nodes], labels)
+
+    # Make sure something wonky isn't going on
+    assert all(subgraphs[u] == subgraphs[v] for (u, v), _ in edge_fakes)
+
+    # setup merged graph and merge fakes in
+    # NOTE:  fake nodes always have np.inf budget
+    fake_nodes = [fake for _, fake in edge_fakes]
     merged = GeoGraph(demand_nodes.srs, demand_nodes.coords, data=demand_nodes)
-    # merge fakes in
-    for ((u, v), fake) in edge_fakes:
-
-        # Make sure something wonky isn't going on
-        assert(subgraphs[u] == subgraphs[v])
-
-        # Add the fake node to the big net
-        # NOTE:  fake nodes always have np.inf budget
-        merged.add_node(fake, budget=np.inf)
-        merged.coords[fake] = grid_with_fakes.coords[fake]
+    merged.add_nodes_from(fake_nodes, budget=np.inf)
+    merged.coords.extend(fake_nodes, grid_with_fakes.coords.take(fake_nodes))
 
-        # Merge the fake node with the grid subgraph
-        subgraphs.add_component(fake, budget=np.inf)
-        subgraphs.union(fake, u, 0)
+    # Merge the fake nodes with their grid subgraphs
+    subgraphs.add_fake_components(fake_nodes,
+                                  [u for (u, v), _ in edge_fakes])
 
     return merged, subgraphs, rtree
 
@@ -382,8 +387,8 @@ def load_existing_networks(filename, budget_value=0, prefix=None):
         nx.relabel_nodes(geo_net,
                          {n: prefix + str(n) for n in geo_net.nodes()},
                          copy=False)
-        geo_net.coords = {prefix + str(n): c for n, c in
-                          geo_net.coords.items()}
+        geo_net.coords = geo_net.coords.relabel(
+            lambda n: prefix + str(n))
 
     # check and clean
     _clean_geograph(geo_net)
@@ -6,7 +6,6 @@ import numpy as np
 import networkx as nx
 import pandas as pd
 import logging
-import copy
 import networker.io as nio
 from functools import reduce
 from sequencer.Utils import prep_data, haversine_distance, euclidean_distance
@@ -47,6 +46,7 @@ class NetworkPlan(object):
                                                  loc_tol = self.TOL)
 
         self.coord_values = [tuple(x) for x in network._node.keys()]
+        self._coord_array = np.array(self.coord_values, dtype=float)
 
         # Set the edge weight to the distance between those nodes
         self._weight_edges()
@@ -110,43 +110,6 @@ class NetworkPlan(object):
         return self.metrics[attr].ix[node]
 
 
-    def _depth_first_directed(self, input_graph):
-        """Transforms a network's edges to direct away from the root."""
-        
-        # Create a copy of the input graph to avoid modifying the original
-        graph_copy = input_graph.copy()
-        
-        # Identify the relevant subgraph
-        subgraph_index = next((i for i, g in enumerate(self.get_subgraphs()) if g == input_graph), None)
-        
-        # Logging the subgraph progress
-        total_subgraphs = len(list(self.get_subgraphs()))
-        logger.info(f'Directing SUBGRAPH {subgraph_index + 1} / {total_subgraphs}')
-
-        # Check for nan nodes
-        if any(pd.isna(node) for node in graph_copy.nodes()):
-            logger.error("Graph contains nan nodes. Exiting function.")
-            return graph_copy
-        
-        # Check the source for DFS
-        source_node = self._graph_priority(graph_copy.nodes())
-        if pd.isna(source_node):
-            logger.error("Graph priority function returned nan. Exiting function.")
-            return graph_copy
-
-        # Collect the current edges and determine the new edges based on DFS
-        current_edges = list(graph_copy.edges())
-        dfs_order_edges = list(nx.traversal.dfs_edges(graph_copy, source=source_node))
-        
-        # Logging for debugging purposes
-        logger.debug(f'mapping {current_edges} -> {dfs_order_edges}')
-
-        # Remove the old edges and add the new edges based on DFS order
-        graph_copy.remove_edges_from(current_edges)
-        graph_copy.add_edges_from(dfs_order_edges)
-
-        return graph_copy
-    
     def fakes(self, nodes):
         """applies a filter to the input nodes, returning the subset representing fake nodes"""
         # get a view of the DataFrame without positional columns
@@ -157,9 +120,15 @@ class NetworkPlan(object):
         # find rows that are all null, these are the nodes representing the connection to existing infastructure
         return non_positional[non_positional.isnull().any(axis=1)].index.values
    
-    def _graph_priority(self, nodes):
-        """returns the starting node to be used in directing the graph"""
-        fakes = self.fakes(nodes)
+    def _graph_priority(self, nodes, fakes=None, priorities=None):
+        """
+        returns the starting node to be used in directing the graph
+
+        fakes (the fake nodes among nodes) and priorities (array of the
+        priority metric of nodes) are looked up in metrics if not given
+        """
+        if fakes is None:
+            fakes = self.fakes(nodes)
         
         # There theoretically should only be one fake per subgraph
         if len(fakes) == 1:
@@ -172,20 +141,29 @@ class NetworkPlan(object):
             return np.random.choice(fakes)
 
         # If there is no fake node in the subgraph, its not close to infastructure and thus priority is given to MAX(priority metric)
-        else:
+        elif priorities is None:
             series = self.metrics[self.priority_metric].loc[list(nodes)]
             series = series.astype('float64')
 
             return series.idxmax()
 
+        else:
+            # first max, skipping nan (as idxmax)
+            if np.isnan(priorities).all():
+                return np.nan
+            return list(nodes)[np.nanargmax(priorities)]
+
     def _distance(self, first_index, second_index):
-        """Calculate the distance between two points given their indices."""
+        """
+        Calculate the distance between two points given their indices
+        (or the distances between the points of two arrays of indices).
+        """
         distance_function = (
             haversine_distance if 'longlat' in self.proj else
             euclidean_distance
         )
         return distance_function(
-            self.coord_values[first_index], self.coord_values[second_index]
+            self._coord_array[first_index], self._coord_array[second_index]
         )
 
     def _weight_edges(self):
@@ -211,14 +189,56 @@ class NetworkPlan(object):
         nx.set_edge_attributes(self.network, weights, 'weight')
     
     def direct_network(self):
-        """Decomposes a full graph into its components and directs them away from their roots"""
-        #print list(self.get_subgraphs())
-        graphs = []
-        for g in self.get_subgraphs():
-            graphs.append(self._depth_first_directed(g))
-
-        self._network = reduce(lambda x, y: nx.union(x, y), graphs)
-
+        """
+        Decomposes a full graph into its components and directs them away
+        from their roots (chosen by _graph_priority), depth first over the
+        full graph into a single directed graph
+        """
+        network = self.network
+        subgraph_nodes = [list(g.nodes()) for g in self.get_subgraphs()]
+
+        # Look up the fakes and priorities of all nodes at once
+        nodes = [node for component in subgraph_nodes
+                 if not any(pd.isna(node) for node in component)
+                 for node in component]
+        fakes = set(self.fakes(nodes))
+        # Take the first metrics row of nodes with more than one
+        priorities = self.metrics[self.priority_metric]
+        priorities = priorities[~priorities.index.duplicated()]
+        priority_by_node = dict(zip(
+            nodes, priorities.loc[nodes].values.astype('float64')))
+
+        directed = network.__class__()
+        directed.graph.update(network.graph)
+        directed.add_nodes_from(
+            (node, network._node[node])
+            for component in subgraph_nodes for node in component)
+        for i, component in enumerate(subgraph_nodes):
+            logger.info('Directing SUBGRAPH {} / {}'.format(
+                i + 1, len(subgraph_nodes)))
+
+            # Components with nan nodes or without a source are left as is
+            if any(pd.isna(node) for node in component):
+                logger.error("Graph contains nan nodes. Leaving it undirected.")
+                directed.add_edges_from(
+                    network.subgraph(component).edges(data=True))
+                continue
+            source_node = self._graph_priority(
+                component,
+                fakes=[node for node in component if node in fakes],
+                priorities=np.array(
+                    [priority_by_node[node] for node in component]))
+            if pd.isna(source_node):
+                logger.error("Graph priority function returned nan. Leaving it undirected.")
+                directed.add_edges_from(
+                    network.subgraph(component).edges(data=True))
+                continue
+
+            # Direct the edges away from the source in depth first order
+            directed.add_edges_from(
+                nx.traversal.dfs_edges(network, source=source_node))
+
+        self._network = directed
 
     def downstream(self, n):
         """
@@ -237,17 +257,19 @@ class NetworkPlan(object):
         return {n : children} if children else {n : []}
 
     def root_child_dict(self):
+        """returns a dict of the root of each tree to the set of its nodes"""
         root_child = {}
-        for subgraph in self.get_subgraphs():
-            nodes_degree = subgraph.in_degree()
-            subgraph = copy.deepcopy(subgraph._node)
-            for node, degree in nodes_degree:
-                if degree == 0:
+        in_degree = self.network.in_degree()
+        # components of the directed network (self.subgraphs are those of
+        # the network before it was directed, where no node has
+        # in_degree 0)
+        for component in nx.weakly_connected_components(self.network):
+            for node in component:
+                if in_degree[node] == 0:
                     break
             #FIXME(Ariel): Re-enable that assert
-            #assert(nodes_degree[node] == 0)
-            #subgraph.remove(node)
-            root_child[node] = subgraph.keys()
+            #assert(in_degree[node] == 0)
+            root_child[node] = component
         return root_child
 
     def _get_subgraphs(self):
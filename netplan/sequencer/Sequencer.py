@@ -2,43 +2,47 @@
 __author__ = 'Brandon Ogle'
 
 import pandas as pd
-from functools import wraps
+import heapq
+import itertools
 import networkx as nx
 import numpy as np
 import os
 import logging
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import breadth_first_order
 from sequencer.Utils import parse_cols
 from infrastructure_planning import nx_shp as nn_xx
 
 logger = logging.getLogger('sequencer')
 
-def memoize(f):
-    cache = {}
-    
-    # Provides access to this closures scope
-    # In Python 3 this could be replaced with the nonlocal keyword
-    class scope:
-        last_prog = None
-        
-    @wraps(f)
-    def memoizedFunction(*args, **kwargs):
-        # Note:  only concerned with 2nd argument here
-        # since it's only used in accumulate
-        self = args[0]
-        key = args[1]
-        if key not in cache:
-            cache[key] = f(*args, **kwargs)
-
-            # Get the number of keys in the the cache and send to the progress meter
-            if len(cache.keys()) != scope.last_prog:
-                scope.last_prog = len(cache.keys())
-            
-        return cache[key]
-
-    # Assigns a cache to the decorated func
-    memoizedFunction.cache = cache
-
-    return memoizedFunction
+def far_sighted_order(roots, get_successors, get_metric):
+    """
+    Yields the nodes of a forest in far-sighted order:  the frontier starts
+    as the roots and the node of the frontier with the max metric is taken
+    next and replaced in the frontier by its successors.  Ties go to the
+    node that joined the frontier first.
+
+    The metric of a node doesn't change while it waits in the frontier, so
+    the frontier is a heap of (-metric, join order, node) and each node is
+    taken in O(log frontier) instead of a scan of the whole frontier.
+    Nodes whose metric isn't positive (zero demand or NaN) are taken after
+    the others, in the order they joined.
+    """
+    frontier = []
+    join_order = itertools.count()
+
+    def join(nodes):
+        for node in nodes:
+            metric = get_metric(node)
+            # NaN would break the heap's comparisons
+            priority = -metric if metric > 0 else 0
+            heapq.heappush(frontier, (priority, next(join_order), node))
+
+    join(roots)
+    while frontier:
+        node = heapq.heappop(frontier)[-1]
+        yield node
+        join(get_successors(node))
 
 class Sequencer(object):
     
@@ -60,58 +64,22 @@ class Sequencer(object):
         self.networkplan.metrics['nodal_demand'] = self.nodal_demand(self.networkplan.metrics)
         self.root_children = self.networkplan.root_child_dict()
 
+        # Index the parent, root and upstream distance of every node and
+        # sum the demand and distance downstream of them
+        self._index_network()
+        self._accumulate_network()
+
     def _sequence(self):
-        logger.info('Converting The Network to a HashMap (Warning: this is time consuming for large Networks)')
-        # Convert the Network to a dict
-        network = self.networkplan.network_to_dict()
-        # The roots of the Network dict are the seed for the frontier
-        frontier = network.keys()
+        logger.info('Traversing The Input Network and Computing Decision Frontier')
         # Initialize a starting rank
-        rank = 0  
+        rank = 0
+
+        # The roots of the Network are the seed for the frontier
+        for choice in far_sighted_order(self.networkplan.roots,
+                                        self.networkplan.get_successors,
+                                        self.decision_metric):
+            choice_vars = self.accumulate(choice)
 
-        logger.info('Traversing The Input Network and Computing Decision Frontier')
-        
-        # While there exists nodes in the keys of the Network dict, continue to Sequence
-        while frontier: 
-            # Reset the max_ and choice nodes for the give state of the frontier
-            max_ = 0
-            choice = None
-            # Iterate through the nodes in the frontier to find the max metric
-            for node in frontier:
-                # Get the accumulated values for the give node
-                # The traversal is performed only in the first call due to Memoization
-                accum_dict = self.accumulate(node)
-                demand = accum_dict['demand']
-                cost = accum_dict['cost']
-                # Compute the metric
-                if cost > 0:
-                    metric = 1.0 * demand / cost
-                else:
-                    metric = np.inf
-
-                # Get first element if it becomes a matrix.
-                # Workaround for ValueError: The truth value of a Series is ambiguous. Use a.empty, a.bool(), a.item(), a.any() or a.all().
-                if hasattr(metric, 'shape') and len(metric.shape) > 0:
-                    metric = metric.as_matrix()[0]
-
-                if metric > max_:
-                    # Update the metric and potential candidate
-                    max_ = metric 
-                    choice = node
-                    choice_vars = accum_dict                    
-
-            # Remove the candidate from the Network and shift its downstream neighbors to the keys
-            neighbors = network.pop(choice, None)
-            print(neighbors)
-            if neighbors:
-                for key, value in neighbors:
-                    # Assuming you want to add/overwrite the key in network with the value from neighbors
-                    network[key] = value
- 
-
-            # Update the frontier
-            frontier = network.keys()
-            
             # Build a row to be appended to the results dataframe
             choice_row =  {
                             'Sequence..Vertex.id'                   : choice,
@@ -133,15 +101,13 @@ class Sequencer(object):
                                                                                                  choice_vars['demand'] / choice_vars['cost']))
                 yield choice_row
         
-        # Clear the accumulate cache
-        self.accumulate.cache.clear()
+    def decision_metric(self, node):
+        """Computes the downstream demand / distance of a node"""
+        return self._decision_metrics[self._position_by_node[node]]
 
     def upstream_distance(self, node):
-        """Computes the edge distance from a node to it's parent"""
-        parent = self.parent(node)
-        if parent is not None:
-            return self.networkplan._distance(parent, node)
-        return 0.0
+        """Returns the edge distance from a node to it's parent"""
+        return self._upstream_distances[self._position_by_node[node]]
 
     def sequence(self):
         """
@@ -163,53 +129,89 @@ class Sequencer(object):
         return self.output_frame
 
     def get_root(self, n):
-        # Check the keys to see if the node even has an upstream root
-        if n in self.root_children.keys():
-            return None
-        # If the node isn't a root, then iterate through the each root until we find the node
-        for root, children in self.root_children.items():
-            if n in children:
-                # Return the root the node belongs to
-                return root
-    
-    @memoize
+        """Returns the root of the tree of node n (None if n is a root)"""
+        root = self._roots[self._position_by_node[n]]
+        return None if root < 0 else self._nodes[root]
+
     def accumulate(self, n):
+        """returns the demand and distance summed downstream of node n"""
+        i = self._position_by_node[n]
+        return {'demand': self._downstream_demand[i],
+                'cost': self._downstream_cost[i]}
+
+    def _index_network(self):
         """
-        traverses the tree computing downstream aggregates and
-        populating the cache
+        Indexes the nodes of the network by position with arrays of the
+        parent, root and upstream segment distance of each node and the
+        order of a traversal from the roots
         """
-
-        # Compute individual node variables
-        demand = self.networkplan.metrics['nodal_demand'].loc[n]
-        cost = self.upstream_distance(n)
-        
-        post_order_stack = []
-        # create a post_order_traversal of downstream tree
-        # then sum up accumulated values as we pop off 
-        # un-ravel recursiveness since for large networks we hit a stack limit
-        # 
-        # Populate the stack 
-        all_children = [(n, child) for child in self.networkplan.get_successors(n)]
-        self.accumulate.cache[n] = {'demand': demand, 'cost': cost}
-        while all_children:
-            parent, child = all_children.pop()
-            child_demand = self.networkplan.metrics['nodal_demand'].loc[child]
-            child_cost = self.upstream_distance(child)
-            self.accumulate.cache[child] = {'demand': child_demand, 'cost': child_cost}
-            post_order_stack.append((parent, child))
-            all_children += [(child, child_child) for child_child in self.networkplan.get_successors(child)]
-
-        # now we have post_order_stack defined, pop it and sum cache back up the tree
-        while post_order_stack:
-            parent, child = post_order_stack.pop()
-        
-            # now add to parent
-            self.accumulate.cache[parent]['demand'] += self.accumulate.cache[child]['demand']
-            self.accumulate.cache[parent]['cost'] += self.accumulate.cache[child]['cost']
-
-        
-        # Return a dictionary of accumulated values
-        return self.accumulate.cache[n]
+        network = self.networkplan.network
+        nodes = list(network.nodes())
+        position_by_node = {node: i for i, node in enumerate(nodes)}
+        node_count = len(nodes)
+
+        # Parent (first predecessor) of each node or -1 for the roots
+        predecessors = network.pred
+        parents = np.array([
+            position_by_node[next(iter(predecessors[node]))]
+            if predecessors[node] else -1 for node in nodes], dtype=int)
+        has_parent = parents >= 0
+
+        # Root of the tree of each node (or -1 for the roots), as each node
+        # is in the children of exactly one root
+        roots = np.full(node_count, -1)
+        for root, children in self.root_children.items():
+            roots[[position_by_node[child] for child in children]] = \
+                position_by_node[root]
+            roots[position_by_node[root]] = -1
+
+        # Breadth first order from an extra node linked to the roots puts
+        # every node after its parent
+        tree = coo_matrix((
+            np.ones(node_count),
+            (np.where(has_parent, parents, node_count), np.arange(node_count))),
+            shape=(node_count + 1, node_count + 1)).tocsr()
+        order = breadth_first_order(
+            tree, node_count, return_predecessors=False)[1:]
+
+        node_array = np.array(nodes)
+        upstream_distances = np.zeros(node_count)
+        upstream_distances[has_parent] = self.networkplan._distance(
+            node_array[parents[has_parent]], node_array[has_parent])
+
+        self._nodes = nodes
+        self._position_by_node = position_by_node
+        self._parents = parents
+        self._roots = roots
+        self._upstream_distances = upstream_distances
+        self._order = order
+
+    def _accumulate_network(self):
+        """
+        Sums the demand and upstream segment distance of every node into
+        its ancestors (in arrays indexed by position)
+        """
+        # Take the first metrics row of nodes with more than one
+        nodal_demand = self.networkplan.metrics['nodal_demand']
+        nodal_demand = nodal_demand[~nodal_demand.index.duplicated()]
+        demand = nodal_demand.loc[self._nodes].values.astype(float)
+
+        # Add each node's sums to its parent's, from the leaves up
+        demand_list = demand.tolist()
+        cost_list = self._upstream_distances.tolist()
+        parent_list = self._parents.tolist()
+        for i in self._order[::-1].tolist():
+            parent = parent_list[i]
+            if parent >= 0:
+                demand_list[parent] += demand_list[i]
+                cost_list[parent] += cost_list[i]
+
+        self._downstream_demand = np.array(demand_list)
+        self._downstream_cost = np.array(cost_list)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._decision_metrics = np.where(
+                self._downstream_cost > 0,
+                self._downstream_demand / self._downstream_cost, np.inf)
 
     def output(self, path):
 
@@ -279,9 +281,9 @@ class Sequencer(object):
             nx.set_edge_attributes(self.networkplan.network, attr, pd.DataFrame(edges).ix[attr].to_dict())
 
     def parent(self, n):
-        parent = (parent for parent in self.networkplan.get_predecessors(n))
         # Fake nodes will have no parent
-        return next(parent, None)
+        parent = self._parents[self._position_by_node[n]]
+        return None if parent < 0 else self._nodes[parent]
 
     def _clean_results(self):
         """This joins the sequenced results on the metrics dataframe and reappends the dropped rows"""
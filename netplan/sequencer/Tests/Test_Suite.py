@@ -5,6 +5,9 @@ import os
 from pandas import DataFrame
 import pandas as pd
 from sequencer import NetworkPlan, Sequencer
+from sequencer.Sequencer import far_sighted_order
+from sequencer.Utils import fuzzy_match_indices, hav_dist, \
+                           haversine_distance
 from nose.tools import eq_ 
 
 import sys
@@ -17,6 +20,12 @@ class catch_prints(object):
 
 #sys.stdout = catch_prints()    
 
+def to_coord_tuples(coord_dict):
+    """mapping of node to its coords as a (hashable) tuple of floats"""
+    return {node: tuple(map(float, coords))
+            for node, coords in coord_dict.items()}
+
+
 def gen_data():
     """
     generates test metrics and network, where the network is a 
@@ -41,7 +50,8 @@ def gen_data():
     # assign x, y
     metrics['X'] = [coord_dict[i][0] for i in range(1, 7)]
     metrics['Y'] = [coord_dict[i][1] for i in range(1, 7)]
-    nx.set_node_attributes(network, 'coords', coord_dict)
+    # name the nodes by their coords (as read from a shapefile)
+    network = nx.relabel_nodes(network, to_coord_tuples(coord_dict))
     #nx.draw(network, nx.get_node_attributes(network, 'coords'))
     
     return metrics, network.to_directed()
@@ -86,7 +96,8 @@ def gen_data_with_fakes():
                   5: fake_coord + [1, 2],
                   6: fake_coord}
 
-    nx.set_node_attributes(network, 'coords', coord_dict)
+    # name the nodes by their coords (as read from a shapefile)
+    network = nx.relabel_nodes(network, to_coord_tuples(coord_dict))
     # now set the metrics dataframe without the fake node
     metrics_data = {'Demand...Projected.nodal.demand.per.year': 
                     [100, 50, 25, 12, 6, 3],
@@ -145,7 +156,7 @@ def test_is_tree():
     # Test that all roots have in_degree == 0
     ensure_roots = [in_degree[root] == 0 for root in nwp.roots]
     # Test that all leaves have in_degree == 1
-    ensure_leaves = [in_degree[leaf] == 1 for leaf in (set(nwp.network.node.keys()) - set(nwp.roots))]
+    ensure_leaves = [in_degree[leaf] == 1 for leaf in (set(nwp.network.nodes()) - set(nwp.roots))]
 
     eq_(all(ensure_roots + ensure_leaves), True)
 
@@ -154,7 +165,7 @@ def test_accumulate_demand():
     
     nwp = get_network_plan()
     # Build dictionary of accumulated values for each node
-    acc_dicts =  {node : Sequencer(nwp, 'Demand').accumulate(node) for node in nwp.network.node.keys()}
+    acc_dicts =  {node : Sequencer(nwp, 'Demand').accumulate(node) for node in nwp.network.nodes()}
     # Dictionary of known accumulated demand computed manually
     demands = {0: (100 + 50 + 25 + 12 + 6 + 3), 
                1: (100 + 25 + 12), 
@@ -162,14 +173,14 @@ def test_accumulate_demand():
                3:25, 4:12, 5:6, 6:3}
     
     # Assert that accumulate method and manual computation are equal
-    eq_(np.all([acc_dicts[node]['demand'] == demands[node] for node in nwp.network.node.keys()]), True)
+    eq_(np.all([acc_dicts[node]['demand'] == demands[node] for node in nwp.network.nodes()]), True)
 
 def test_accumulate_cost():
     """Tests that the accumulates costs are correct"""
 
     nwp = get_network_plan()
     # Build dictionary of accumulated values for each node
-    acc_dicts = {node : Sequencer(nwp, 'Demand').accumulate(node) for node in nwp.network.node.keys()}
+    acc_dicts = {node : Sequencer(nwp, 'Demand').accumulate(node) for node in nwp.network.nodes()}
     def get_distance(f, t):
         return nwp._distance(f, t)
 
@@ -184,7 +195,7 @@ def test_accumulate_cost():
              5 : get_distance(2, 5),
              6 : get_distance(2, 6)}
 
-    costs = {node : (acc_dicts[node]['cost'], costs[node]) for node in nwp.network.node.keys()}
+    costs = {node : (acc_dicts[node]['cost'], costs[node]) for node in nwp.network.nodes()}
     eq_(np.all(map(lambda tup: np.allclose(*tup), costs.values())), True)
 
 def test_sequencer_follows_topology():
@@ -201,6 +212,133 @@ def test_sequencer_follows_topology():
                 for seq_num, fnode in fnodes.iteritems()]), True)
 
 
+def get_forest_plan():
+    """
+    NetworkPlan of the network of gen_data_with_fakes, which is directed
+    0 -> 1, 0 -> 2 and 6 -> 3 -> 4, 3 -> 5
+    """
+    metrics, network, node_rank, edge_rank = gen_data_with_fakes()
+    return NetworkPlan(network, metrics, prioritize='Population',
+                       proj='longlat')
+
+
+def test_direct_network():
+    """Tests the root chosen for and the direction of each component"""
+    # components 0 - 1 - 2 without fakes, 3 - 4 - 7* with one fake and
+    # 8* - 5 - 6 - 9* with two (fakes starred and last, to keep the
+    # metrics rows of the other nodes in node order)
+    edges = [(0, 1), (1, 2), (3, 4), (4, 7), (8, 5), (5, 6), (6, 9)]
+    coord_dict = {node: np.array([10. + node, 10. + node % 2])
+                  for node in range(10)}
+    network = nx.Graph()
+    network.add_nodes_from(range(10))
+    network.add_edges_from(edges)
+    network = nx.relabel_nodes(network, to_coord_tuples(coord_dict))
+    metrics = DataFrame({'Population': [1, 5, 5, 2, 1, 3, 3]})
+    metrics['X'] = [coord_dict[i][0] for i in range(7)]
+    metrics['Y'] = [coord_dict[i][1] for i in range(7)]
+
+    np.random.seed(0)
+    nwp = NetworkPlan(network, metrics, prioritize='Population',
+                      proj='longlat')
+    # the root of a component with several fakes is a random one of them
+    np.random.seed(0)
+    random_fake = np.random.choice([8, 9])
+    eq_(sorted(nwp.roots), sorted([1, 7, random_fake]))
+    expected_edges = [(1, 0), (1, 2), (7, 4), (4, 3)] + (
+        [(8, 5), (5, 6), (6, 9)] if random_fake == 8 else
+        [(9, 6), (6, 5), (5, 8)])
+    eq_(sorted(nwp.network.edges()), sorted(expected_edges))
+
+    # the root without fakes has the max priority (the first on ties,
+    # skipping nan)
+    eq_(nwp._graph_priority([0, 1, 2]), 1)
+    eq_(nwp._graph_priority([0, 1, 2], fakes=[],
+                            priorities=np.array([1., 5., 5.])), 1)
+    eq_(nwp._graph_priority([0, 1, 2], fakes=[],
+                            priorities=np.array([np.nan, 2., 3.])), 2)
+    assert np.isnan(nwp._graph_priority(
+        [0, 1], fakes=[], priorities=np.array([np.nan, np.nan])))
+    eq_(nwp._graph_priority([3, 4, 7], fakes=[7], priorities=None), 7)
+
+
+def test_accumulate_forest():
+    """Tests the downstream demand and distance of each node of a forest"""
+    nwp = get_forest_plan()
+    model = Sequencer(nwp, 'Demand...Projected.nodal.demand.per.year')
+    def get_distance(f, t):
+        return haversine_distance(nwp.coord_values[f], nwp.coord_values[t])
+
+    # fake node 6 has no demand
+    demands = {0: 100 + 50 + 25, 1: 50, 2: 25,
+               3: 12 + 6 + 3, 4: 6, 5: 3, 6: 12 + 6 + 3}
+    costs = {0: get_distance(0, 1) + get_distance(0, 2),
+             1: get_distance(0, 1),
+             2: get_distance(0, 2),
+             3: get_distance(6, 3) + get_distance(3, 4) + get_distance(3, 5),
+             4: get_distance(3, 4),
+             5: get_distance(3, 5),
+             6: get_distance(6, 3) + get_distance(3, 4) + get_distance(3, 5)}
+    eq_(sorted(nwp.network.nodes()), list(range(7)))
+    for node in nwp.network.nodes():
+        accumulated = model.accumulate(node)
+        eq_(accumulated['demand'], demands[node])
+        assert np.isclose(accumulated['cost'], costs[node]), node
+        eq_(model.decision_metric(node),
+            1.0 * demands[node] / costs[node] if costs[node] else np.inf)
+
+
+def test_sequencer_index():
+    """Tests the parent, root and upstream distance of each node of a forest"""
+    nwp = get_forest_plan()
+    model = Sequencer(nwp, 'Demand...Projected.nodal.demand.per.year')
+    parents = {0: None, 1: 0, 2: 0, 3: 6, 4: 3, 5: 3, 6: None}
+    # roots have no root
+    roots = {0: None, 1: 0, 2: 0, 3: 6, 4: 6, 5: 6, 6: None}
+    eq_(nwp.root_child_dict(), {0: {0, 1, 2}, 6: {3, 4, 5, 6}})
+    for node in nwp.network.nodes():
+        eq_(model.parent(node), parents[node])
+        expected_distance = 0.0 if parents[node] is None else \
+            haversine_distance(nwp.coord_values[parents[node]],
+                               nwp.coord_values[node])
+        assert np.isclose(model.upstream_distance(node), expected_distance)
+        eq_(model.get_root(node), roots[node])
+
+
+def test_far_sighted_order():
+    """Tests that the frontier takes the max metric, ties going to the node that joined first"""
+    #        0(1)      5(inf)
+    #       /  |  \      |
+    #   1(2) 2(3) 3(2)  6(2)
+    #   |
+    #   4(9)
+    successors = {0: [1, 2, 3], 1: [4], 2: [], 3: [], 4: [], 5: [6], 6: []}
+    metrics = {0: 1, 1: 2, 2: 3, 3: 2, 4: 9, 5: np.inf, 6: 2}
+    order = far_sighted_order([0, 5], successors.get, metrics.get)
+    eq_(list(order), [5, 6, 0, 2, 1, 4, 3])
+
+    # nodes without a positive metric come last
+    metrics[3] = np.nan
+    metrics[6] = 0
+    order = far_sighted_order([0, 5], successors.get, metrics.get)
+    eq_(list(order), [5, 0, 2, 1, 4, 6, 3])
+
+
+def test_fuzzy_match_indices():
+    """Tests that nodes match the closest metrics coords within tolerance"""
+    random_state = np.random.RandomState(0)
+    coords_vec = 10 + random_state.rand(200, 2) * 0.001
+    coords_vec[100:] = coords_vec[:100]
+    coords = coords_vec[random_state.randint(0, 200, 300)] + \
+        random_state.normal(scale=5e-6, size=(300, 2))
+
+    expected = []
+    for coord in coords:
+        dists = hav_dist(coords_vec, coord)
+        expected.append(np.argmin(dists) if dists.min() < .5 else -1)
+    eq_(fuzzy_match_indices(coords, coords_vec, .5).tolist(), expected)
+
+
 def test_sequencer_compare():
     """
     Test an old output to ensure we don't regress
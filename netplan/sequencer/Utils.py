@@ -6,6 +6,7 @@ import pandas as pd
 import networkx as nx
 import numpy as np
 from numpy import sin, cos, pi, arcsin, sqrt
+from scipy.spatial import cKDTree
 import string
 import collections
 
@@ -37,27 +38,29 @@ def prep_data(network, metrics, loc_tol=.5):
     # build a vector of all the coordinates in the metrics dataframe
     coords_vec = np.vstack(metrics['m_coords'].values)
 
-    # fuzzy_match takes a coordinate pair and returns the approximate match from the metrics dataframe using float_tol
-    def fuzzy_match(coord):
-        dists = hav_dist(coords_vec, coord)
-        idx, val = min_tuple(dists)
-        if val < loc_tol:
-            return coords_vec[idx]
-        return []
-
-    # map over the coords in the nodal dataframe returning the fuzzy match from metrics
-    node_df['m_coords'] = node_df['coords'].apply(fuzzy_match)
-    
-    # cast the coordinates back to tuples (hashable) 
-    node_df['m_coords'] = node_df['m_coords'].apply(tuple)
+    # fuzzy match each node's coords to the closest metrics coords within
+    # loc_tol (nodes without a match get empty coords)
+    node_coords = np.array(list(node_df['coords']), dtype=float)
+    match_indices = fuzzy_match_indices(node_coords, coords_vec, loc_tol)
+    # cast the coordinates back to tuples (hashable)
+    node_df['m_coords'] = [tuple(coords_vec[i]) if i >= 0 else ()
+                           for i in match_indices]
     
     # now that we have identical metric coords in both node_df and metrics join on that column
     metrics = pd.merge(metrics, node_df, on='m_coords').sort_index()
 
     # TODO: Remove fuzzy matching and accept nodes and edges from same file
-    #drop duplicate matches
-    find_closest = lambda x: x.index[np.argmin(hav_dist(np.vstack(x['coords']), x.name))]
-    closest_match = metrics.loc[metrics.groupby('m_coords').apply(find_closest).values]
+    #drop duplicate matches, keeping the closest node to each metrics coords
+    # (the first on ties) in the order of the sorted metrics coords
+    group_codes = metrics.groupby('m_coords').ngroup().values
+    matched_coords = np.array(list(metrics['coords']), dtype=float)
+    metric_coords = np.array(list(metrics['m_coords']), dtype=float)
+    dists = get_hav_distance(matched_coords[:, 0], matched_coords[:, 1],
+                             metric_coords[:, 0], metric_coords[:, 1])
+    order = np.lexsort((np.arange(len(metrics)), dists, group_codes))
+    is_closest = np.ones(len(order), dtype=bool)
+    is_closest[1:] = group_codes[order[1:]] != group_codes[order[:-1]]
+    closest_match = metrics.iloc[order[is_closest]]
     
     # anything in node_df that failed to find a fuzzy_match is a 'Fake' node
     fake_nodes = node_df[~node_df.index.isin(closest_match.index)].copy()
@@ -72,6 +75,56 @@ def prep_data(network, metrics, loc_tol=.5):
     
     return network, metrics
 
+def fuzzy_match_indices(coords, coords_vec, loc_tol):
+    """
+    Index of the closest point of coords_vec to each point of coords by
+    haversine distance (as hav_dist) if it's under loc_tol meters, else -1.
+    On ties the lowest index wins, as with argmin over coords_vec.
+
+    Candidates come from a kd-tree of the points on the unit sphere (within
+    the chord of loc_tol, padded for rounding), so that only their
+    haversine distances are computed.
+    """
+    match_indices = np.full(len(coords), -1)
+    if not len(coords) or not len(coords_vec):
+        return match_indices
+
+    earth_radius = 6371010  # meters, as get_hav_distance
+    chord = 2 * np.sin(min(loc_tol / earth_radius, pi) / 2)
+    kdtree = cKDTree(get_unit_vectors(coords_vec))
+    candidate_lists = kdtree.query_ball_point(
+        get_unit_vectors(coords), chord * (1 + 1e-6) + 1e-12)
+    counts = np.array([len(c) for c in candidate_lists], dtype=int)
+    if not counts.sum():
+        return match_indices
+    indices = np.repeat(np.arange(len(coords)), counts)
+    candidates = np.concatenate(
+        [c for c in candidate_lists if c]).astype(int)
+
+    dists = get_hav_distance(coords_vec[candidates, 0],
+                             coords_vec[candidates, 1],
+                             coords[indices, 0], coords[indices, 1])
+    is_near = dists < loc_tol
+    indices, candidates, dists = \
+        indices[is_near], candidates[is_near], dists[is_near]
+    # closest candidate of each point (lowest index on ties) comes first
+    order = np.lexsort((candidates, dists, indices))
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = indices[order[1:]] != indices[order[:-1]]
+    match_indices[indices[order[is_first]]] = candidates[order[is_first]]
+    return match_indices
+
+def get_unit_vectors(coords):
+    """
+    Points on the unit sphere of coords in degrees, taking the first
+    coordinate as the latitude (as hav_dist)
+    """
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+    return np.column_stack((np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon),
+                            np.sin(lat)))
+
 def min_tuple(series):
     idx = np.argmin(series)
     return (idx, series[idx])
@@ -101,7 +154,10 @@ def get_hav_distance(lat, lon, pcode_lat, pcode_lon):
     return haversine_angle * earth_radius
 
 def haversine_distance(first_point, second_point):
-    """Calculate the Haversine distance between two points on Earth."""
+    """
+    Calculate the Haversine distance between two points on Earth
+    (or between the rows of two arrays of points).
+    """
     # Implementation details copied from scikit-learn
     # http://scikit-learn.org/
     # 0.17/modules/generated/sklearn.neighbors.DistanceMetric.html
@@ -111,16 +167,19 @@ def haversine_distance(first_point, second_point):
     # /dist_metrics.pyx#L992-L1000
     p1 = np.radians(first_point)
     p2 = np.radians(second_point)
-    sin0 = np.sin(0.5 * (p1[0] - p2[0]))
-    sin1 = np.sin(0.5 * (p1[1] - p2[1]))
+    sin0 = np.sin(0.5 * (p1[..., 0] - p2[..., 0]))
+    sin1 = np.sin(0.5 * (p1[..., 1] - p2[..., 1]))
     return 2 * 6371010 * np.arcsin(np.sqrt(
-        sin0 * sin0 + np.cos(p1[0]) * np.cos(p2[0]) * sin1 * sin1
+        sin0 * sin0 + np.cos(p1[..., 0]) * np.cos(p2[..., 0]) * sin1 * sin1
     ))
 
 def euclidean_distance(first_point, second_point):
-    """Calculate the Euclidean distance between two points."""
+    """
+    Calculate the Euclidean distance between two points
+    (or between the rows of two arrays of points).
+    """
     # http://stackoverflow.com/a/1401828
-    return np.linalg.norm((first_point, second_point))
+    return np.linalg.norm((first_point, second_point), axis=(0, -1))
 
 def get_euclidean_dist(point, coords):
     return np.sqrt(np.sum((coords - point) ** 2, axis=1))
@@ -0,0 +1,88 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from networker.classes.coord_array import CoordArray
+from networker.classes.geograph import GeoGraph
+
+
+def test_coord_array():
+    coords = {'a': (0, 1), 3: [2., 3.], 'b': np.array([4, 5])}
+    coord_array = CoordArray(coords)
+    assert coord_array == coords
+    assert list(coord_array) == ['a', 3, 'b']
+    assert coord_array.array.dtype == np.float64
+    assert np.array_equal(coord_array.array, [[0, 1], [2, 3], [4, 5]])
+    assert np.array_equal(coord_array.take(['b', 'a']), [[4, 5], [0, 1]])
+
+    # insert past the initial capacity
+    for i in range(40):
+        coord_array[i + 10] = (i, -i)
+    assert len(coord_array) == 43
+    assert np.array_equal(coord_array[49], [39, -39])
+    assert np.array_equal(coord_array.array[3:], [
+        (i, -i) for i in range(40)])
+
+    del coord_array[3]
+    assert 3 not in coord_array
+    assert np.array_equal(coord_array.array[:2], [[0, 1], [4, 5]])
+    with pytest.raises(KeyError):
+        coord_array[3]
+
+    assert CoordArray(np.array([[1, 2], [3, 4]])) == {0: [1, 2], 1: [3, 4]}
+    assert len(CoordArray()) == 0
+
+
+def test_coord_array_copy_on_write():
+    coord_array = CoordArray({0: [0, 0], 1: [1, 1], 2: [2, 2]})
+    subset = coord_array.subset([2, 0])
+    relabeled = coord_array.relabel({0: 'x'})
+    copied = coord_array.copy()
+    # no copies until written
+    for other in (subset, relabeled, copied):
+        assert np.shares_memory(other._array, coord_array._array)
+    assert np.shares_memory(copied.array, coord_array.array)
+    assert list(subset) == [2, 0]
+    assert np.array_equal(subset.array, [[2, 2], [0, 0]])
+    assert list(relabeled) == ['x', 1, 2]
+    assert list(coord_array.relabel(lambda n: n + 1)) == [1, 2, 3]
+
+    subset[0] = [5, 5]
+    relabeled[3] = [3, 3]
+    assert coord_array == {0: [0, 0], 1: [1, 1], 2: [2, 2]}
+    assert copied == coord_array
+    coord_array[1] = [7, 7]
+    assert subset == {2: [2, 2], 0: [5, 5]}
+    assert relabeled == {'x': [0, 0], 1: [1, 1], 2: [2, 2], 3: [3, 3]}
+    assert copied == {0: [0, 0], 1: [1, 1], 2: [2, 2]}
+
+
+def test_coord_array_items_are_copies():
+    coord_array = CoordArray({0: [0, 0], 1: [1, 1]})
+    # the same whether or not the array is shared
+    for other in (coord_array, coord_array.copy(), coord_array.subset([1]),
+                  coord_array.relabel({0: 'x'})):
+        coord = other[1]
+        coord[0] = 9
+        assert np.array_equal(other[1], [1, 1])
+        other[1] = [2, 2]
+        assert np.array_equal(coord, [9, 1])
+    assert coord_array == {0: [0, 0], 1: [2, 2]}
+
+
+def test_geograph_coords():
+    graph = nx.Graph([(0, 1), (1, 2)])
+    geo_graph = GeoGraph(coords={0: [0, 0], 1: [1, 0], 2: [1, 1], 3: [0, 1]},
+                         data=graph)
+    assert isinstance(geo_graph.coords, CoordArray)
+    assert geo_graph.is_aligned()
+
+    geo_graph.coords = {node: [node, node] for node in range(4)}
+    assert isinstance(geo_graph.coords, CoordArray)
+    assert np.array_equal(geo_graph.coords.array[:, 0], range(4))
+
+    subgraph = geo_graph.subgraph([1, 2])
+    assert sorted(subgraph.edges()) == [(1, 2)]
+    assert subgraph.srs == geo_graph.srs
+    assert subgraph.coords == {1: [1, 1], 2: [2, 2]}
+    assert np.shares_memory(subgraph.coords._array, geo_graph.coords._array)
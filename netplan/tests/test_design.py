@@ -0,0 +1,369 @@
+import csv
+import gzip
+import pytest
+import random
+
+from design import (
+    CMST, CMSTCache, CMSTVectorized, ClusterMerger, MergeCandidates, Node,
+    NodeArrays, OutOfRangeError, buildAssocDict, from_latlon,
+    from_latlon_array, buildMVTree, generateDictsFromShp,
+    generateSegmentArrays, generateSegments, getTileKeys, iterLanChunks,
+    maxTempInClusterDist, primsAlg, read_lan, readModelOutput, run, tlnd,
+    tlndTiled, tlndTiledFromLan, to_latlon, to_latlon_array)
+
+
+def make_centers(seed, count=60):
+    r = random.Random(seed)
+    centers = {}
+    for ID in range(1, count + 1):
+        x = round(500000 + r.gauss(0, 800), 2)
+        y = round(9800000 + r.gauss(0, 800), 2)
+        centers[ID] = Node(ID, x, y, 1)
+    return centers
+
+
+def make_points(seed, village_count=2, structure_count=20):
+    r = random.Random(seed)
+    xs, ys = [], []
+    for village_index in range(village_count):
+        cx = 500000 + r.uniform(-2000, 2000)
+        cy = 9800000 + r.uniform(-2000, 2000)
+        for structure_index in range(structure_count):
+            xs.append(round(cx + r.gauss(0, 400), 2))
+            ys.append(round(cy + r.gauss(0, 400), 2))
+    return xs, ys
+
+
+def test_generate_segment_arrays():
+    centers = make_centers(4)
+    nodes = list(centers.values())
+    expected_segments = generateSegments(centers, 1000)
+    segments = generateSegmentArrays(
+        NodeArrays.fromNodes(nodes), 1000, chunkSize=7).getSegs(nodes)
+    assert [seg.getNodes() for seg in segments] == [
+        seg.getNodes() for seg in expected_segments]
+    assert [seg.getID() for seg in segments] == [
+        seg.getID() for seg in expected_segments]
+    assert [seg.getWeight() for seg in segments] == pytest.approx([
+        seg.getWeight() for seg in expected_segments])
+
+
+def test_build_mv_tree():
+    centers = make_centers(5, count=20)
+    assert buildMVTree(centers, 100000, 0).getTotalEdgeWeight() == 0
+    centers[0] = Node(0, 500000, 9800000, 1)
+    segments = generateSegments(centers, 100000)
+    expected_tree = primsAlg(
+        segments, len(centers), 0, buildAssocDict(segments))
+    tree = buildMVTree(centers, 100000, 0)
+    assert tree.getTotalEdgeWeight() == pytest.approx(
+        expected_tree.getTotalEdgeWeight())
+    assert tree.numNodes() == expected_tree.numNodes() == len(centers)
+
+
+def test_merge_candidates_match_sorted_segments():
+    centers = make_centers(0)
+    segments = sorted(generateSegments(centers, 100000), key=lambda seg: (
+        seg.getWeight(), seg.getNode1().getID(), seg.getNode2().getID()))
+    expected_packs = [(
+        seg.getNode1().getID(), seg.getNode2().getID(), seg.getWeight(),
+    ) for seg in segments if seg.getWeight() <= 1500]
+    candidates = MergeCandidates(centers, 100000, 1500)
+    assert [(
+        seg.getNode1().getID(), seg.getNode2().getID(), seg.getWeight(),
+    ) for seg in candidates.popSegments()] == expected_packs
+
+
+def test_merge_candidates_replace_merged_segments():
+    centers = make_centers(1)
+    candidates = MergeCandidates(centers, 100000, 1500)
+    centers[3].setXY(500000, 9800000)
+    centers[3].setWeight(2)
+    del centers[7]
+    candidates.merge(3, 7)
+    expected_packs = sorted((
+        seg.getWeight(), seg.getNode1().getID(), seg.getNode2().getID(),
+    ) for seg in generateSegments(centers, 1500))
+    assert [(
+        seg.getWeight(), seg.getNode1().getID(), seg.getNode2().getID(),
+    ) for seg in candidates.popSegments()] == expected_packs
+
+
+def test_cluster_merger_matches_full_scan():
+    x, y = make_points(2, village_count=3, structure_count=30)
+    nodesByClusterID, clusterByNode, _, centers, _, _ = generateDictsFromShp(
+        x, y)
+    merger = ClusterMerger(
+        centers, nodesByClusterID, clusterByNode, 100000, 750)
+    while True:
+        # Scan every segment as run did before keeping candidates in a heap
+        expected_seg = None
+        for seg in sorted(generateSegments(centers, 100000)):
+            maxDist, _, _ = maxTempInClusterDist(
+                seg, clusterByNode, nodesByClusterID)
+            if maxDist <= 750:
+                expected_seg = seg
+                break
+        seg, _, maxDist, tempCenterX, tempCenterY = merger.findMerge()
+        if expected_seg is None:
+            assert seg is None
+            break
+        assert seg.getNodes() == expected_seg.getNodes()
+        merger.merge(seg, tempCenterX, tempCenterY, maxDist)
+
+
+def test_merge_log():
+    x, y = make_points(3, village_count=3, structure_count=20)
+    nodesByClusterID, clusterByNode, _, centers, _, _ = generateDictsFromShp(
+        x, y)
+
+    def get_state():
+        return [(ID, center.getX(), center.getY(), center.getWeight(), [
+            node.getID() for node in nodesByClusterID[ID]
+        ]) for ID, center in centers.items()], list(nodesByClusterID), {
+            node.getID(): ID for node, ID in clusterByNode.items()}
+
+    merger = ClusterMerger(
+        centers, nodesByClusterID, clusterByNode, 100000, 750)
+    states = [get_state()]
+    while True:
+        seg, _, maxDist, tempCenterX, tempCenterY = merger.findMerge()
+        if seg is None:
+            break
+        merger.merge(seg, tempCenterX, tempCenterY, maxDist)
+        states.append(get_state())
+    merge_log = merger.mergeLog
+    assert len(merge_log) == len(states) - 1 > 2
+    merge_log.rollBack(2)
+    assert get_state() == states[2]
+    merge_log.rollBack(0)
+    assert get_state() == states[0]
+    merge_log.replay(len(merge_log))
+    assert get_state() == states[-1]
+
+
+def test_run(tmpdir):
+    x, y = make_points(0)
+    nodesByClusterID, clusterByNode, _, centers, LVCostDict, _ = \
+        generateDictsFromShp(x, y)
+    totalCost, _, centers, nodesByClusterID, _ = run(
+        centers, nodesByClusterID, clusterByNode, LVCostDict, 100000,
+        25, 10, 2000, 750, 1000, str(tmpdir), str(tmpdir.join('log.txt')))
+    assert abs(totalCost - 68737.28332837918) < 1e-6
+    assert sorted(min(
+        node.getID() for node in nodes
+    ) for nodes in nodesByClusterID.values()) == [
+        1, 2, 3, 5, 6, 7, 8, 9, 15, 19, 20, 21, 22, 23, 24, 25, 26, 28, 30,
+        31, 34, 36, 37, 38]
+    assert len(centers) == 24
+
+
+@pytest.mark.parametrize('seed, household_count, spread', [
+    (0, 1, 100),
+    (1, 2, 100),
+    (2, 30, 50),
+    (3, 40, 300),
+    (4, 40, 700),
+])
+def test_cmst_vectorized(seed, household_count, spread):
+    r = random.Random(seed)
+    households = [Node(
+        index + 1,
+        500000 + r.gauss(0, spread),
+        9800000 + r.gauss(0, spread),
+        1) for index in range(household_count)]
+    root = Node(1, 500000, 9800000, household_count)
+    expected_segments, expected_cost = CMST(households, 1000, root)
+    segments, cost = CMSTVectorized(households, 1000, root)
+    assert list(segments) == list(expected_segments)
+    for key, seg in segments.items():
+        expected_seg = expected_segments[key]
+        assert seg.getID() == expected_seg.getID()
+        assert seg.getNodes() == expected_seg.getNodes()
+        assert seg.getWeight() == pytest.approx(expected_seg.getWeight())
+    assert cost == pytest.approx(expected_cost)
+
+
+def test_cmst_cache():
+    r = random.Random(0)
+    households = [Node(
+        index + 1, 500000 + r.gauss(0, 100), 9800000 + r.gauss(0, 100), 1,
+    ) for index in range(10)]
+    root = Node(1, 500000, 9800000, 10)
+    cache = CMSTCache(maxSize=1)
+    result = cache.solve(households, 1000, root)
+    assert cache.solve(list(reversed(households)), 1000, root) is result
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.solve(households, 500, root)
+    cache.solve(households, 1000, root)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def write_lan(path, x, y):
+    with gzip.open(str(path), 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'x', 'y'])
+        writer.writerows(zip(range(len(x)), x, y))
+
+
+def test_iter_lan_chunks(tmpdir):
+    x, y = make_points(7)
+    path = tmpdir.join('structures.csv.gz')
+    write_lan(path, x, y)
+    chunks = list(iterLanChunks(str(path), chunkSize=15))
+    assert [len(xs) for xs, _ in chunks] == [15, 15, 10]
+    assert chunks[0][0].dtype == 'float64'
+    assert read_lan(str(path)) == (x, y)
+    bbox = 499500, 9799500, 500500, 9800500
+    assert read_lan(str(path), bbox) == tuple(map(list, zip(*[
+        (xx, yy) for xx, yy in zip(x, y)
+        if bbox[0] <= xx <= bbox[2] and bbox[1] <= yy <= bbox[3]])))
+
+
+def test_tlnd_model_output(tmpdir):
+    x, y = make_points(0)
+    tlnd(str(tmpdir), x, y, 36, 'S')
+    text = tmpdir.join('modelOutput.txt').read()
+    assert not text.endswith('\n')
+    value_by_label = readModelOutput(str(tmpdir.join('modelOutput.txt')))
+    assert value_by_label['NumStructures'] == len(x)
+    assert value_by_label['Total Cost'] == pytest.approx(
+        value_by_label['Total LV Cost'] + value_by_label['Total MV Cost'] +
+        value_by_label['Transformer Cost'])
+
+    # Transformers are placed in the zone of the structures
+    with tmpdir.join('transformers.csv').open() as f:
+        longitudes = [float(row['longitude']) for row in csv.DictReader(f)]
+    assert all(32 < longitude < 34 for longitude in longitudes)
+    tlnd(str(tmpdir.mkdir('35S')), x, y, 35, 'S')
+    with tmpdir.join('35S', 'transformers.csv').open() as f:
+        longitudes = [float(row['longitude']) for row in csv.DictReader(f)]
+    assert all(26 < longitude < 28 for longitude in longitudes)
+
+
+def test_get_tile_keys_by_h3_needs_zone():
+    with pytest.raises(ValueError):
+        getTileKeys([500000], [9800000], h3Resolution=7)
+
+
+@pytest.mark.parametrize('worker_count', [1, 2])
+def test_tlnd_tiled(tmpdir, worker_count):
+    x, y = make_points(6, village_count=3, structure_count=10)
+    tile_keys = sorted(set(getTileKeys(x, y, tileSize=2000)))
+    value_by_label = tlndTiled(
+        str(tmpdir), x, y, 36, 'S', tileSize=2000,
+        workerCount=worker_count)
+    assert value_by_label['Tiles'] == len(tile_keys)
+    assert value_by_label['NumStructures'] == len(x)
+    assert sorted(tmpdir.join('manifest.txt').read().split()) == tile_keys
+    with tmpdir.join('transformers.csv').open() as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == value_by_label['Num Transformers']
+    assert sorted(set(row['tile'] for row in rows)) == tile_keys
+    assert sum(int(row['customers']) for row in rows) == len(x)
+
+    # Resume with the tile that is missing from the manifest
+    transformers_text = tmpdir.join('transformers.csv').read()
+    tmpdir.join('tiles', tile_keys[-1]).remove()
+    tmpdir.join('manifest.txt').write('\n'.join(tile_keys[:-1]) + '\n')
+    mtime = tmpdir.join('tiles', tile_keys[0], 'transformers.csv').mtime()
+    # The structures of finished tiles are not spilled again
+    tmpdir.join('tiles', tile_keys[0], 'structures.csv.gz').write('finished')
+    tlndTiled(
+        str(tmpdir), x, y, 36, 'S', tileSize=2000, workerCount=worker_count)
+    assert tmpdir.join('transformers.csv').read() == transformers_text
+    assert tmpdir.join('manifest.txt').read().split() == tile_keys
+    assert tmpdir.join(
+        'tiles', tile_keys[0], 'transformers.csv').mtime() == mtime
+    assert tmpdir.join(
+        'tiles', tile_keys[0], 'structures.csv.gz').read() == 'finished'
+
+    # Resume a tile whose worker died while writing its outputs
+    tile_dir = tmpdir.join('tiles', tile_keys[-1])
+    tile_transformers_text = tile_dir.join('transformers.csv').read()
+    tile_dir.join('transformers.csv').write(
+        tile_transformers_text[:len(tile_transformers_text) // 2])
+    tile_dir.join('modelOutput.txt').remove()
+    tmpdir.join('manifest.txt').write('\n'.join(tile_keys[:-1]) + '\n')
+    tlndTiled(
+        str(tmpdir), x, y, 36, 'S', tileSize=2000, workerCount=worker_count)
+    assert tmpdir.join('transformers.csv').read() == transformers_text
+    assert tile_dir.join('transformers.csv').read() == tile_transformers_text
+    assert not tile_dir.listdir(lambda path: path.ext == '.tmp')
+
+
+def test_tlnd_tiled_from_lan(tmpdir):
+    x, y = make_points(6, village_count=3, structure_count=10)
+    path = tmpdir.join('structures.csv.gz')
+    write_lan(path, x, y)
+    tlndTiled(
+        str(tmpdir.join('a')), x, y, 36, 'S', tileSize=2000, workerCount=1)
+    value_by_label = tlndTiledFromLan(
+        str(tmpdir.join('b')), str(path), 36, 'S', chunkSize=7, tileSize=2000,
+        workerCount=1)
+    assert value_by_label['NumStructures'] == len(x)
+    assert tmpdir.join('b', 'transformers.csv').read() == tmpdir.join(
+        'a', 'transformers.csv').read()
+
+
+def test_from_latlon_array():
+    r = random.Random(8)
+    latitudes = [r.uniform(0.5, 3.5) for index in range(50)]
+    longitudes = [r.uniform(31, 35) for index in range(50)]
+    eastings, northings, zone_number, zone_letter = from_latlon_array(
+        latitudes, longitudes, chunk_size=7)
+    assert (zone_number, zone_letter) == (36, 'N')
+    for easting, northing, latitude, longitude in zip(
+            eastings, northings, latitudes, longitudes):
+        expected_pack = from_latlon(latitude, longitude, 36, 'N')
+        assert (easting, northing) == pytest.approx(expected_pack[:2])
+
+    # Use one zone and hemisphere for points across the equator
+    eastings, northings, zone_number, zone_letter = from_latlon_array(
+        [-1, 2], [32, 33])
+    assert (zone_number, zone_letter) == (36, 'N')
+    assert northings[0] < 0 < northings[1]
+    with pytest.raises(OutOfRangeError):
+        from_latlon_array([90], [33])
+
+
+@pytest.mark.parametrize('latitudes', [[-1, 0.5, 1], [-1, -0.5, 1]])
+def test_latlon_array_round_trip(latitudes):
+    longitudes = [31, 33, 35]
+    eastings, northings, zone_number, zone_letter = from_latlon_array(
+        latitudes, longitudes)
+    with pytest.raises(OutOfRangeError):
+        to_latlon_array(eastings, northings, zone_number, zone_letter)
+    round_trip = to_latlon_array(
+        eastings, northings, zone_number, zone_letter, strict=False)
+    assert round_trip[0] == pytest.approx(latitudes)
+    assert round_trip[1] == pytest.approx(longitudes)
+
+
+def test_tlnd_across_equator(tmpdir):
+    r = random.Random(2)
+    latitudes = [r.uniform(-0.02, 0.02) for index in range(40)]
+    longitudes = [r.uniform(32.98, 33.02) for index in range(40)]
+    x, y, zone_number, zone_letter = from_latlon_array(latitudes, longitudes)
+    assert min(y) < 0
+    output = tlnd(str(tmpdir), x.tolist(), y.tolist(), zone_number,
+                  zone_letter)
+    assert min(output['latitude']) < 0 < max(output['latitude'])
+
+
+def test_to_latlon_array():
+    r = random.Random(9)
+    eastings = [r.uniform(300000, 700000) for index in range(50)]
+    northings = [r.uniform(100000, 300000) for index in range(50)]
+    latitudes, longitudes = to_latlon_array(
+        eastings, northings, 36, 'N', chunk_size=7)
+    for latitude, longitude, easting, northing in zip(
+            latitudes, longitudes, eastings, northings):
+        expected_pair = to_latlon(easting, northing, 36, 'N')
+        assert (latitude, longitude) == pytest.approx(expected_pair)
+    with pytest.raises(OutOfRangeError):
+        to_latlon_array([50000], [100000], 36, 'N')
+    latitudes, longitudes = to_latlon_array(
+        [50000], [100000], 36, 'N', strict=False)
+    assert (latitudes[0], longitudes[0]) == pytest.approx(to_latlon(
+        50000, 100000, 36, 'N', strict=False))
@@ -0,0 +1,62 @@
+import csv
+import re
+from os.path import abspath, dirname, join
+
+import networkx as nx
+import numpy as np
+
+from networker.classes.geograph import GeoGraph
+
+
+DATASETS_FOLDER = join(dirname(dirname(abspath(__file__))), 'datasets')
+
+
+def load_grid():
+    node_by_coord = {}
+    graph = nx.Graph()
+    with open(join(DATASETS_FOLDER, 'leona-selected-grid-mv-lines.csv')) as f:
+        for row in csv.DictReader(f):
+            coords = [tuple(float(x) for x in pair.split()) for pair in
+                      re.findall(r'[-\d.]+ [-\d.]+', row['WKT'])]
+            for coord1, coord2 in zip(coords, coords[1:]):
+                graph.add_edge(*[node_by_coord.setdefault(
+                    coord, len(node_by_coord)) for coord in (coord1, coord2)])
+    return GeoGraph('+proj=longlat +datum=WGS84', {
+        node: np.array(coord) for coord, node in node_by_coord.items()
+    }, data=graph)
+
+
+def load_demand_coords():
+    with open(join(DATASETS_FOLDER, 'leona-selected-demand-points.csv')) as f:
+        return np.array([(float(row['Longitude']), float(row['Latitude']))
+                         for row in csv.DictReader(f)])
+
+
+def test_find_nearest_edges():
+    grid = load_grid()
+    coords = load_demand_coords()
+    random_state = np.random.RandomState(0)
+    coords = np.concatenate([coords, coords.min(axis=0) + random_state.rand(
+        1000, 2) * (coords.max(axis=0) - coords.min(axis=0) + 0.5)])
+    rtree_index = grid.get_rtree_index()
+    edges, projections = grid.find_nearest_edges(
+        coords, rtree_index=rtree_index)
+    for coord, edge, projection in zip(coords, edges, projections):
+        expected_edge, expected_projection = grid.find_nearest_edge(
+            coord, rtree_index=rtree_index)
+        assert edge == expected_edge
+        assert list(projection) == list(expected_projection)
+
+
+def test_project_onto():
+    grid = load_grid()
+    coords = load_demand_coords()
+    demand_nodes = GeoGraph(grid.srs, {
+        node: coord for node, coord in enumerate(coords, len(grid))})
+    demand_nodes.add_nodes_from(demand_nodes.coords)
+    projected = grid.project_onto(demand_nodes)
+    for node, coord in demand_nodes.coords.items():
+        fake_node = max(demand_nodes.nodes()) + node - len(grid) + 1
+        edge, projection = grid.find_nearest_edge(coord)
+        assert set(projected.neighbors(fake_node)) == set(edge) | {node}
+        assert list(projected.coords[fake_node]) == list(projection)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from networker.classes.segment_index import SegmentIndex
+from networker.geomath import segments_intersect, \
+                              segments_share_endpoint, \
+                              segments_intersect_masks, \
+                              line_segment_intersections, \
+                              line_segment_intersections_batch
+
+
+def get_grid_segments(random_state, count):
+    # small integer coords so that collinear, parallel and shared endpoint
+    # segments are common
+    return random_state.randint(0, 4, size=(count, 2, 2)).astype(float)
+
+
+def test_segments_intersect_masks():
+    random_state = np.random.RandomState(1)
+    segments = get_grid_segments(random_state, 200)
+    for p1, p2 in get_grid_segments(random_state, 50):
+        intersect_mask, share_mask = segments_intersect_masks(
+            p1, p2, segments[:, 0], segments[:, 1])
+        for (p3, p4), intersect, share in zip(segments, intersect_mask,
+                                              share_mask):
+            assert intersect == segments_intersect(p1, p2, p3, p4)
+            assert share == segments_share_endpoint(p1, p2, p3, p4)
+
+
+def test_line_segment_intersections_batch():
+    random_state = np.random.RandomState(2)
+    segments = get_grid_segments(random_state, 100)
+    segment_index = SegmentIndex(range(len(segments)), segments)
+    queries = get_grid_segments(random_state, 60)
+    batch_ids = line_segment_intersections_batch(
+        segment_index, queries[:, 0], queries[:, 1])
+    assert len(batch_ids) == len(queries)
+    for (p1, p2), ids in zip(queries, batch_ids):
+        expected = [i for i, (p3, p4) in enumerate(segments)
+                    if segments_intersect(p1, p2, p3, p4) and
+                    not segments_share_endpoint(p1, p2, p3, p4)]
+        assert sorted(ids.tolist()) == expected
+        assert sorted(line_segment_intersections(
+            segment_index, p1, p2).tolist()) == expected
+
+    assert line_segment_intersections_batch(
+        segment_index, np.zeros((0, 2)), np.zeros((0, 2))) == []
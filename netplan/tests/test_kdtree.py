@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from networker.classes.kdtree import KDTree
+
+
+def get_square_distances(data, point):
+    return ((data - point) ** 2).sum(axis=1)
+
+
+@pytest.mark.parametrize('point_count, dimension_count', [
+    (1, 2),
+    (2, 2),
+    (7, 2),
+    (500, 2),
+    (300, 3),
+])
+def test_kdtree(point_count, dimension_count):
+    random_state = np.random.RandomState(point_count)
+    data = random_state.rand(point_count, dimension_count)
+    kdtree = KDTree(data)
+    for point in random_state.rand(20, dimension_count):
+        square_distances = get_square_distances(data, point)
+        index, node = kdtree.query(point)
+        assert square_distances[index] == square_distances.min()
+        assert list(node) == list(data[index])
+
+        subset = random_state.choice(
+            point_count, max(1, point_count // 3), replace=False)
+        index, _ = kdtree.query_subset(point, subset)
+        assert index in subset
+        assert square_distances[index] == square_distances[subset].min()
+
+        assert sorted(index for index, _ in kdtree.query_radius(
+            point, 0.2)) == np.flatnonzero(square_distances <= 0.04).tolist()
+
+
+def test_kdtree_with_index():
+    random_state = np.random.RandomState(0)
+    data = random_state.rand(100, 2)
+    index = np.arange(20, 60)
+    kdtree = KDTree(data, index)
+    for point in random_state.rand(10, 2):
+        square_distances = get_square_distances(data[index], point)
+        assert kdtree.query(point)[0] == index[square_distances.argmin()]
+
+
+def test_kdtree_active():
+    random_state = np.random.RandomState(1)
+    data = random_state.rand(200, 2)
+    kdtree = KDTree(data)
+    inactive = random_state.choice(200, 150, replace=False)
+    kdtree.set_active(inactive, False)
+    active = np.setdiff1d(np.arange(200), inactive)
+    for point in random_state.rand(10, 2):
+        square_distances = get_square_distances(data, point)
+        index, _ = kdtree.query_active(point)
+        assert square_distances[index] == square_distances[active].min()
+    kdtree.set_active(inactive, False)
+    kdtree.set_active(active, False)
+    assert kdtree.query_active(data[0]) is None
+    kdtree.reset_active([5])
+    assert kdtree.query_active(data[0])[0] == 5
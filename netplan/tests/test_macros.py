@@ -1,6 +1,16 @@
+import json
 import pytest
-from infrastructure_planning.macros import interpolate_values
-from pandas import DataFrame
+from infrastructure_planning.demography import estimate_population_profile
+from infrastructure_planning.demography.exponential import estimate_population
+from infrastructure_planning.electricity.consumption import (
+    estimate_consumption_profile)
+from infrastructure_planning.electricity.consumption.linear import (
+    estimate_consumption_from_connection_type)
+from infrastructure_planning.electricity.demand import estimate_peak_demand
+from infrastructure_planning.macros import (
+    interpolate_values, load_and_run, run, run_columnar)
+from pandas import DataFrame, Series
+from pandas.testing import assert_series_equal
 
 
 SOURCE_TABLE = DataFrame([
@@ -22,3 +32,74 @@ SOURCE_TABLE = DataFrame([
 ])
 def test_interpolate_values(x, y):
     assert interpolate_values(SOURCE_TABLE, 'x', x)['y'] == y
+
+
+def test_load_and_run_saves_arguments(tmpdir, monkeypatch):
+    monkeypatch.setattr(
+        'infrastructure_planning.macros.load_files', lambda g: dict(
+            g, demand_point_table=DataFrame([
+                ('a', 0, 0)], columns=['name', 'latitude', 'longitude'])))
+
+    def get_arguments_text(columnar):
+        target_folder = tmpdir.join(str(columnar))
+        load_and_run([], [], {
+            'configuration_path': None,
+            'source_folder': None,
+            'target_folder': str(target_folder),
+            'columnar': columnar,
+            'financing_year': 2016,
+        }, ['columnar', 'financing_year'])
+        return target_folder.join('arguments', 'arguments.json').read()
+
+    assert json.loads(get_arguments_text(False)) == {'financing_year': 2016}
+    assert get_arguments_text(True) == get_arguments_text(False)
+
+
+def test_run_columnar():
+    main_functions = [
+        estimate_population,
+        estimate_population_profile,
+        estimate_consumption_from_connection_type,
+        estimate_consumption_profile,
+        estimate_peak_demand,
+    ]
+
+    def get_arguments():
+        return {
+            'demand_point_table': DataFrame([
+                ('a', 0, 0, 100, 2010, float('nan'), float('nan')),
+                ('b', 1, 1, 2000, 2012, 3, float('nan')),
+                ('c', 2, 2, 30000, 2014, float('nan'), 5000),
+                ('d', 3, 3, 400000, 2016, float('nan'), 2),
+            ], columns=[
+                'name', 'latitude', 'longitude', 'population',
+                'population_year', 'school_connection_count',
+                'final_population',
+            ]),
+            'connection_type_table': DataFrame([
+                ('household', 600),
+                ('school', 1200),
+            ], columns=['connection_type', 'consumption_in_kwh_per_year']),
+            'population_growth_as_percent_of_population_per_year': 3,
+            'financing_year': 2016,
+            'time_horizon_in_years': 10,
+            'number_of_people_per_household': 5,
+            'discount_rate_as_percent_of_cash_flow_per_year': 7,
+            'consumption_during_peak_hours_as_percent_of_total_consumption': 40,  # noqa
+            'peak_hours_of_consumption_per_year': 1460,
+        }
+
+    g1 = run(main_functions, get_arguments())
+    g2 = run_columnar(main_functions, get_arguments())
+    node_d2_by_id = dict(g2['infrastructure_graph'].cycle_nodes())
+    for node_id, node_d1 in g1['infrastructure_graph'].cycle_nodes():
+        node_d2 = node_d2_by_id[node_id]
+        assert sorted(node_d1) == sorted(node_d2)
+        for key, value1 in node_d1.items():
+            value2 = node_d2[key]
+            if isinstance(value1, Series):
+                assert_series_equal(value1, value2, check_dtype=False)
+            elif isinstance(value1, str):
+                assert value1 == value2
+            else:
+                assert value1 == pytest.approx(value2, nan_ok=True)
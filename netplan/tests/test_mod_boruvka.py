@@ -0,0 +1,58 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial.distance import cdist
+
+from networker.algorithms.mod_boruvka import mod_boruvka
+from networker.classes.geograph import GeoGraph
+
+
+def get_geograph(coords, budgets):
+    graph = nx.Graph()
+    for node, budget in enumerate(budgets):
+        graph.add_node(node, budget=budget)
+    return GeoGraph('+proj=utm +zone=36 +south', coords, data=graph)
+
+
+def get_edges(graph):
+    return sorted(tuple(sorted(edge)) for edge in graph.edges())
+
+
+@pytest.mark.parametrize('point_count', [2, 10, 200])
+def test_mod_boruvka_matches_minimum_spanning_tree(point_count):
+    random_state = np.random.RandomState(point_count)
+    coords = random_state.rand(point_count, 2) * 1000
+    forest = mod_boruvka(get_geograph(coords, [1e9] * point_count))
+    tree = minimum_spanning_tree(cdist(coords, coords)).tocoo()
+    assert get_edges(forest) == sorted(
+        tuple(sorted(edge)) for edge in zip(
+            tree.row.tolist(), tree.col.tolist()))
+
+
+def test_mod_boruvka_leaves_dead_nodes():
+    coords = np.array([
+        [0, 0], [10, 0], [20, 0], [30, 0], [1000, 0], [1000, 5]])
+    forest = mod_boruvka(get_geograph(coords, [100, 100, 100, 100, 50, 10]))
+    assert get_edges(forest) == [(0, 1), (1, 2), (2, 3), (4, 5)]
+
+
+def test_mod_boruvka_connects_to_fake_nodes():
+    coords = np.array([[0, 0], [100, 0], [0, 30], [100, 30], [50, 200]])
+    forest = mod_boruvka(get_geograph(coords, [
+        np.inf, np.inf, 40, 40, 10]))
+    assert get_edges(forest) == [(0, 2), (1, 3)]
+
+
+def test_mod_boruvka_uses_coords_by_node():
+    # coords inserted out of node order (as in merged graphs)
+    random_state = np.random.RandomState(0)
+    coords = random_state.rand(50, 2) * 1000
+    order = random_state.permutation(50)
+    geo_graph = get_geograph({i: coords[i] for i in order}, [1e9] * 50)
+    forest = mod_boruvka(geo_graph)
+    tree = minimum_spanning_tree(cdist(coords, coords)).tocoo()
+    assert get_edges(forest) == sorted(
+        tuple(sorted(edge)) for edge in zip(
+            tree.row.tolist(), tree.col.tolist()))
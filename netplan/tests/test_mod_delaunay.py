@@ -0,0 +1,123 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial.distance import cdist
+
+from networker.algorithms.mod_delaunay import get_candidate_edges, \
+    mod_delaunay
+from networker.algorithms.mod_kruskal import mod_kruskal
+from networker.classes.geograph import GeoGraph
+from networker.classes.segment_index import SegmentIndex
+from networker.classes.unionfind import UnionFind
+from networker.geomath import spherical_distance_haversine
+from networker.networker_runner import build_network
+
+
+SRS = '+proj=utm +zone=36 +south'
+
+
+def get_geograph(coords, budgets):
+    graph = nx.Graph()
+    for node, budget in enumerate(budgets):
+        graph.add_node(node, budget=budget)
+    return GeoGraph(SRS, {
+        node: coord for node, coord in enumerate(coords)}, data=graph)
+
+
+def get_edges(graph):
+    return sorted(tuple(sorted(edge)) for edge in graph.edges())
+
+
+def get_tree_length(distances, edges=None):
+    if edges is None:
+        edges = np.column_stack(np.triu_indices(len(distances), 1))
+    rows, columns = edges.T
+    # zero distances are missing edges to minimum_spanning_tree
+    graph = coo_matrix((distances[rows, columns] + 1e-9, (rows, columns)),
+                       shape=distances.shape)
+    return minimum_spanning_tree(graph).sum()
+
+
+@pytest.mark.parametrize('coords', [
+    np.random.RandomState(0).rand(300, 2),
+    np.array([[0, 0], [1, 1]]),
+    np.array([[0, 0], [1, 1], [3, 3], [4, 4]]),
+    np.array([[0, 0], [0, 0], [1, 0], [0, 1], [1, 1]]),
+])
+def test_get_candidate_edges(coords):
+    distances = cdist(coords, coords)
+    assert get_tree_length(distances, get_candidate_edges(coords)) == \
+        pytest.approx(get_tree_length(distances))
+
+
+def test_get_candidate_edges_geographic():
+    random_state = np.random.RandomState(1)
+    coords = np.column_stack([
+        random_state.uniform(30, 40, 200), random_state.uniform(-5, 5, 200)])
+    pairs = np.array([[a, b] for a in coords for b in coords])
+    distances = spherical_distance_haversine(pairs).reshape(200, 200)
+    edges = get_candidate_edges(coords, is_geographic=True)
+    assert get_tree_length(distances, edges) == \
+        pytest.approx(get_tree_length(distances))
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('budget_scale', [1e9, 200])
+def test_mod_delaunay_matches_mod_kruskal(seed, budget_scale):
+    random_state = np.random.RandomState(seed)
+    point_count = 10 + seed * 10
+    coords = random_state.rand(point_count, 2) * 1000
+    budgets = random_state.rand(point_count) * budget_scale
+    expected = mod_kruskal(
+        get_geograph(coords, budgets), UnionFind(), SegmentIndex())
+    assert get_edges(mod_delaunay(get_geograph(coords, budgets))) == \
+        get_edges(expected)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_mod_delaunay_matches_mod_kruskal_with_existing(seed):
+    # projections of nodes onto the same grid vertex are at the same
+    # coords, so compare totals rather than the (tied) edges
+    def get_totals(network_algorithm):
+        random_state = np.random.RandomState(seed)
+        point_count = 20 + seed * 10
+        demand_nodes = get_geograph(
+            random_state.rand(point_count, 2) * 1000,
+            random_state.rand(point_count) * 150)
+        grid_coords = {'grid-%s' % i: coord for i, coord in enumerate(
+            random_state.rand(6, 2) * 1000)}
+        grid = nx.Graph()
+        grid.add_nodes_from(grid_coords, budget=0)
+        grid.add_edges_from([
+            ('grid-0', 'grid-1'), ('grid-1', 'grid-2'),
+            ('grid-3', 'grid-4'), ('grid-4', 'grid-5')])
+        msf = build_network(
+            demand_nodes, existing=GeoGraph(SRS, grid_coords, data=grid),
+            min_node_count=0, network_algorithm=network_algorithm)
+        return len(msf.edges()), sum(np.hypot(
+            *(msf.coords[u] - msf.coords[v])) for u, v in msf.edges())
+
+    edge_count, length = get_totals('mod_kruskal')
+    assert get_totals('mod_delaunay')[0] == edge_count
+    assert get_totals('mod_delaunay')[1] == pytest.approx(length)
+
+
+@pytest.mark.parametrize('network_algorithm', [mod_kruskal, mod_delaunay])
+def test_edge_crossing_grid_joins_its_subgraph(network_algorithm):
+    # the edge between 0 and 1 crosses the grid segment once, which
+    # joins the subgraph of the grid
+    subgraphs = UnionFind()
+    subgraphs.add_component('grid-0', budget=0)
+    subgraphs.add_component('grid-1', budget=0)
+    subgraphs.union('grid-0', 'grid-1', 0)
+    rtree = SegmentIndex()
+    rtree.insert(('grid-0', 'grid-1'), ((50, -100), (50, 100)))
+    forest = network_algorithm(
+        get_geograph([[0, 0], [100, 0]], [1e9, 1e9]), subgraphs, rtree)
+    assert get_edges(forest) == [(0, 1)]
+    assert subgraphs[0] == subgraphs[1] == subgraphs['grid-0']
+    assert sorted(map(str, subgraphs.component_set(0))) == \
+        ['0', '1', 'grid-0', 'grid-1']
@@ -0,0 +1,40 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from networker.classes.geograph import GeoGraph
+from networker.networker_runner import filter_min_node_subnetworks
+
+
+def get_random_forest(seed, node_count=200):
+    random_state = np.random.RandomState(seed)
+    graph = nx.Graph()
+    for node in range(node_count):
+        budget = np.inf if random_state.rand() < 0.02 else 1.
+        graph.add_node(node, budget=budget)
+    # sparse random edges make components of many sizes
+    edges = random_state.randint(0, node_count, size=(node_count // 2, 2))
+    graph.add_edges_from((u, v, {'weight': 1.})
+                         for u, v in edges.tolist() if u != v)
+    coords = {node: random_state.rand(2) for node in graph}
+    return GeoGraph(coords=coords, data=graph)
+
+
+@pytest.mark.parametrize('min_node_count', [0, 2, 3, 5])
+def test_filter_min_node_subnetworks(min_node_count):
+    for seed in range(5):
+        g = get_random_forest(seed)
+        filtered = filter_min_node_subnetworks(g, min_node_count)
+        expected = set()
+        for component in nx.connected_components(g):
+            if len(component) >= min_node_count or any(
+                    g.nodes[node]['budget'] == np.inf
+                    for node in component):
+                expected.update(component)
+        assert list(filtered.nodes()) == [n for n in g if n in expected]
+        assert set(map(frozenset, filtered.edges())) == \
+            set(map(frozenset, g.subgraph(expected).edges()))
+        for node in filtered:
+            assert filtered.nodes[node] == g.nodes[node]
+
+    assert len(filter_min_node_subnetworks(GeoGraph(), 2)) == 0
@@ -0,0 +1,47 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from networker.classes.geograph import GeoGraph
+from networker.classes.segment_index import SegmentIndex
+
+
+def get_box_hits(segments, box):
+    mins, maxs = segments.min(axis=1), segments.max(axis=1)
+    return set(np.flatnonzero(
+        (mins[:, 0] <= box[2]) & (maxs[:, 0] >= box[0]) &
+        (mins[:, 1] <= box[3]) & (maxs[:, 1] >= box[1])).tolist())
+
+
+@pytest.mark.parametrize('segment_count', [0, 1, 500])
+def test_segment_index(segment_count):
+    random_state = np.random.RandomState(segment_count)
+    segments = random_state.rand(segment_count, 2, 2)
+    edges = [(i, -i) for i in range(segment_count)]
+    segment_index = SegmentIndex(edges, segments)
+    for i, segment in enumerate(random_state.rand(40, 2, 2)):
+        segment_id = segment_index.insert(('a', i), segment)
+        assert segment_id == segment_count + i
+        assert segment_index.edges[segment_id] == ('a', i)
+    all_segments = np.concatenate([segments, segment_index.segments[
+        segment_count:]])
+    assert np.array_equal(segment_index.segments, all_segments)
+    assert len(segment_index) == segment_count + 40
+    for corner in random_state.rand(20, 2):
+        box = tuple(corner) + tuple(corner + 0.2)
+        assert set(segment_index.intersection(box).tolist()) == \
+            get_box_hits(all_segments, box)
+
+
+def test_get_rtree_index():
+    coords = {0: [0, 0], 1: [10, 0], 2: [10, 10], 'grid-3': [0, 10]}
+    graph = nx.Graph([(0, 1), (1, 2), (2, 'grid-3')])
+    geo_graph = GeoGraph('+proj=utm +zone=36 +south', coords, data=graph)
+    segment_index = geo_graph.get_rtree_index()
+    for segment_id, (u, v) in enumerate(segment_index.edges):
+        assert segment_index.segments[segment_id].tolist() == [
+            coords[u], coords[v]]
+    edge, coord = geo_graph.find_nearest_edge(
+        np.array([4, 9]), rtree_index=segment_index)
+    assert set(edge) == {2, 'grid-3'}
+    assert list(coord) == [4, 10]
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from networker.classes.unionfind import UnionFind, PriorityQueue, \
+                                        PairingHeap
+
+
+def get_state(subgraphs):
+    objects = list(subgraphs)
+    return dict(
+        parents=list(subgraphs.parents.items()),
+        budget=list(subgraphs.budget.items()),
+        weights=list(subgraphs.weights.items()),
+        children=[(o, subgraphs.children[o]) for o in objects],
+        shared=[(subgraphs.children[o] is subgraphs.children[subgraphs[o]],
+                 subgraphs.queues[o] is subgraphs.queues[subgraphs[o]])
+                for o in objects])
+
+
+@pytest.mark.parametrize('labeled', [False, True])
+def test_add_components(labeled):
+    random_state = np.random.RandomState(0)
+    objects = ['grid-%d' % i for i in range(100)]
+    budgets = (random_state.rand(100) * 10).tolist()
+    labels = np.repeat(np.arange(10), 10) if labeled else None
+    fakes = list(range(30))
+    members = [objects[i] for i in random_state.randint(0, 100, 30)]
+
+    # add and union one at a time
+    expected = UnionFind()
+    groups = {}
+    for o, label in zip(objects, labels if labeled else [0] * 100):
+        groups.setdefault(label, []).append(o)
+    for group in groups.values():
+        budget_by_object = dict(zip(objects, budgets))
+        expected.add_component(group[0], budget=budget_by_object[group[0]])
+        for o in group[1:]:
+            expected.add_component(o, budget=budget_by_object[o])
+            expected.union(group[0], o, 0)
+    for fake, member in zip(fakes, members):
+        expected.add_component(fake, budget=np.inf)
+        expected.union(fake, member, 0)
+
+    subgraphs = UnionFind()
+    subgraphs.add_components(objects, budgets, labels)
+    subgraphs.add_fake_components(fakes, members)
+    assert get_state(subgraphs) == get_state(expected)
+
+    with pytest.raises(Exception):
+        subgraphs.add_fake_components(['fake'], [fakes[0]])
+
+
+def test_pairing_heap_order():
+    # ties pop in the same order as from a PriorityQueue
+    random_state = np.random.RandomState(0)
+    queues = [(PriorityQueue(), PairingHeap()) for i in range(20)]
+    for step in range(2000):
+        i, j = random_state.randint(0, len(queues), 2)
+        action = random_state.randint(0, 4)
+        if action == 0 and i != j:
+            queues[i][0].merge(queues[j][0])
+            queues[i][1].merge(queues[j][1])
+        elif action == 1 and queues[i][0]._queue:
+            assert queues[i][1].top() == queues[i][0].top()
+            assert queues[i][1].pop() == queues[i][0].pop()
+        else:
+            priority = random_state.randint(0, 5)
+            queues[i][0].push(step, priority)
+            queues[i][1].push(step, priority)
+    for queue, heap in queues:
+        assert len(heap) == len(queue._queue)
+        while queue._queue:
+            assert heap.pop() == queue.pop()
+        assert heap.top() is None
+
+
+def test_connected_components():
+    subgraphs = UnionFind()
+    for o in range(10):
+        subgraphs.add_component(o, budget=1)
+    for u, v in [(0, 1), (2, 3), (3, 4), (1, 5)]:
+        subgraphs.union(u, v, 0)
+    components = {subgraphs[o]: subgraphs.component_set(o) for o in range(10)}
+    assert sorted(map(sorted, components.values())) == \
+        [[0, 1, 5], [2, 3, 4], [6], [7], [8], [9]]
+    assert set(subgraphs.connected_components()) == set(components)
+    assert set(subgraphs.connected_components([5, 1, 4])) == \
+        {subgraphs[1], subgraphs[4]}
+    assert subgraphs.budget[subgraphs[2]] == 3